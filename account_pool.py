@@ -0,0 +1,270 @@
+# account_pool.py
+# Pool of authorized Spotify accounts for running several fields from one
+# service. Spotify allows one active device per account, so each game is
+# assigned its own account. Every account has its own token cache,
+# token-bucket rate limiter and HTTP connection pool, while playlist and
+# search results go through one cache shared by all accounts.
+#
+# Each game server is its own process, so the game -> account choice has to
+# come out the same in every one of them without talking to the others: an
+# account can list its games in the accounts file, and any other game is
+# hashed (stably, not with hash()) onto an account.
+#
+#   [{"name": "field1", "games": ["north-1", "north-2"], ...}, {"name": "field2", ...}]
+import copy
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+ACCOUNTS_FILE = "accounts.json"
+SCOPE = "user-modify-playback-state,user-read-playback-state,playlist-read-private"
+RATE = 5.0          # sustained Web API calls per second per account
+BURST = 10          # calls an idle account may make back to back
+POOL_SIZE = 4       # HTTP connections per account
+CACHE_TTL = 300     # seconds playlist and search results stay fresh
+CACHE_ENTRIES = 2000    # responses kept; the least recently used go first
+CACHED_CALLS = ('playlist_tracks', 'search', 'track')
+
+_local = threading.local()
+
+
+@contextmanager
+def fresh(on=True):
+    # Calls this thread makes skip cached responses (and refresh them), e.g.
+    # refetching a playlist whose snapshot_id changed
+    previous = getattr(_local, 'fresh', False)
+    _local.fresh = on
+    try:
+        yield
+    finally:
+        _local.fresh = previous
+
+
+def wants_fresh():
+    return getattr(_local, 'fresh', False)
+
+
+class TokenBucket:
+    def __init__(self, rate=RATE, capacity=BURST, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        # Returns 0 when granted, otherwise the seconds until it would be
+        with self.lock:
+            self._refill(self.clock())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def give_back(self, tokens=1):
+        # Returns tokens taken for a call that didn't go out after all
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + tokens)
+
+    def acquire(self, tokens=1):
+        # Blocks until granted; returns the seconds spent waiting
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return waited
+            self.sleep(wait)
+            waited += wait
+
+
+class ResponseCache:
+    # Every caller gets its own copy of a response, so one that extends a
+    # page's item list doesn't change what the next caller is served
+    def __init__(self, ttl=CACHE_TTL, clock=time.monotonic, max_entries=CACHE_ENTRIES):
+        self.ttl = ttl
+        self.clock = clock
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and self.clock() < entry[0]:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                value = entry[1]
+            else:
+                self.misses += 1
+                return None
+        return copy.deepcopy(value)
+
+    def put(self, key, value, ttl=None):
+        value = copy.deepcopy(value)
+        with self.lock:
+            self.entries[key] = (self.clock() + (ttl or self.ttl), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class AccountClient:
+    # Stands in for a spotipy client: every call is rate limited by the
+    # account's bucket, and catalog calls are answered from the shared cache.
+    # ttls overrides the cache's TTL per call name.
+    def __init__(self, name, sp, bucket, cache, cached_calls=CACHED_CALLS, ttls=None):
+        self.name = name
+        self.sp = sp
+        self.bucket = bucket
+        self.cache = cache
+        self.cached_calls = cached_calls
+        self.ttls = ttls or {}
+        self.calls = 0
+        self.waited = 0.0
+
+    def __getattr__(self, attr):
+        fn = getattr(self.sp, attr)
+        if not callable(fn):
+            return fn
+
+        def call(*args, **kwargs):
+            key = None
+            if attr in self.cached_calls:
+                # A page is identified by its link, not the whole previous page
+                key_args = (args[0].get('next'),) if attr == 'next' else args
+                key = repr((attr, key_args, sorted(kwargs.items())))
+                hit = None if wants_fresh() else self.cache.get(key)
+                if hit is not None:
+                    return hit
+            if self.bucket:
+                # None when a PriorityClient below spends the budget (call_queue.under_limiters)
+                self.waited += self.bucket.acquire()
+            self.calls += 1
+            result = fn(*args, **kwargs)
+            if key is not None:
+                self.cache.put(key, result, ttl=self.ttls.get(attr))
+            return result
+        return call
+
+
+def spotify_client(account):
+    # One SpotifyOAuth per account, with its own token cache file and its
+    # own requests session (connection pool)
+    import requests
+    from requests.adapters import HTTPAdapter
+    from spotipy import Spotify
+    from spotipy.oauth2 import SpotifyOAuth
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount('https://', adapter)
+    auth = SpotifyOAuth(
+        client_id=account.get('client_id'),
+        client_secret=account.get('client_secret'),
+        redirect_uri=account.get('redirect_uri'),
+        scope=SCOPE,
+        cache_path=account.get('cache_path', f".cache-{account['name']}"),
+        open_browser=False,
+    )
+    return Spotify(auth_manager=auth, requests_session=session)
+
+
+class AccountPool:
+    def __init__(self, accounts, client_factory=spotify_client, rate=RATE, burst=BURST, cache=None):
+        self.cache = cache or ResponseCache()
+        self.clients = [
+            AccountClient(a['name'], client_factory(a), TokenBucket(rate, burst), self.cache)
+            for a in accounts
+        ]
+        # game id -> index of the account the accounts file gives it
+        self.pinned = {game: i for i, a in enumerate(accounts) for game in a.get('games', ())}
+        self.games = {}     # game id -> AccountClient
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, filename=ACCOUNTS_FILE, **kwargs):
+        with open(filename, 'r', encoding='utf-8') as f:
+            return cls(json.load(f), **kwargs)
+
+    def assign(self, game_id):
+        with self.lock:
+            if game_id in self.games:
+                return self.games[game_id]
+            if game_id in self.pinned:
+                client = self.clients[self.pinned[game_id]]
+            else:
+                # Same account for the same game in every process; within
+                # this process, the next free one if that is taken
+                busy = set(id(c) for c in self.games.values())
+                start = zlib.crc32(str(game_id).encode('utf-8')) % len(self.clients)
+                ordered = self.clients[start:] + self.clients[:start]
+                free = [c for c in ordered if id(c) not in busy]
+                if not free:
+                    raise RuntimeError(f"No free Spotify account for game {game_id}")
+                client = free[0]
+            self.games[game_id] = client
+            return client
+
+    def release(self, game_id):
+        with self.lock:
+            self.games.pop(game_id, None)
+
+    def stats(self):
+        return {
+            'accounts': {c.name: {'calls': c.calls, 'waited_s': round(c.waited, 3)} for c in self.clients},
+            'games': {g: c.name for g, c in self.games.items()},
+            'cache_hits': self.cache.hits,
+            'cache_misses': self.cache.misses,
+        }
+
+
+# === Load test ===
+def run_games(pool, games, seconds):
+    # Each game plays its lineup back to back: one search (shared cache),
+    # one start_playback and one pause per transition
+    counts = {}
+    stop_at = time.monotonic() + seconds
+
+    def game(game_id):
+        sp = pool.assign(game_id)
+        n = 0
+        while time.monotonic() < stop_at:
+            uri = sp.search(q=f"Track {10 + n % 9:03d}", type='track', limit=1)['tracks']['items'][0]['uri']
+            sp.start_playback(uris=[uri])
+            sp.pause_playback()
+            n += 1
+        counts[game_id] = n
+
+    threads = [threading.Thread(target=game, args=(f"game-{i}",)) for i in range(games)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for g in counts:
+        pool.release(g)
+    return sum(counts.values())
+
+
+if __name__ == '__main__':
+    from fake_spotify import FakeSpotify, make_catalog
+
+    catalog = make_catalog()
+    seconds = 6
+    for accounts in (1, 2, 4, 8):
+        pool = AccountPool([{'name': f"acct{i}"} for i in range(accounts)],
+                           client_factory=lambda a: FakeSpotify(tracks=catalog, api_latency=0.005))
+        transitions = run_games(pool, accounts, seconds)
+        stats = pool.stats()
+        print(f"{accounts} account(s): {transitions * 60 / seconds:6.0f} transitions/min "
+              f"(cache {stats['cache_hits']} hits / {stats['cache_misses']} misses)")
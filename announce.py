@@ -0,0 +1,163 @@
+# announce.py
+# Batter announcements rendered on the server with an offline TTS engine
+# (espeak-ng, espeak, pico2wave or pyttsx3), instead of by whichever voices
+# the announcer's browser happens to have. Each announcement is cached as
+# a WAV in ANNOUNCE_DIR keyed by voice and text, and the whole lineup is
+# rendered in the background whenever it changes, so announcing is a
+# cache hit. announce() plays the announcement through the local audio
+# path and starts the walk-up clip a little before it ends, by the clip's
+# measured start latency, so the music comes in right behind the voice.
+import hashlib
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from local_audio import LocalAudioBackend, clip_path
+
+ANNOUNCE_DIR = "announcements"
+VOICE = os.getenv("WALKUP_VOICE", "en-us")
+PHRASE = "Now batting, number {number}, {name}!"
+SPEED = 150             # words per minute for the espeak engines
+RENDER_WORKERS = 4
+START_LEAD = 0.3        # seconds; first guess at how long a clip takes to be heard
+LEAD_ALPHA = 0.3        # weight of each new start-latency measurement
+GAP_HISTORY = 50
+
+try:
+    import pyttsx3
+except ImportError:
+    pyttsx3 = None
+
+
+# === Rendering ===
+def engine():
+    for name in ('espeak-ng', 'espeak', 'pico2wave'):
+        if shutil.which(name):
+            return name
+    return 'pyttsx3' if pyttsx3 else None
+
+
+def synthesize(text, voice, path):
+    # Writes text spoken in voice to path as a WAV file
+    name = engine()
+    if name in ('espeak-ng', 'espeak'):
+        subprocess.run([name, '-v', voice, '-s', str(SPEED), '-w', path, text], check=True, capture_output=True)
+    elif name == 'pico2wave':
+        lang = voice if '-' in voice else 'en-US'
+        subprocess.run([name, '-l', lang[:3] + lang[3:].upper(), '-w', path, text], check=True, capture_output=True)
+    elif name == 'pyttsx3':
+        tts = pyttsx3.init()
+        tts.save_to_file(text, path)
+        tts.runAndWait()
+    else:
+        raise RuntimeError("No offline TTS engine found (install espeak-ng or pyttsx3)")
+
+
+def announcement_uri(text, voice):
+    # Announcements are played as clips, so they get a clip-style URI
+    digest = hashlib.sha1(f"{voice}\0{text}".encode('utf-8')).hexdigest()[:20]
+    return f"announce:{digest}"
+
+
+def announcement_text(batter, phrase=PHRASE):
+    return phrase.format(name=batter['name'], number=batter.get('number', ''))
+
+
+def render(text, voice=VOICE, announce_dir=ANNOUNCE_DIR):
+    uri = announcement_uri(text, voice)
+    path = clip_path(uri, announce_dir)
+    if not os.path.exists(path):
+        os.makedirs(announce_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix=".wav", dir=announce_dir)
+        os.close(fd)
+        try:
+            synthesize(text, voice, tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return uri
+
+
+# === Announcer ===
+class Announcer:
+    def __init__(self, voice=VOICE, phrase=PHRASE, announce_dir=ANNOUNCE_DIR, backend=None):
+        self.voice = voice
+        self.phrase = phrase
+        self.announce_dir = announce_dir
+        self.backend = backend or LocalAudioBackend(clip_dir=announce_dir)
+        # An announcement needs a TTS engine and a sound device to play it
+        # on; otherwise the page speaks it with the browser's voices
+        self.available = engine() is not None and getattr(self.backend, 'audible', True)
+        self.pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS)
+        self.lead = START_LEAD
+        self.gaps = deque(maxlen=GAP_HISTORY)
+        self.last = {}
+        self.generation = 0     # bumped by stop() so a cued clip doesn't start
+
+    def text(self, batter):
+        return announcement_text(batter, self.phrase)
+
+    def prerender(self, lineup):
+        # Renders every batter's announcement in the background
+        if not self.available:
+            return []
+        texts = {self.text(b) for b in lineup}
+        return [self.pool.submit(self._render_quietly, text) for text in texts]
+
+    def _render_quietly(self, text):
+        try:
+            return render(text, self.voice, self.announce_dir)
+        except Exception as e:
+            print(f"⚠️ Could not render announcement {text!r}: {e}")
+
+    def announce(self, batter, start_clip):
+        # Plays the announcement, then start_clip() so its audio starts as the
+        # announcement ends. start_clip returns the monotonic time its audio
+        # was heard (None if it didn't play) and runs on a worker thread.
+        text = self.text(batter)
+        uri = render(text, self.voice, self.announce_dir)
+        clip = self.backend.open_clip(uri)
+        duration = clip.frames / clip.rate
+        self.generation += 1
+        generation = self.generation
+        self.backend.play(uri)
+        end = time.monotonic() + duration
+        lead = self.lead
+
+        def run():
+            time.sleep(max(0, end - lead - time.monotonic()))
+            if generation != self.generation:
+                return
+            pressed = time.monotonic()
+            audio_at = start_clip()
+            if audio_at is None:
+                return
+            gap = audio_at - end
+            self.gaps.append(gap)
+            # Track the clip's start latency so the next one is cued earlier or later
+            self.lead += LEAD_ALPHA * ((audio_at - pressed) - self.lead)
+            self.last = {'batter': batter['name'], 'gap_ms': round(gap * 1000, 1),
+                         'announcement_ms': round(duration * 1000), 'lead_ms': round(lead * 1000, 1)}
+            print(f"📣 {batter['name']}: music {'+' if gap >= 0 else ''}{gap * 1000:.0f} ms after the announcement")
+
+        threading.Thread(target=run, daemon=True).start()
+        return {'text': text, 'announcement_ms': round(duration * 1000), 'lead_ms': round(lead * 1000, 1)}
+
+    def stats(self):
+        gaps = [abs(g) * 1000 for g in self.gaps]
+        return {
+            'engine': engine(), 'voice': self.voice, 'lead_ms': round(self.lead * 1000, 1), 'last': self.last,
+            'gap_ms_p50': round(statistics.median(gaps), 1) if gaps else None,
+            'gap_ms_max': round(max(gaps), 1) if gaps else None,
+        }
+
+    def stop(self):
+        self.generation += 1
+        self.backend.stop()
@@ -37,6 +37,19 @@ def create_tables():
 def index():
     return "🎵 Walk-Up Music App Backend is running!"
 
+# Fill in start_ms from hooks.py's analysis for players that don't have one
+@app.route('/api/players/suggest-offsets', methods=['POST'])
+def suggest_offsets():
+    from hooks import start_offset
+    updated = 0
+    for player in Player.query.filter_by(start_ms=0).all():
+        offset = start_offset(player.track_uri)
+        if offset:
+            player.start_ms = offset
+            updated += 1
+    db.session.commit()
+    return {'updated': updated}
+
 if __name__ == '__main__':
     app.run(debug=True)
 
@@ -1,6 +1,7 @@
 # app.py
 import os
 import json
+import random
 import threading
 import time
 import importlib
@@ -8,30 +9,103 @@ from flask import Flask, render_template, jsonify, request
 from spotipy import Spotify
 from spotipy.oauth2 import SpotifyOAuth
 import roster as roster_module  # your list of players
+from preload import Preloader, reload_uris, remember_uris, resolve_uri
+from catalog import FederatedCatalog, load_playlists
+from confirm import confirm_playback
+from journal import GameJournal
+from lineup_history import LineupHistory
+from local_audio import FailoverPlayer, LocalAudioBackend, SpotifyBackend
+from clip_scheduler import ClipScheduler
+from clip_store import ClipStore
+from programs import ProgramLibrary
+from play_history import PlayHistory
+from announce import Announcer
+from call_queue import INTERACTIVE, priority, under_limiters
+from breaker import CircuitBreaker, GuardedClient, MeteredClient, readiness
+from loudness import reload_volumes, target_volume
+from hooks import reload_offsets, start_offset
+from http_cache import VersionedCache, respond
+from json_files import CATALOG_CACHE, load_json
+import profiling
+from profiling import timed
+from game_trace import trace_app, trace_client
+from league import LEAGUE_URL, LeagueReporter
 
 # === Configuration ===
-PLAYLIST_ID = os.getenv("SPOTIPY_PLAYLIST_URI").split(":")[-1]
+PLAYLIST_ID = os.getenv("SPOTIPY_PLAYLIST_URI", "").split(":")[-1]
+TEAM = os.getenv("WALKUP_TEAM")  # this game's team in playlists.json; unset shows every team's songs
 SAVE_FILE = "saved_assignments.json"
 MAX_PLAY_TIME = 30  # seconds
+PRELOAD = os.getenv("WALKUP_PRELOAD", "1") == "1"  # queue the on-deck batter's track
+HTTP_CACHE = os.getenv("WALKUP_HTTP_CACHE", "1") == "1"  # ETags and cached pages
+ANNOUNCE = os.getenv("WALKUP_ANNOUNCE", "1") == "1"  # speak announcements on the server
+PRIORITY_CALLS = os.getenv("WALKUP_PRIORITY_CALLS", "1") == "1"  # playback calls jump the queue
 
 # === Spotify setup ===
-sp = Spotify(auth_manager=SpotifyOAuth(
-    scope="user-modify-playback-state,user-read-playback-state,playlist-read-private"
-))
+# The breaker times calls at Spotify itself (MeteredClient, innermost), so
+# waits in the queues and limiters below don't count against Spotify
+breaker = CircuitBreaker()
+limiters = []      # rate-limited caches in the stack, innermost first
+if os.getenv("WALKUP_FAKE_SPOTIFY"):
+    from fake_spotify import FakeSpotify
+    sp = MeteredClient(FakeSpotify(), breaker)
+elif os.getenv("WALKUP_ACCOUNTS"):
+    # Multi-field deployments: this game gets its own account from the pool
+    from account_pool import AccountPool
+    sp = AccountPool.from_file(os.getenv("WALKUP_ACCOUNTS")).assign(os.getenv("WALKUP_GAME", "default"))
+    sp.sp = MeteredClient(sp.sp, breaker)
+    limiters.append(sp)
+else:
+    sp = MeteredClient(Spotify(auth_manager=SpotifyOAuth(
+        scope="user-modify-playback-state,user-read-playback-state,playlist-read-private"
+    )), breaker)
+# WALKUP_TRACE=<file> records every Spotify call for game_trace.py
+sp = trace_client(sp)
+# Several workers on one box share a rate budget and catalog cache
+SHARED_DB = os.getenv("WALKUP_SHARED_DB")
+if SHARED_DB:
+    from shared_limiter import all_stats, process_stats, shared_client, start_publisher
+    sp = shared_client(sp, SHARED_DB)
+    start_publisher(sp)
+    limiters.append(sp)
+# Playback control goes out ahead of catalog syncs, searches and polls. The
+# queue sits under the limiters and spends their budget, so a press never
+# waits behind a sync for a token.
+if PRIORITY_CALLS:
+    sp, dispatcher = under_limiters(sp, limiters)
+# Deadlines per call and a circuit breaker: during an outage presses fail
+# fast (to local clips) instead of each waiting out the HTTP timeout
+sp = GuardedClient(sp, breaker)
+preloader = Preloader(sp, enabled=PRELOAD)
+# Falls back to cached clips on disk when Spotify can't be reached; only
+# each batter's window is kept, under a disk budget
+clip_store = ClipStore()
+player = FailoverPlayer(SpotifyBackend(sp, preloader), LocalAudioBackend(store=clip_store))
+# Every team's playlist merged into one catalog (catalog.py), saved for
+# starting while Spotify is down
+catalog = FederatedCatalog(sp, load_playlists() or {'default': [PLAYLIST_ID]})
 
 # === Helper functions ===
+@timed('load_assignments')
 def load_saved_data():
     if os.path.exists(SAVE_FILE):
-        with open(SAVE_FILE, 'r') as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                return {}
+        with open(SAVE_FILE, 'rb') as f:
+            raw = f.read()
+        try:
+            text = raw.decode('utf-8')
+        except UnicodeDecodeError:
+            # Saved by an older version with the Windows default encoding;
+            # the next save writes UTF-8
+            text = raw.decode('cp1252', errors='replace')
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            return {}
     return {}
 
 
 def save_data(data):
-    with open(SAVE_FILE, 'w') as f:
+    with open(SAVE_FILE, 'w', encoding='utf-8') as f:
         json.dump(data, f, indent=2, ensure_ascii=False)
 
 
@@ -44,19 +118,23 @@ def get_assignments():
     return assignments
 
 
+def cached_catalog():
+    # Songs from walkup_app.py's catalog cache, for starting while Spotify is down
+    catalog = load_json(CATALOG_CACHE, {})
+    return catalog.get('songs', {}) if catalog.get('playlist') == PLAYLIST_ID else {}
+
+
 def get_playlist_songs():
-    tracks = []
-    results = sp.playlist_tracks(PLAYLIST_ID)
-    tracks.extend(results['items'])
-    while results.get('next'):
-        results = sp.next(results)
-        tracks.extend(results['items'])
-    return [
-        f"{t['track']['name']} – {t['track']['artists'][0]['name']}"
-        for t in tracks if t.get('track')
-    ]
+    # Only the playlists whose snapshot changed are fetched
+    try:
+        if catalog.sync():
+            remember_uris(catalog.uris())
+    except Exception as e:
+        print(f"⚠️ Could not sync the catalog ({e}), using the saved one")
+    return catalog.songs(TEAM) or list(cached_catalog())
 
 
+@timed('build_lineup')
 def build_lineup(assignments, songs):
     lineup = []
     for name, info in assignments.items():
@@ -67,80 +145,599 @@ def build_lineup(assignments, songs):
     return sorted(lineup, key=lambda x: x['number'])
 
 # === Playback ===
-def play_track(uri):
+def play_track(uri, label=None, play=None):
+    # Batter clips and music programs share one scheduler, so a new clip
+    # preempts the last one and only the newest clip's fade-out runs
     try:
-        sp.start_playback(uris=[uri])
+        backend = scheduler.play(uri, MAX_PLAY_TIME, kind='batter', label=label, device_id=device['id'],
+                                 position_ms=start_offset(uri), volume=target_volume(uri), play=play)
     except Exception as e:
         print('Playback error', e)
+        if play:
+            play['failure'] = 'playback_error'
+            history.finish(play)
+        return None
+    if play:
+        play['backend'] = backend
+        if backend == 'local':
+            history.accepted(play, backend)
+    return backend
+
+
+def preload_track(song):
+    try:
+        preloader.stage(resolve_uri(sp, song), device_id=device['id'])
+    except Exception as e:
+        print('Preload error', e)
+
 
+def confirm_track(uri, pressed, play=None):
+    global last_playback
+    position_ms = start_offset(uri)
+    last_playback = confirm_playback(
+        sp, uri, position_ms=position_ms, started=pressed,
+        play=lambda device_id: preloader.play(uri, device_id=device_id, position_ms=position_ms))
+    if play:
+        history.confirm(play, last_playback)
+    versions['playback'] += 1
+    league.poke()
 
-def fade_stop():
-    time.sleep(MAX_PLAY_TIME)
+
+def run_clip(uri, on_deck_song, pressed, backend, play=None):
+    # Local clips can't go silent on a remote device, so only Spotify is confirmed
+    if backend == 'spotify':
+        confirm_track(uri, pressed, play)
+    preload_track(on_deck_song)
+
+
+def start_batter(batter, on_deck, pressed, wait=False):
+    # Starts the batter's clip. With wait, the clip is confirmed on this
+    # thread and the monotonic time its audio was heard is returned.
+    requested = time.time()
     try:
-        sp.pause_playback()
-    except:
-        pass
+        with priority(INTERACTIVE):
+            # A search here is on the press-to-audio path
+            uri = resolve_uri(sp, batter['song'])
+    except Exception as e:
+        # Spotify is down; a cached clip can still play if we know its URI
+        print('Search error', e)
+        uri = catalog.uri_for(batter['song']) or cached_catalog().get(batter['song'])
+    if not uri:
+        history.failed(None, 'not_found', batter=batter['name'], requested=requested)
+        return None
+    play = history.begin(uri, batter=batter['name'], requested=requested)
+    backend = play_track(uri, label=batter['name'], play=play)
+    journal.record('clip_started', uri=uri, batter=batter['name'])
+    if not wait:
+        threading.Thread(target=run_clip, args=(uri, on_deck['song'], pressed, backend, play), daemon=True).start()
+        return None
+    run_clip(uri, on_deck['song'], pressed, backend, play)
+    if backend == 'local':
+        return pressed
+    if backend == 'spotify' and last_playback.get('ok'):
+        return pressed + last_playback['elapsed_ms'] / 1000
+    return None
+
+
+def warm_lineup():
+    # Whenever the lineup changes: announcements rendered, clip windows cut
+    lineup = build_lineup(get_assignments(), songs)
+    if ANNOUNCE:
+        announcer.prerender(lineup)
+    threading.Thread(target=fill_clips, args=(lineup,), daemon=True).start()
+
+
+def fill_clips(lineup):
+    windows = []
+    for batter in lineup:
+        try:
+            uri = resolve_uri(sp, batter['song'])
+        except Exception as e:
+            print('Search error', e)
+            continue
+        if uri:
+            # The clip plus its fade-out
+            windows.append((uri, start_offset(uri), int((MAX_PLAY_TIME + scheduler.fade_seconds) * 1000)))
+    clip_store.fill(windows)
+
+
+def clip_stopped(clip):
+    journal.record('clip_stopped')
+    if clip.get('play'):
+        history.finish(clip['play'], time.time() - clip['started'])
+    league.poke()
+
+
+# === League dashboard ===
+def league_status():
+    # What league.py shows for this game; the reporter sends only what changed
+    clip = scheduler.status()
+    status = readiness(breaker, player)
+    spotify = status['spotify']
+    return {
+        'field': history.field,
+        'batter': at_bat.get('name'), 'index': at_bat.get('index'),
+        'playback': ({'state': 'playing', 'kind': clip['kind'], 'label': clip['label'], 'backend': clip.get('backend')}
+                     if clip else {'state': 'stopped'}),
+        'latency_ms': last_playback.get('elapsed_ms'), 'confirmed': last_playback.get('ok'),
+        'mode': status['mode'],
+        'breaker': {k: spotify[k] for k in ('state', 'trips', 'failures', 'last_error')},
+        'errors': dict(history.counts),
+    }
+
 
 # === Flask App ===
 app = Flask(__name__)
-current_index = 0
+profiling.profile_app(app)
+journal = GameJournal()
+history = PlayHistory()
+# Every version of the lineup, for undo and "as of inning N"; edits made
+# while this server was down (the Tk app alone, by hand) become one version
+lineup_history = LineupHistory()
+try:
+    lineup_history.record(get_assignments(), note='loaded')
+except Exception as e:
+    # History is a convenience; the game runs without its starting version
+    print(f"⚠️ Could not record the loaded lineup: {e}")
+# With WALKUP_LEAGUE_URL set, this game shows on the league dashboard
+league = LeagueReporter(LEAGUE_URL, history.game, league_status)
+scheduler = ClipScheduler(player, on_stop=clip_stopped)
+# Resume at the batter the last run left off on
+current_index = journal.state['batter_index']
+# A clip that was still playing when the last run died keeps its auto-stop
+if journal.state['playing']:
+    playing = journal.state['playing']
+    scheduler.adopt({'uri': playing.get('uri'), 'kind': 'batter', 'label': playing.get('batter'),
+                     'duration': MAX_PLAY_TIME, 'device_id': None, 'started': playing['started']},
+                    MAX_PLAY_TIME - (time.time() - playing['started']))
+last_playback = {}  # result of the latest playback confirmation
+at_bat = {}  # the batter whose clip was started last, for the league dashboard
 songs = get_playlist_songs()
+# Between innings, pitching change... staged in the background while the game runs
+programs = ProgramLibrary(sp, scheduler, history=history)
+programs.start_staging()
+# Batter announcements, rendered ahead of time whenever the lineup changes
+announcer = Announcer()
+ANNOUNCE = ANNOUNCE and announcer.available
+warm_lineup()
+league.start()
 # Initial roster load
 roster = roster_module.roster
+# The trace header carries what a replay needs to rebuild this game
+trace_app(app, header=lambda: {'assignments': load_saved_data(), 'roster': roster, 'songs': songs})
+
+# === Response caching ===
+# Bumped whenever what the pages show changes; the saved file's mtime
+# covers edits made by the Tk app or by hand
+versions = {'roster': 0, 'assignments': 0, 'catalog': 0, 'playback': 0}
+
+
+def saved_mtime():
+    try:
+        return os.stat(SAVE_FILE).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def page_key():
+    return (versions['roster'], versions['assignments'], versions['catalog'], saved_mtime())
+
+
+def render_index():
+    return render_template('index.html', roster=roster, assignments=get_assignments(), songs=songs)
+
+
+def lineup_json():
+    lineup = build_lineup(get_assignments(), songs)
+    return json.dumps({'lineup': lineup, 'current_index': current_index, 'playback': last_playback})
+
+
+index_cache = VersionedCache(render_index, 'text/html')
+lineup_cache = VersionedCache(lineup_json, 'application/json')
+
+# === Commands ===
+# What the game can be told to do. The web routes below and the daemon's
+# local socket (walkup_daemon.py, for the Tk app and the CLI) both run these,
+# so every front end moves the same batter pointer. Each returns
+# (body, status) like a Flask view.
+game_lock = threading.Lock()  # one press moves the pointer at a time
+lineup_lock = threading.Lock()  # one player edit reads and writes the lineup at a time
+device = {'id': None}  # where clips play; None is the active device
+
+
+def game_state():
+    assignments = get_assignments()
+    lineup = build_lineup(assignments, songs)
+    return {'lineup': lineup, 'assignments': assignments, 'current_index': current_index,
+            'playback': last_playback, 'now_playing': scheduler.status()}, 200
+
+
+def take_batter(lineup):
+    # Returns (batter, on_deck) and moves the pointer past the batter
+    global current_index
+    with game_lock:
+        current_index %= len(lineup)
+        batter = lineup[current_index]
+        on_deck = lineup[(current_index + 1) % len(lineup)]
+        at_bat.update(name=batter['name'], index=current_index)
+        current_index = (current_index + 1) % len(lineup)
+        journal.record('batter_advanced', index=current_index)
+    league.poke()
+    return batter, on_deck
+
+
+def advance():
+    pressed = time.monotonic()
+    lineup = build_lineup(get_assignments(), songs)
+    if not lineup:
+        return {'error': 'No lineup'}, 400
+    batter, on_deck = take_batter(lineup)
+    start_batter(batter, on_deck, pressed)
+    return {'ok': True, 'batter': batter['name'], 'current_index': current_index}, 200
+
+
+def announce_next():
+    # One round trip: the announcement plays on the server and the clip is
+    # cued to come in right behind it. Without a TTS engine the caller speaks
+    # the text itself and then calls next.
+    lineup = build_lineup(get_assignments(), songs)
+    if not lineup:
+        return {'error': 'No lineup'}, 400
+    if not ANNOUNCE:
+        batter = lineup[current_index % len(lineup)]
+        return {'announced': False, 'text': f"Now up {batter['name']}"}, 200
+    # The pointer moves first, so two presses never announce the same batter
+    batter, on_deck = take_batter(lineup)
+    try:
+        info = announcer.announce(batter, lambda: start_batter(batter, on_deck, time.monotonic(), wait=True))
+    except Exception as e:
+        # The batter is already taken, so the clip plays without the announcement
+        print('Announcement error', e)
+        start_batter(batter, on_deck, time.monotonic())
+        return {'ok': True, 'announced': False, 'batter': batter['name'], 'current_index': current_index}, 200
+    return {'ok': True, 'announced': True, 'current_index': current_index, **info}, 200
+
+
+def play_player(name):
+    # Plays one player's song out of turn; the batter pointer stays put
+    assignments = get_assignments()
+    wanted = name.strip().lower()
+    matches = [p for p in assignments if p.lower() == wanted] or \
+              [p for p in assignments if p.lower().startswith(wanted)]
+    if len(matches) != 1:
+        return {'error': f'No single player matches {name!r}'}, 404
+    song = assignments[matches[0]].get('song', '').strip()
+    if not song:
+        return {'error': f'{matches[0]} has no song assigned'}, 400
+    batter = {'name': matches[0], 'song': song}
+    lineup = build_lineup(assignments, songs)
+    on_deck = lineup[current_index % len(lineup)] if lineup else batter
+    start_batter(batter, on_deck, time.monotonic())
+    return {'ok': True, 'batter': matches[0], 'song': song}, 200
+
+
+def play_random():
+    if not songs:
+        return {'error': 'The playlist is empty'}, 400
+    song = random.choice(songs)
+    requested = time.time()
+    with priority(INTERACTIVE):
+        uri = resolve_uri(sp, song)
+    if not uri:
+        history.failed(None, 'not_found', requested=requested)
+        return {'error': f'Song not found: {song}'}, 404
+    backend = play_track(uri, label=song, play=history.begin(uri, requested=requested))
+    journal.record('clip_started', uri=uri)
+    return {'ok': backend is not None, 'song': song, 'backend': backend}, 200
+
+
+def stop_playback():
+    announcer.stop()
+    try:
+        scheduler.stop(device_id=device['id'])
+    except Exception as e:
+        print('Stop error', e)
+        journal.record('clip_stopped')
+    return {'ok': True}, 200
+
+
+def program_listing():
+    return {'programs': programs.listing(), 'now_playing': scheduler.status()}, 200
+
+
+def trigger_program(name):
+    if name not in programs.programs:
+        return {'error': f'Unknown program {name}'}, 404
+    try:
+        pick = programs.trigger(name, device_id=device['id'])
+    except Exception as e:
+        print('Program error', e)
+        return {'error': str(e)}, 502
+    if not pick:
+        return {'error': f'No playable songs for {name}'}, 400
+    journal.record('clip_started', uri=pick['uri'], program=name)
+    return {'ok': True, 'program': name, 'song': pick['song'], 'backend': pick['backend']}, 200
+
+
+def write_lineup(assignments):
+    save_data(assignments)
+    versions['assignments'] += 1
+    journal.record('lineup_edited', assignments=assignments)
+    warm_lineup()
+
+
+def save_assignments(assignments, note='edit'):
+    for player in roster_module.roster:
+        assignments.setdefault(player, {'batting_number': '', 'song': ''})
+    write_lineup(assignments)
+    return {'ok': True, 'version': lineup_history.record(assignments, note)}, 200
 
+
+def assign_player(player, batting_number='', song=''):
+    # One player's edit, merged into the lineup as it is now, so a front end
+    # never writes back a whole lineup it loaded before someone else's edits
+    with lineup_lock:
+        assignments = get_assignments()
+        assignments[player] = {'batting_number': batting_number, 'song': song}
+        write_lineup(assignments)
+        version = lineup_history.record(assignments, 'edit')
+    return {'ok': True, 'version': version}, 200
+
+
+def lineup_moved(version, error):
+    # After undo, redo or restore the history's current version is the lineup
+    if version is None:
+        return {'error': error}, 409
+    assignments = lineup_history.assignments()
+    write_lineup(assignments)
+    return {'ok': True, 'version': version, 'assignments': assignments}, 200
+
+
+def undo_lineup():
+    return lineup_moved(lineup_history.undo(), 'Nothing to undo')
+
+
+def redo_lineup():
+    return lineup_moved(lineup_history.redo(), 'Nothing to redo')
+
+
+def mark_inning(inning):
+    if not str(inning).isdigit():
+        return {'error': 'Which inning?'}, 400
+    return {'ok': True, 'inning': int(inning), 'version': lineup_history.mark_inning(inning)}, 200
+
+
+def restore_lineup(inning=None, version=None):
+    if inning is not None and not str(inning).isdigit():
+        return {'error': 'Which inning?'}, 400
+    if version is not None and not str(version).isdigit():
+        return {'error': 'Which version?'}, 400
+    restored = lineup_history.restore(inning=inning, version=version)
+    if restored is None:
+        return {'error': f'No lineup saved for inning {inning}' if inning is not None
+                else f'No lineup version {version}'}, 404
+    return lineup_moved(restored, None)
+
+
+def lineup_versions(limit=50):
+    if not str(limit).isdigit() or int(limit) == 0:
+        return {'error': 'limit must be a positive number'}, 400
+    return lineup_history.listing(int(limit)), 200
+
+
+def reload_roster():
+    global roster
+    importlib.reload(roster_module)
+    roster = roster_module.roster
+    versions['roster'] += 1
+    warm_lineup()
+    return {'ok': True}, 200
+
+
+def start_game(assignments, game=None):
+    # Makes a scheduled game the live one (prewarm.py live <game>): its
+    # lineup, the leadoff batter up, the caches the pre-warm filled re-read,
+    # and the leadoff clip queued on the device like any on-deck batter
+    global current_index
+    reload_uris()
+    reload_offsets()
+    reload_volumes()
+    clip_store.reload()
+    save_assignments(assignments, note=f'start {game}' if game else 'start game')
+    with game_lock:
+        current_index = 0
+        journal.record('batter_advanced', index=0)
+    lineup = build_lineup(get_assignments(), songs)
+    if lineup:
+        threading.Thread(target=preload_track, args=(lineup[0]['song'],), daemon=True).start()
+    return {'ok': True, 'game': game, 'batters': len(lineup)}, 200
+
+
+def sync_catalog():
+    try:
+        changed = catalog.sync()
+    except Exception as e:
+        return {'error': f'Could not sync the catalog: {e}'}, 502
+    if changed:
+        catalog_changed(changed)
+    return {'ok': True, 'songs': len(songs), 'changed': changed}, 200
+
+
+def catalog_changed(changed):
+    # A team edited its playlist: its songs resolve without a search, and
+    # the pages and lineup see the new catalog
+    global songs
+    songs = catalog.songs(TEAM)
+    remember_uris(catalog.uris())
+    versions['catalog'] += 1
+    warm_lineup()
+
+
+def catalog_listing(team=None):
+    teams = {name: len(catalog.songs(name)) for name in catalog.teams}
+    return {**catalog.stats(), 'team': TEAM, 'teams': teams,
+            **({'songs': catalog.songs(team)} if team else {})}, 200
+
+
+def list_devices():
+    try:
+        return {'devices': sp.devices()['devices'], 'selected': device['id']}, 200
+    except Exception as e:
+        return {'error': f'Could not list devices: {e}'}, 502
+
+
+def use_device(device_id):
+    device['id'] = device_id
+    try:
+        sp.transfer_playback(device_id, force_play=False)
+    except Exception as e:
+        print(f"⚠️ Could not transfer playback: {e}")
+    return {'ok': True, 'device_id': device_id}, 200
+
+
+def ready():
+    # Breaker state and the mode the UI should show: spotify, local or silent
+    status = readiness(breaker, player)
+    return status, 200 if status['ready'] else 503
+
+
+COMMANDS = {
+    'ping': lambda: ({'ok': True, 'pid': os.getpid()}, 200),
+    'state': game_state,
+    'songs': lambda team=None: ({'songs': catalog.songs(team) if team else songs}, 200),
+    'catalog': catalog_listing,
+    'next': advance,
+    'announce_next': announce_next,
+    'play': play_player,
+    'random': play_random,
+    'stop': stop_playback,
+    'programs': program_listing,
+    'program': trigger_program,
+    'save': save_assignments,
+    'assign': assign_player,
+    'undo': undo_lineup,
+    'redo': redo_lineup,
+    'inning': mark_inning,
+    'restore': restore_lineup,
+    'history': lineup_versions,
+    'reload': reload_roster,
+    'start_game': start_game,
+    'sync': sync_catalog,
+    'devices': list_devices,
+    'use_device': use_device,
+    'ready': ready,
+}
+
+# Teams edit their playlists during the day; changed ones are merged in
+catalog.start_polling(on_change=catalog_changed)
+
+
+def reply(result):
+    body, status = result
+    return jsonify(body), status
+
+# === Routes ===
 @app.route('/')
 def index():
+    if HTTP_CACHE:
+        return respond(index_cache.get(page_key()))
     assignments = get_assignments()
     return render_template('index.html', roster=roster, assignments=assignments, songs=songs)
 
 @app.route('/api/lineup')
 def api_lineup():
-    global current_index
+    if HTTP_CACHE:
+        return respond(lineup_cache.get(page_key() + (current_index, versions['playback'])))
     assignments = get_assignments()
     lineup = build_lineup(assignments, songs)
-    return jsonify({'lineup': lineup, 'current_index': current_index})
+    return jsonify({'lineup': lineup, 'current_index': current_index, 'playback': last_playback})
 
 @app.route('/api/next', methods=['POST'])
 def api_next():
-    global current_index
-    assignments = get_assignments()
-    lineup = build_lineup(assignments, songs)
-    if not lineup:
-        return jsonify({'error': 'No lineup'}), 400
-    player = lineup[current_index]
-    results = sp.search(q=player['song'], type='track', limit=1)
-    items = results['tracks']['items']
-    if items:
-        uri = items[0]['uri']
-        play_track(uri)
-        threading.Thread(target=fade_stop, daemon=True).start()
-    current_index = (current_index + 1) % len(lineup)
-    return jsonify({'ok': True})
+    return reply(advance())
+
+@app.route('/api/announce-next', methods=['POST'])
+def api_announce_next():
+    return reply(announce_next())
+
+@app.route('/api/announcer')
+def api_announcer():
+    return jsonify({'enabled': ANNOUNCE, **announcer.stats()})
+
+@app.route('/api/programs')
+def api_programs():
+    return reply(program_listing())
+
+@app.route('/api/program/<name>', methods=['POST'])
+def api_program(name):
+    return reply(trigger_program(name))
+
+@app.route('/api/ready')
+def api_ready():
+    return reply(ready())
+
+@app.route('/api/limiter')
+def api_limiter():
+    out = {'shared': bool(SHARED_DB)}
+    if SHARED_DB:
+        out.update(process=process_stats(sp), processes=all_stats(sp))
+    if PRIORITY_CALLS:
+        out['calls'] = dispatcher.stats()
+    return jsonify(out)
+
+@app.route('/admin/profile')
+def admin_profile():
+    # Samples every thread for a few seconds and returns collapsed stacks
+    if not profiling.ENABLED:
+        return jsonify({'error': 'Profiling is off (set WALKUP_PROFILE=1)'}), 404
+    try:
+        seconds = float(request.args.get('seconds', 5))
+    except ValueError:
+        return jsonify({'error': 'seconds must be a number'}), 400
+    if not 0 < seconds <= 60:
+        return jsonify({'error': 'seconds must be between 0 and 60'}), 400
+    return profiling.format_stacks(profiling.sample_stacks(seconds)), 200, {'Content-Type': 'text/plain'}
 
 @app.route('/api/stop', methods=['POST'])
 def api_stop():
-    try:
-        sp.pause_playback()
-    except:
-        pass
-    return jsonify({'ok': True})
+    return reply(stop_playback())
 
 @app.route('/api/save', methods=['POST'])
 def api_save():
-    data = request.json.get('assignments', {})
-    roster = roster_module.roster
-    for player in roster:
-        data.setdefault(player, {'batting_number': '', 'song': ''})
-    save_data(data)
-    return jsonify({'ok': True})
+    return reply(save_assignments(request.json.get('assignments', {})))
+
+@app.route('/api/lineup/undo', methods=['POST'])
+def api_undo():
+    return reply(undo_lineup())
+
+@app.route('/api/lineup/redo', methods=['POST'])
+def api_redo():
+    return reply(redo_lineup())
+
+@app.route('/api/lineup/inning', methods=['POST'])
+def api_inning():
+    return reply(mark_inning(request.json.get('inning')))
+
+@app.route('/api/lineup/restore', methods=['POST'])
+def api_restore():
+    return reply(restore_lineup(request.json.get('inning'), request.json.get('version')))
+
+@app.route('/api/lineup/history')
+def api_history():
+    return reply(lineup_versions(request.args.get('limit', 50)))
+
+@app.route('/api/catalog')
+def api_catalog():
+    return reply(catalog_listing(request.args.get('team')))
 
 @app.route('/api/reload', methods=['POST'])
 def api_reload():
-    global roster
-    importlib.reload(roster_module)
-    roster = roster_module.roster
-    return jsonify({'ok': True})
+    return reply(reload_roster())
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
+    # This process is the playback daemon: the Tk app and the CLI drive the
+    # same game over its local socket
+    from walkup_daemon import DaemonServer
+    DaemonServer(COMMANDS).start()
+    app.run(host='0.0.0.0', port=5000, threaded=True)
 
@@ -0,0 +1,253 @@
+# breaker.py
+# Circuit breaker and per-call deadlines for the Spotify client. Every call
+# gets a deadline for its kind of operation (a pause shouldn't be allowed
+# the 5+ seconds a playlist page can take). Consecutive failures or slow
+# calls trip the breaker; while it is open every call fails at once with
+# BreakerOpen, so FailoverPlayer goes straight to the local clip and no
+# request thread sits on a dead connection. A background probe closes it
+# again once Spotify answers.
+#
+# The breaker judges Spotify, not this process: MeteredClient sits at the
+# bottom of the client stack and times only the HTTP call, so a press that
+# waited in the priority queue, a 429 backoff or the rate limiter doesn't
+# count as a slow call. GuardedClient sits on top, where the deadline and
+# the fail-fast check belong.
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from account_pool import fresh, wants_fresh
+from call_queue import current_priority, priority
+
+CLOSED, OPEN = 'closed', 'open'
+FAILURE_THRESHOLD = 3   # consecutive failed or slow calls that trip the breaker
+SLOW_CALL = 2.0         # seconds; a slower call counts against the breaker (calls not in SLOW_CALLS)
+PROBE_INTERVAL = 5.0    # seconds between recovery probes while open
+DEFAULT_DEADLINE = 10.0
+CALL_THREADS = 16       # bounds the calls left running past their deadline
+
+# Seconds each call may take before the caller gives up on it
+DEADLINES = {
+    'start_playback': 2.0, 'pause_playback': 1.5, 'next_track': 1.5, 'seek_track': 1.5,
+    'transfer_playback': 2.0, 'volume': 1.5, 'add_to_queue': 2.0, 'current_playback': 1.5,
+    'devices': 2.0, 'search': 3.0,
+}
+
+
+# Seconds a call of each kind may take at Spotify before it counts as slow;
+# a playlist page is a much bigger answer than a pause
+SLOW_CALLS = {
+    'start_playback': 1.0, 'pause_playback': 0.75, 'next_track': 0.75, 'seek_track': 0.75,
+    'transfer_playback': 1.0, 'volume': 0.75, 'add_to_queue': 1.0, 'current_playback': 0.75,
+    'devices': 1.0, 'search': 2.0, 'playlist_tracks': 4.0, 'next': 4.0,
+}
+
+
+class BreakerOpen(Exception):
+    pass
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def is_outage(e):
+    # Timeouts, connection errors and 5xx are outages; 4xx (no device,
+    # bad URI) and 429 are answers from a working service
+    if isinstance(e, (DeadlineExceeded, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(e, 'http_status', None)
+    if status is None:
+        return type(e).__module__.startswith(('requests', 'urllib3'))
+    return status >= 500
+
+
+class CircuitBreaker:
+    def __init__(self, name='spotify', failure_threshold=FAILURE_THRESHOLD, slow_call=SLOW_CALL,
+                 slow_calls=SLOW_CALLS, probe=None, probe_interval=PROBE_INTERVAL, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call = slow_call
+        self.slow_calls = slow_calls
+        self.probe = probe          # callable that raises while the service is down
+        self.probe_interval = probe_interval
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.since = clock()
+        self.consecutive = 0
+        self.trips = 0
+        self.failures = 0
+        self.calls = 0
+        self.last_error = None
+        self.last_latency = None
+        self.metered = False        # a MeteredClient reports the calls
+        self.in_flight = {}         # ticket -> (start, kind) of calls at Spotify now
+        self.tickets = itertools.count()
+
+    def slow_after(self, kind):
+        return self.slow_calls.get(kind, self.slow_call)
+
+    def started(self, kind):
+        ticket = next(self.tickets)
+        with self.lock:
+            self.in_flight[ticket] = (self.clock(), kind)
+        return ticket
+
+    def stuck(self):
+        # True when a call has been at Spotify longer than its kind should take
+        now = self.clock()
+        with self.lock:
+            return any(now - start > self.slow_after(kind) for start, kind in self.in_flight.values())
+
+    def before(self):
+        if self.state == OPEN:
+            raise BreakerOpen(f"{self.name} is unavailable (circuit open)")
+
+    def record(self, latency, error=None, kind=None, ticket=None):
+        with self.lock:
+            self.in_flight.pop(ticket, None)
+            self.calls += 1
+            self.last_latency = latency
+            if error is not None:
+                self.failures += 1
+                self.last_error = f"{type(error).__name__}: {error}"
+            slow = latency > self.slow_after(kind)
+            bad = error is not None or slow
+            self.consecutive = self.consecutive + 1 if bad else 0
+            trip = self.state == CLOSED and self.consecutive >= self.failure_threshold
+            if trip:
+                if error is None:
+                    self.last_error = f"{self.consecutive} slow calls ({kind} took {latency:.1f}s)"
+                self._set(OPEN)
+        if trip:
+            print(f"⚠️ {self.name} circuit open: {self.last_error}")
+            threading.Thread(target=self._probe_loop, daemon=True).start()
+
+    def _set(self, state):
+        self.state = state
+        self.since = self.clock()
+        if state == OPEN:
+            self.trips += 1
+
+    def _probe_loop(self):
+        while self.state == OPEN:
+            time.sleep(self.probe_interval)
+            if self.probe is None:
+                break
+            start = self.clock()
+            try:
+                self.probe()
+            except Exception as e:
+                with self.lock:
+                    self.last_error = f"{type(e).__name__}: {e}"
+                continue
+            if self.clock() - start <= self.slow_after('devices'):
+                break
+        with self.lock:
+            self.consecutive = 0
+            if self.state == OPEN:
+                self._set(CLOSED)
+        print(f"✅ {self.name} circuit closed")
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'state': self.state, 'for_s': round(self.clock() - self.since, 1), 'trips': self.trips,
+                'calls': self.calls, 'failures': self.failures, 'consecutive': self.consecutive,
+                'last_error': self.last_error,
+                'last_latency_ms': round(self.last_latency * 1000, 1) if self.last_latency is not None else None,
+            }
+
+
+class MeteredClient:
+    # Wraps the spotipy client itself (below every queue and limiter) and
+    # reports each call's time at Spotify to the breaker
+    def __init__(self, sp, breaker):
+        self.sp = sp
+        self.breaker = breaker
+        breaker.metered = True
+
+    def __getattr__(self, attr):
+        fn = getattr(self.sp, attr)
+        if not callable(fn):
+            return fn
+
+        def call(*args, **kwargs):
+            ticket = self.breaker.started(attr)
+            start = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self.breaker.record(time.monotonic() - start, e if is_outage(e) else None, attr, ticket)
+                raise
+            self.breaker.record(time.monotonic() - start, None, attr, ticket)
+            return result
+        return call
+
+
+class GuardedClient:
+    # Proxies a spotipy client through a breaker, with a deadline per call.
+    # Without a MeteredClient underneath it times the calls itself.
+    def __init__(self, sp, breaker=None, deadlines=DEADLINES, default_deadline=DEFAULT_DEADLINE):
+        self.sp = sp
+        self.breaker = breaker or CircuitBreaker()
+        if self.breaker.probe is None:
+            self.breaker.probe = lambda: self._run('devices', sp.devices, (), {}, DEADLINES['devices'])
+        self.deadlines = deadlines
+        self.default_deadline = default_deadline
+        self.pool = ThreadPoolExecutor(max_workers=CALL_THREADS, thread_name_prefix='spotify-deadline')
+
+    def _run(self, name, fn, args, kwargs, deadline, level=None, uncached=False):
+        future = self.pool.submit(self._call, level, uncached, fn, args, kwargs)
+        try:
+            return future.result(timeout=deadline)
+        except FutureTimeout:
+            raise DeadlineExceeded(f"{name} took longer than {deadline}s") from None
+
+    @staticmethod
+    def _call(level, uncached, fn, args, kwargs):
+        # On a pool thread: keeps the caller's priority(...) for PriorityClient
+        # and fresh() for the response caches
+        with priority(level), fresh(uncached):
+            return fn(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        fn = getattr(self.sp, attr)
+        if not callable(fn):
+            return fn
+        deadline = self.deadlines.get(attr, self.default_deadline)
+
+        def call(*args, **kwargs):
+            self.breaker.before()
+            start = time.monotonic()
+            try:
+                result = self._run(attr, fn, args, kwargs, deadline, current_priority(), wants_fresh())
+            except DeadlineExceeded as e:
+                # Metered: an outage only if a call is stuck at Spotify, not in our own queue
+                if not self.breaker.metered or self.breaker.stuck():
+                    self.breaker.record(time.monotonic() - start, e, attr)
+                raise
+            except Exception as e:
+                if not self.breaker.metered:
+                    self.breaker.record(time.monotonic() - start, e if is_outage(e) else None, attr)
+                raise
+            if not self.breaker.metered:
+                self.breaker.record(time.monotonic() - start, None, attr)
+            return result
+        return call
+
+
+def readiness(breaker, player=None):
+    # What the UI should do right now: 'spotify', 'local' (cached clips
+    # only) or 'silent'
+    snap = breaker.snapshot()
+    if snap['state'] == CLOSED:
+        mode = 'spotify'
+    elif player is not None and player.fallback.has_any_clip():
+        mode = 'local'
+    else:
+        mode = 'silent'
+    return {'ready': mode == 'spotify', 'mode': mode, 'spotify': snap}
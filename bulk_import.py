@@ -0,0 +1,335 @@
+# bulk_import.py
+# Imports a whole league's players from a CSV or JSON Lines file with
+# free-text song requests, e.g.
+#
+#   name,number,song
+#   Isaac,1,eye of the tiger survivor
+#
+# The file is streamed in chunks. Songs are matched against the local
+# catalog (playlist tracks) first; what's left goes to sp.search with
+# bounded concurrency and a rate limit, each distinct request searched
+# once. Players go where the apps read them: saved_assignments.json
+# (batting number and song label, updated by name, so importing a file
+# again updates players instead of adding them twice) and roster.py. Rows
+# with no match and rows whose search failed go to a report, counted
+# separately so a Spotify outage isn't mistaken for bad requests.
+#
+#   python bulk_import.py players.csv [--playlist ID] [--assignments saved_assignments.json]
+#                         [--roster roster.py] [--report unresolved.csv]
+import ast
+import csv
+import json
+import os
+import re
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+from account_pool import TokenBucket
+from catalog import song_label
+from json_files import SAVE_FILE, load_json, save_json
+
+ROSTER_FILE = "roster.py"
+REPORT_FILE = "import_unresolved.csv"
+CHUNK_SIZE = 500        # rows per save
+CONCURRENCY = 8         # searches in flight
+SEARCH_RATE = 5.0       # searches per second
+
+
+# === Reading ===
+def read_players(path):
+    # Yields dicts with name, number and song (or uri) without loading the file
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if path.endswith(('.jsonl', '.json')):
+            first = f.read(1)
+            f.seek(0)
+            if first == '[':
+                # A plain JSON array has to be loaded whole
+                yield from json.load(f)
+                return
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def chunks(rows, size=CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# === Matching ===
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode().lower()
+    text = re.sub(r"\((feat|with)[^)]*\)|\bfeat\.? .*$", " ", text)
+    return " ".join(re.sub(r"[^a-z0-9 ]+", " ", text).split())
+
+
+class Catalog:
+    # Local index of known tracks, keyed by normalized "title artist" and title
+    def __init__(self, tracks=()):
+        self.by_key = {}
+        self.by_title = {}
+        self.by_words = {}
+        self.labels = {}        # uri -> the song label the apps show
+        for t in tracks:
+            self.add(t)
+
+    def add(self, track):
+        self.labels[track['uri']] = song_label(track)
+        title = normalize(track['name'])
+        artist = normalize(track['artists'][0]['name'])
+        key = f"{title} {artist}"
+        self.by_key[key] = track['uri']
+        self.by_title.setdefault(title, set()).add(track['uri'])
+        self.by_words.setdefault(frozenset(key.split()), set()).add(track['uri'])
+
+    def match(self, request):
+        key = normalize(request)
+        if key in self.by_key:
+            return self.by_key[key]
+        uris = self.by_title.get(key)
+        if uris and len(uris) == 1:
+            return next(iter(uris))
+        # "title artist" with the words in any order
+        uris = self.by_words.get(frozenset(key.split()))
+        if uris and len(uris) == 1:
+            return next(iter(uris))
+        return None
+
+
+def playlist_catalog(sp, playlist_id):
+    results = sp.playlist_tracks(playlist_id)
+    items = list(results['items'])
+    while results.get('next'):
+        results = sp.next(results)
+        items.extend(results['items'])
+    return Catalog(item['track'] for item in items if item.get('track'))
+
+
+# === Store ===
+class Store:
+    # saved_assignments.json and roster.py, updated by player name
+    def __init__(self, assignments_path=SAVE_FILE, roster_path=ROSTER_FILE):
+        self.assignments_path = assignments_path
+        self.roster_path = roster_path
+        self.assignments = load_json(assignments_path, {})
+        self.roster = read_roster(roster_path)
+        self.added = 0
+        self.updated = 0
+
+    def upsert(self, name, number, song):
+        entry = self.assignments.get(name)
+        if entry is None:
+            entry = self.assignments[name] = {'batting_number': '', 'song': ''}
+            self.added += 1
+        else:
+            self.updated += 1
+        if number is not None:
+            entry['batting_number'] = str(number)
+        entry['song'] = song
+        if name not in self.roster:
+            self.roster.append(name)
+
+    def save(self):
+        save_json(self.assignments_path, self.assignments)
+        if self.roster_path:
+            write_roster(self.roster_path, self.roster)
+
+
+def roster_node(source):
+    # The roster = [...] assignment in roster.py's source, or None
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.Assign) and any(getattr(t, 'id', None) == 'roster' for t in node.targets):
+            return node
+    return None
+
+
+def read_roster(path):
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        node = roster_node(f.read())
+    return list(ast.literal_eval(node.value)) if node else []
+
+
+def write_roster(path, roster):
+    # Replaces the whole roster = [...] assignment, however many lines it
+    # spans, and keeps everything else in the file
+    source = ""
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            source = f.read()
+    lines = source.splitlines()
+    line = f"roster = {json.dumps(roster, ensure_ascii=False)}"
+    node = roster_node(source)
+    if node:
+        lines[node.lineno - 1:node.end_lineno] = [line]
+    else:
+        lines.append(line)
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+
+def parse_number(value):
+    value = str(value or '').strip()
+    return int(value) if value.isdigit() else None
+
+
+# === Import ===
+def import_players(path, sp, catalog, store, report_path=REPORT_FILE, concurrency=CONCURRENCY,
+                   rate=SEARCH_RATE, progress=None):
+    bucket = TokenBucket(rate, capacity=concurrency)
+    searched = {}       # normalized request (or uri) -> (uri, label) or None, shared by all chunks
+    stats = {'rows': 0, 'imported': 0, 'added': 0, 'updated': 0, 'local': 0, 'search': 0,
+             'unresolved': 0, 'search_errors': 0, 'searches': 0}
+    start = time.perf_counter()
+
+    def search(request):
+        # (uri, label), None for no match; a failed search raises
+        bucket.acquire()
+        items = sp.search(q=request, type='track', limit=1)['tracks']['items']
+        return (items[0]['uri'], song_label(items[0])) if items else None
+
+    def track(uri):
+        bucket.acquire()
+        t = sp.track(uri)
+        return (t['uri'], song_label(t)) if t else None
+
+    with open(report_path, 'w', encoding='utf-8', newline='') as report_file, \
+            ThreadPoolExecutor(max_workers=concurrency) as pool:
+        report = csv.writer(report_file)
+        report.writerow(['line', 'name', 'song', 'reason'])
+        line = 1
+        for chunk in chunks(read_players(path)):
+            resolved = []
+            pending = {}
+            for row in chunk:
+                line += 1
+                stats['rows'] += 1
+                name = (row.get('name') or '').strip()
+                request = (row.get('song') or '').strip()
+                uri = (row.get('uri') or '').strip() or None
+                if not name:
+                    report.writerow([line, '', request, 'missing name'])
+                    stats['unresolved'] += 1
+                    continue
+                found, key = None, None
+                if uri:
+                    # A URI still needs its label; the playlist may have it
+                    found = (uri, catalog.labels[uri]) if uri in catalog.labels else None
+                    key = uri
+                elif request:
+                    match = catalog.match(request)
+                    found = (match, catalog.labels[match]) if match else None
+                    key = normalize(request)
+                source = 'local'
+                if not found and key:
+                    source = 'search'
+                    if key not in searched and key not in pending:
+                        pending[key] = pool.submit(track if uri else search, uri or request)
+                resolved.append((line, name, row, request, key, found, source))
+
+            failed = {}
+            for key, future in pending.items():
+                try:
+                    searched[key] = future.result()
+                except Exception as e:
+                    # Not remembered, so a later row with the same request searches again
+                    failed[key] = f"search failed: {e}"
+            stats['searches'] += len(pending)
+
+            for line_no, name, row, request, key, found, source in resolved:
+                if not found and key:
+                    found = searched.get(key)
+                if not found:
+                    if key in failed:
+                        reason = failed[key]
+                        stats['search_errors'] += 1
+                    else:
+                        reason = 'no song given' if not key else 'no match'
+                        stats['unresolved'] += 1
+                    report.writerow([line_no, name, request or row.get('uri', ''), reason])
+                    continue
+                stats[source] += 1
+                store.upsert(name, parse_number(row.get('number')), found[1])
+                stats['imported'] += 1
+            store.save()
+            stats['added'], stats['updated'] = store.added, store.updated
+            if progress:
+                progress(stats)
+    stats['seconds'] = round(time.perf_counter() - start, 2)
+    return stats
+
+
+def fake_league(path, players=5000, catalog_size=400):
+    # Players with a mix of exact, sloppy and unknown song requests
+    import random
+    from fake_spotify import make_catalog
+
+    tracks = make_catalog(catalog_size)
+    rng = random.Random(1)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(['name', 'number', 'song'])
+        for i in range(players):
+            t = rng.choice(tracks)
+            roll = rng.random()
+            if roll < 0.6:
+                song = f"{t['name']} – {t['artists'][0]['name']}"
+            elif roll < 0.9:
+                song = f"{t['artists'][0]['name']} {t['name']}".upper()
+            else:
+                song = f"Unknown Song {rng.randrange(200)}"
+            w.writerow([f"Player {i}", i % 12 + 1, song])
+    return tracks
+
+
+if __name__ == '__main__':
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Bulk import players and song requests")
+    parser.add_argument('file', nargs='?')
+    parser.add_argument('--playlist', default=os.getenv("SPOTIPY_PLAYLIST_URI", "").split(":")[-1])
+    parser.add_argument('--assignments', default=SAVE_FILE)
+    parser.add_argument('--roster', default=ROSTER_FILE)
+    parser.add_argument('--report', default=REPORT_FILE)
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    parser.add_argument('--fake', action='store_true', help="import 5,000 generated players against the fake client")
+    args = parser.parse_args()
+
+    show = lambda s: print(f"  {s['rows']} rows, {s['imported']} imported, {s['unresolved']} unresolved, "
+                           f"{s['search_errors']} search errors", end='\r')
+    if args.fake:
+        from fake_spotify import FakeSpotify
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "league.csv")
+            tracks = fake_league(path)
+            # Half the league's songs are on the playlist, the rest need a search
+            sp = FakeSpotify(tracks=tracks)
+            catalog = Catalog(tracks[:len(tracks) // 2])
+            store = Store(os.path.join(tmp, SAVE_FILE), os.path.join(tmp, ROSTER_FILE))
+            stats = import_players(path, sp, catalog, store, os.path.join(tmp, REPORT_FILE),
+                                   concurrency=args.concurrency, rate=50, progress=show)
+    else:
+        from dotenv import load_dotenv
+        from spotipy import Spotify
+        from spotipy.oauth2 import SpotifyOAuth
+        load_dotenv()
+        sp = Spotify(auth_manager=SpotifyOAuth(scope="playlist-read-private"))
+        catalog = playlist_catalog(sp, args.playlist) if args.playlist else Catalog()
+        stats = import_players(args.file, sp, catalog, Store(args.assignments, args.roster), args.report,
+                               concurrency=args.concurrency, progress=show)
+    print()
+    print(json.dumps(stats))
@@ -0,0 +1,257 @@
+# call_queue.py
+# Prioritized dispatch in front of the Spotify client. Playback control
+# (start/pause/skip) is INTERACTIVE and goes first; volume fades, preloads
+# and confirmation polls are NORMAL; playlist sync, searches and other
+# catalog work are BACKGROUND. A few worker threads make the calls, and one
+# of them is kept for INTERACTIVE calls only, so a Stop press never waits
+# for a catalog page to come back. After a 429 only INTERACTIVE calls go
+# out until Retry-After has passed, and lower priority calls that hit it
+# are requeued behind the backoff instead of failing.
+#
+#   with priority(INTERACTIVE):     # everything this thread calls, e.g. a
+#       resolve_uri(sp, song)       # search on the "Next Batter" path
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+INTERACTIVE, NORMAL, BACKGROUND = 0, 1, 2
+LEVELS = {INTERACTIVE: 'interactive', NORMAL: 'normal', BACKGROUND: 'background'}
+WORKERS = 4             # calls in flight, like the HTTP connection pool
+RESERVED = 1            # workers only INTERACTIVE calls may use
+MAX_RETRIES = 3         # 429s a lower priority call sits out before failing
+DEFAULT_BACKOFF = 1.0   # seconds, when a 429 has no Retry-After
+WAIT_HISTORY = 1000
+
+# Calls not listed here are BACKGROUND
+CALL_PRIORITY = {
+    'start_playback': INTERACTIVE, 'pause_playback': INTERACTIVE, 'next_track': INTERACTIVE,
+    'seek_track': INTERACTIVE, 'transfer_playback': INTERACTIVE,
+    'volume': NORMAL, 'add_to_queue': NORMAL, 'current_playback': NORMAL, 'devices': NORMAL,
+}
+
+_local = threading.local()
+
+
+@contextmanager
+def priority(level):
+    # Overrides the per-call priority for every call this thread makes
+    previous = getattr(_local, 'level', None)
+    _local.level = level
+    try:
+        yield
+    finally:
+        _local.level = previous
+
+
+def current_priority():
+    # The level priority(...) set on this thread, or None
+    return getattr(_local, 'level', None)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class PriorityClient:
+    def __init__(self, sp, workers=WORKERS, reserved=RESERVED, bucket=None, clock=time.monotonic):
+        self.sp = sp
+        self.workers = workers
+        self.reserved = min(reserved, workers - 1)
+        # Optional TokenBucket(s), spent in priority order
+        self.buckets = [] if bucket is None else list(bucket) if isinstance(bucket, (list, tuple)) else [bucket]
+        self.clock = clock
+        self.cond = threading.Condition()
+        self.heap = []
+        self.seq = itertools.count()
+        self.busy_low = 0           # workers running a non-INTERACTIVE call
+        self.backoff_until = 0.0
+        self.waits = {level: deque(maxlen=WAIT_HISTORY) for level in LEVELS}
+        self.throttled = 0
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"spotify-call-{i}", daemon=True).start()
+
+    def __getattr__(self, attr):
+        fn = getattr(self.sp, attr)
+        if not callable(fn):
+            return fn
+
+        def call(*args, **kwargs):
+            if getattr(_local, 'worker', False):
+                # Already on a worker (a nested call): queueing would deadlock
+                return fn(*args, **kwargs)
+            level = current_priority()
+            return self.submit(CALL_PRIORITY.get(attr, BACKGROUND) if level is None else level, fn, args, kwargs)
+        return call
+
+    def submit(self, level, fn, args=(), kwargs=None):
+        job = {'level': level, 'fn': fn, 'args': args, 'kwargs': kwargs or {}, 'queued': self.clock(),
+               'tries': 0, 'done': threading.Event()}
+        with self.cond:
+            heapq.heappush(self.heap, (level, next(self.seq), job))
+            self.cond.notify_all()
+        job['done'].wait()
+        if 'error' in job:
+            raise job['error']
+        return job['result']
+
+    # === Dispatch ===
+    def _take(self):
+        # Returns (job, 0) or (None, seconds to wait); called under cond
+        if not self.heap:
+            return None, None
+        level, _, job = self.heap[0]
+        if level != INTERACTIVE:
+            now = self.clock()
+            if now < self.backoff_until:
+                return None, self.backoff_until - now
+            if self.busy_low >= self.workers - self.reserved:
+                return None, None
+            for i, bucket in enumerate(self.buckets):
+                wait = bucket.try_acquire()
+                if wait:
+                    # The call waits, so the buckets that did grant a token get it back
+                    for taken in self.buckets[:i]:
+                        taken.give_back()
+                    return None, wait
+        else:
+            # Playback control always goes out; it just spends a token if there is one
+            for bucket in self.buckets:
+                bucket.try_acquire()
+        heapq.heappop(self.heap)
+        if level != INTERACTIVE:
+            self.busy_low += 1
+        if not job['tries']:
+            self.waits[level].append(self.clock() - job['queued'])
+        return job, 0
+
+    def _work(self):
+        _local.worker = True
+        while True:
+            with self.cond:
+                job, wait = self._take()
+                while job is None:
+                    self.cond.wait(wait)
+                    job, wait = self._take()
+            try:
+                job['result'] = job['fn'](*job['args'], **job['kwargs'])
+            except Exception as e:
+                if getattr(e, 'http_status', None) == 429 and self._throttled(job, e):
+                    continue
+                job['error'] = e
+            finally:
+                if job['level'] != INTERACTIVE:
+                    with self.cond:
+                        self.busy_low -= 1
+                        self.cond.notify_all()
+            job['done'].set()
+
+    def _throttled(self, job, e):
+        # Starts a backoff; returns True when the job was requeued behind it
+        headers = getattr(e, 'headers', None) or {}
+        try:
+            retry_after = float(headers.get('Retry-After', DEFAULT_BACKOFF))
+        except (TypeError, ValueError):
+            retry_after = DEFAULT_BACKOFF
+        with self.cond:
+            self.throttled += 1
+            self.backoff_until = max(self.backoff_until, self.clock() + retry_after)
+            if job['level'] == INTERACTIVE or job['tries'] >= MAX_RETRIES:
+                return False
+            job['tries'] += 1
+            heapq.heappush(self.heap, (job['level'], next(self.seq), job))
+            self.cond.notify_all()
+        return True
+
+    def stats(self):
+        with self.cond:
+            queued = {name: 0 for name in LEVELS.values()}
+            for level, _, _ in self.heap:
+                queued[LEVELS[level]] += 1
+            waits = {level: list(w) for level, w in self.waits.items()}
+            backoff = max(0.0, self.backoff_until - self.clock())
+        out = {'queued': queued, 'throttled': self.throttled, 'backoff_s': round(backoff, 2), 'wait_ms': {}}
+        for level, values in waits.items():
+            if values:
+                out['wait_ms'][LEVELS[level]] = {
+                    'count': len(values), 'p50': round(percentile(values, 50) * 1000, 2),
+                    'p99': round(percentile(values, 99) * 1000, 2), 'max': round(max(values) * 1000, 2)}
+        return out
+
+
+def under_limiters(sp, limiters, **kwargs):
+    # Puts the queue below the rate-limited caches (account_pool and
+    # shared_limiter AccountClients, innermost first) and takes over their
+    # buckets: cache hits still answer at once, and the budget is spent here
+    # in priority order, not first-come in each caller's thread. Returns
+    # (the client to use, the PriorityClient).
+    if not limiters:
+        queue = PriorityClient(sp, **kwargs)
+        return queue, queue
+    queue = PriorityClient(limiters[0].sp, bucket=[c.bucket for c in limiters], **kwargs)
+    limiters[0].sp = queue
+    for client in limiters:
+        client.bucket = None
+    return sp, queue
+
+
+# === Benchmark: a Stop press during a catalog refresh ===
+def stop_latencies(sp, presses=20, syncers=6, pages=40):
+    stop_at = []
+
+    def sync():
+        for _ in range(pages):
+            sp.playlist_tracks("league")
+
+    threads = [threading.Thread(target=sync) for _ in range(syncers)]
+    for t in threads:
+        t.start()
+    time.sleep(0.2)
+    for _ in range(presses):
+        start = time.perf_counter()
+        sp.pause_playback()
+        stop_at.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.1)
+    for t in threads:
+        t.join()
+    return stop_at
+
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+    from account_pool import AccountClient, ResponseCache, TokenBucket
+    from breaker import CircuitBreaker, GuardedClient, MeteredClient
+    from fake_spotify import FakeSpotify
+    from shared_limiter import shared_client
+
+    RATE = 20
+    print(f"Stop presses while 6 threads sync a playlist, {RATE} calls/s budget, 50 ms API latency")
+    direct = AccountClient('direct', FakeSpotify(api_latency=0.05), TokenBucket(RATE, 5), ResponseCache(),
+                           cached_calls=())
+    queued = PriorityClient(FakeSpotify(api_latency=0.05), bucket=TokenBucket(RATE, 5))
+    for name, client in (('shared limiter', direct), ('priority queue', queued)):
+        ms = stop_latencies(client)
+        print(f"  {name:<22} stop p50 {percentile(ms, 50):7.1f} ms   p99 {percentile(ms, 99):7.1f} ms")
+    print(f"  queue waits: {queued.stats()['wait_ms']}")
+
+    # app2's stack with WALKUP_SHARED_DB: the queue on top of the shared
+    # limiter (each caller waits for a token before the queue sees the call)
+    # and under it (the queue spends the tokens)
+    print(f"app2 stack with the shared limiter, {RATE} calls/s budget")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, below in (('queue over the limiter', False), ('queue under the limiter', True)):
+            breaker = CircuitBreaker()
+            shared = shared_client(MeteredClient(FakeSpotify(api_latency=0.05), breaker),
+                                   os.path.join(tmp, f"{below}.db"), rate=RATE, burst=5)
+            shared.cached_calls = ()    # every page a real call, as on a cold cache
+            if below:
+                client, _ = under_limiters(shared, [shared])
+            else:
+                client = PriorityClient(shared)
+            ms = stop_latencies(GuardedClient(client, breaker))
+            print(f"  {name:<24} stop p50 {percentile(ms, 50):7.1f} ms   p99 {percentile(ms, 99):7.1f} ms   "
+                  f"breaker {breaker.snapshot()['state']}")
@@ -0,0 +1,315 @@
+# catalog.py
+# One song catalog for the whole league, built from every team's playlist.
+# PLAYLISTS_FILE says which playlists each team curates:
+#
+#   {"Tigers": "spotify:playlist:37i9dQZF1DX...", "Bears": ["5Xq...", "1Ab..."]}
+#
+# The same track shows up in many teams' playlists, so the merged index is
+# keyed by track ID and counts which playlists hold each track; every team
+# still gets its own view (songs(team)) in its playlists' order. A sync
+# asks each playlist for its snapshot_id and refetches only the ones that
+# changed, and a changed playlist is merged by adding the tracks it gained
+# and releasing the ones it lost, so the index is never rebuilt. The
+# catalog is kept in CATALOG_FILE, so the apps start (and play cached clips)
+# with Spotify down.
+#
+#   python catalog.py sync | teams | songs [team]
+#   python catalog.py bench [--teams 40] [--tracks 60]
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from account_pool import fresh
+from json_files import load_json, save_json
+
+PLAYLISTS_FILE = "playlists.json"
+CATALOG_FILE = "league_catalog.json"
+DEFAULT_PLAYLIST = os.getenv("SPOTIPY_PLAYLIST_URI", "")
+SYNC_WORKERS = 8        # snapshot checks and playlist fetches in flight
+SYNC_INTERVAL = 300     # seconds between background syncs
+
+
+def playlist_id(value):
+    # Accepts a playlist ID, URI or URL
+    return value.rstrip('/').split('?')[0].split('/')[-1].split(':')[-1]
+
+
+def load_playlists(path=PLAYLISTS_FILE, default=DEFAULT_PLAYLIST):
+    # team -> [playlist id]; without a playlists file the one playlist is the
+    # "default" team's
+    teams = load_json(path, {})
+    if not teams and default:
+        teams = {'default': default}
+    return {team: [playlist_id(p) for p in ([ids] if isinstance(ids, str) else ids) if p]
+            for team, ids in teams.items()}
+
+
+def song_label(track):
+    # How the apps show and store a song
+    return f"{track['name']} – {track['artists'][0]['name']}"
+
+
+def fetch_tracks(sp, pid):
+    results = sp.playlist_tracks(pid)
+    items = list(results['items'])
+    while results.get('next'):
+        results = sp.next(results)
+        items.extend(results['items'])
+    return [item['track'] for item in items if item.get('track') and item['track'].get('id')]
+
+
+class FederatedCatalog:
+    def __init__(self, sp, teams=None, path=CATALOG_FILE, workers=SYNC_WORKERS):
+        self.sp = sp
+        self.teams = load_playlists() if teams is None else teams
+        self.path = path
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.playlists = {}     # id -> {'snapshot_id', 'tracks': [track id, ...]}
+        self.tracks = {}        # track id -> {'uri', 'song'}
+        self.refs = {}          # track id -> ids of the playlists holding it
+        self.by_song = {}       # song label -> track ids with that label
+        self.views = {}         # team -> (its playlists' snapshot ids, songs)
+        self.version = 0
+        self.stats_counts = {'syncs': 0, 'checked': 0, 'fetched': 0, 'added': 0, 'removed': 0}
+        self._load()
+
+    # === Disk ===
+    def _load(self):
+        saved = load_json(self.path, {}) if self.path else {}
+        tracks = saved.get('tracks', {})
+        for pid, playlist in saved.get('playlists', {}).items():
+            self._merge(pid, playlist['snapshot_id'], [dict(tracks[t], id=t) for t in playlist['tracks'] if t in tracks])
+
+    def _save(self):
+        # Called with the lock held
+        if self.path:
+            save_json(self.path, {'playlists': self.playlists, 'tracks': self.tracks})
+
+    # === Merging ===
+    def _merge(self, pid, snapshot_id, tracks):
+        # Called with the lock held (or from __init__): applies one playlist's
+        # new contents to the index; returns (added, removed) track counts
+        old = self.playlists.get(pid, {}).get('tracks', [])
+        new = list(dict.fromkeys(t['id'] for t in tracks))
+        gained, lost = set(new) - set(old), set(old) - set(new)
+        for track in tracks:
+            if track['id'] in gained:
+                self._hold(pid, track)
+        for track_id in lost:
+            self._release(pid, track_id)
+        self.playlists[pid] = {'snapshot_id': snapshot_id, 'tracks': new}
+        self.version += 1
+        return len(gained), len(lost)
+
+    def _hold(self, pid, track):
+        track_id = track['id']
+        if track_id not in self.tracks:
+            song = track.get('song') or song_label(track)
+            self.tracks[track_id] = {'uri': track['uri'], 'song': song}
+            if track.get('preview_url'):
+                # For loudness analysis of tracks with no local audio (prewarm.py)
+                self.tracks[track_id]['preview_url'] = track['preview_url']
+            self.by_song.setdefault(song, set()).add(track_id)
+        self.refs.setdefault(track_id, set()).add(pid)
+
+    def _release(self, pid, track_id):
+        holders = self.refs.get(track_id)
+        if holders is None:
+            return
+        holders.discard(pid)
+        if holders:
+            return
+        # No playlist has it any more
+        del self.refs[track_id]
+        song = self.tracks.pop(track_id)['song']
+        ids = self.by_song.get(song)
+        if ids:
+            ids.discard(track_id)
+            if not ids:
+                del self.by_song[song]
+
+    # === Syncing ===
+    def playlist_ids(self):
+        return list(dict.fromkeys(pid for ids in self.teams.values() for pid in ids))
+
+    def sync(self, force=False):
+        # Checks every playlist's snapshot_id and refetches the changed ones;
+        # returns the ids of the playlists that changed
+        pids = self.playlist_ids()
+
+        def check(pid):
+            try:
+                snapshot_id = self.sp.playlist(pid, fields='snapshot_id')['snapshot_id']
+            except Exception as e:
+                print(f"⚠️ Could not check playlist {pid}: {e}")
+                return pid, None, None
+            if not force and self.playlists.get(pid, {}).get('snapshot_id') == snapshot_id:
+                return pid, snapshot_id, None
+            try:
+                # The response caches would hand back the old snapshot's pages
+                with fresh():
+                    return pid, snapshot_id, fetch_tracks(self.sp, pid)
+            except Exception as e:
+                print(f"⚠️ Could not load playlist {pid}: {e}")
+                return pid, None, None
+
+        changed = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(check, pids))
+        with self.lock:
+            self.stats_counts['syncs'] += 1
+            self.stats_counts['checked'] += len(pids)
+            for pid, snapshot_id, tracks in results:
+                if tracks is None:
+                    continue
+                added, removed = self._merge(pid, snapshot_id, tracks)
+                self.stats_counts['fetched'] += 1
+                self.stats_counts['added'] += added
+                self.stats_counts['removed'] += removed
+                changed.append(pid)
+            # Playlists no team uses any more
+            for pid in set(self.playlists) - set(pids):
+                self._merge(pid, None, [])
+                del self.playlists[pid]
+                changed.append(pid)
+            if changed:
+                self._save()
+        if changed:
+            print(f"🔄 Catalog: {len(changed)} of {len(pids)} playlists changed, {len(self.tracks)} songs")
+        return changed
+
+    def start_polling(self, interval=SYNC_INTERVAL, on_change=None):
+        def poll():
+            while True:
+                time.sleep(interval)
+                try:
+                    changed = self.sync()
+                except Exception as e:
+                    print(f"⚠️ Catalog sync failed: {e}")
+                    continue
+                if changed and on_change:
+                    on_change(changed)
+        threading.Thread(target=poll, name="catalog-sync", daemon=True).start()
+
+    # === Views ===
+    def songs(self, team=None):
+        # Every song in the league, or one team's in its playlists' order
+        with self.lock:
+            if team is None or team not in self.teams:
+                return list(self.by_song)
+            pids = self.teams[team]
+            key = tuple(self.playlists.get(pid, {}).get('snapshot_id') for pid in pids)
+            cached = self.views.get(team)
+            if cached and cached[0] == key:
+                return cached[1]
+            ids = dict.fromkeys(t for pid in pids for t in self.playlists.get(pid, {}).get('tracks', []))
+            songs = list(dict.fromkeys(self.tracks[t]['song'] for t in ids if t in self.tracks))
+            self.views[team] = (key, songs)
+            return songs
+
+    def uri_for(self, song):
+        # The track a song label means; when tracks share a label, the one on
+        # the most playlists
+        with self.lock:
+            ids = self.by_song.get(song)
+            if not ids:
+                return None
+            best = max(ids, key=lambda t: (len(self.refs.get(t, ())), t))
+            return self.tracks[best]['uri']
+
+    def uris(self):
+        # song label -> URI, for preload's URI cache
+        with self.lock:
+            songs = list(self.by_song)
+        return {song: self.uri_for(song) for song in songs}
+
+    def teams_of(self, song):
+        with self.lock:
+            holders = set().union(*(self.refs.get(t, set()) for t in self.by_song.get(song, ())))
+            return [team for team, pids in self.teams.items() if holders & set(pids)]
+
+    def stats(self):
+        with self.lock:
+            return {'teams': len(self.teams), 'playlists': len(self.playlists), 'songs': len(self.by_song),
+                    'tracks': len(self.tracks), 'version': self.version, **self.stats_counts}
+
+
+# === Benchmark: a league of overlapping team playlists ===
+def bench(teams=40, per_team=60, pool_size=400):
+    import random
+    import tempfile
+    from fake_spotify import FakeSpotify, make_catalog
+
+    rng = random.Random(5)
+    pool = make_catalog(pool_size)
+    sp = FakeSpotify(tracks=pool, api_latency=0.02)
+    team_playlists = {f"Team {i:02d}": [f"pl{i:02d}"] for i in range(teams)}
+    for i in range(teams):
+        sp.playlists[f"pl{i:02d}"] = rng.sample(pool, per_team)
+    path = os.path.join(tempfile.mkdtemp(), CATALOG_FILE)
+    catalog = FederatedCatalog(sp, team_playlists, path=path)
+
+    def timed_sync(label):
+        sp.call_counts.clear()
+        start = time.perf_counter()
+        changed = catalog.sync()
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<28} {elapsed * 1000:7.0f} ms  {len(changed):>3} refetched  "
+              f"{sp.call_counts.get('playlist_tracks', 0):>4} page calls  {len(catalog.tracks)} tracks")
+
+    timed_sync("first sync")
+    timed_sync("nothing changed")
+    for i in rng.sample(range(teams), 3):
+        tracks = sp.playlists[f"pl{i:02d}"]
+        tracks[rng.randrange(len(tracks))] = rng.choice(pool)
+        tracks.append(rng.choice(pool))
+    timed_sync("3 playlists edited")
+
+    # Merge cost alone: one changed playlist folded in vs. the index rebuilt
+    pid = "pl00"
+    edits = [sp.playlists[pid], sp.playlists[pid][1:] + [rng.choice(pool)]]
+    start = time.perf_counter()
+    for i in range(100):
+        with catalog.lock:
+            catalog._merge(pid, 'bench', edits[i % 2])
+    merge_us = (time.perf_counter() - start) / 100 * 1e6
+    everything = {p: sp.playlists[p] for p in catalog.playlists}
+    start = time.perf_counter()
+    for _ in range(100):
+        rebuilt = FederatedCatalog(sp, team_playlists, path=None)
+        for p, t in everything.items():
+            rebuilt._merge(p, 'bench', t)
+    rebuild_us = (time.perf_counter() - start) / 100 * 1e6
+    start = time.perf_counter()
+    for _ in range(1000):
+        catalog.songs(f"Team {rng.randrange(teams):02d}")
+    view_us = (time.perf_counter() - start) / 1000 * 1e6
+    print(f"  merge one playlist {merge_us:.0f} µs   rebuild the index {rebuild_us:.0f} µs   team view {view_us:.1f} µs")
+    print(f"  {catalog.stats()}")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    command = args[0] if args else 'sync'
+    if command == 'bench':
+        opts = {'--teams': 40, '--tracks': 60}
+        for i in range(1, len(args) - 1, 2):
+            if args[i] in opts:
+                opts[args[i]] = int(args[i + 1])
+        print("Federated catalog sync")
+        bench(opts['--teams'], opts['--tracks'])
+        sys.exit(0)
+    from walkup_app import make_client
+    catalog = FederatedCatalog(make_client())
+    if command == 'sync':
+        catalog.sync(force='--force' in args)
+        print(catalog.stats())
+    elif command == 'teams':
+        for team, pids in catalog.teams.items():
+            print(f"{team:<20} {len(catalog.songs(team)):>4} songs  {', '.join(pids)}")
+    elif command == 'songs':
+        for song in catalog.songs(args[1] if len(args) > 1 else None):
+            print(song)
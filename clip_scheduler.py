@@ -0,0 +1,116 @@
+# clip_scheduler.py
+# Owns "what is playing now". Every clip, batter walk-up or music program,
+# starts through play(), which preempts whatever was playing and arms one
+# timer for the fade-out. Each play bumps a generation number, so a timer
+# or fade belonging to a clip that has since been replaced does nothing
+# instead of stopping the new one. The player is called outside the lock,
+# so a Stop press never waits on a slow play; a play that was overtaken by
+# a newer play or stop while it was starting is not made current.
+import threading
+import time
+
+FADE_SECONDS = 2.0
+
+
+class ClipScheduler:
+    def __init__(self, player, fade_seconds=FADE_SECONDS, on_stop=None):
+        self.player = player
+        self.fade_seconds = fade_seconds
+        self.on_stop = on_stop      # called with the clip after it stops
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.current = None
+        self.timer = None
+        self.stopped_generation = 0     # generation stop() last set
+
+    def _arm(self, seconds, generation):
+        if self.timer:
+            self.timer.cancel()
+        self.timer = threading.Timer(max(0, seconds), self._expire, args=(generation,))
+        self.timer.daemon = True
+        self.timer.start()
+
+    def play(self, uri, duration, kind='batter', label=None, position_ms=0, volume=None, device_id=None, **meta):
+        # meta is kept on the clip and handed back to on_stop (e.g. its play-history entry)
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+        try:
+            backend = self.player.play(uri, position_ms=position_ms, device_id=device_id, volume=volume)
+        except Exception:
+            with self.lock:
+                # The old clip (if any) is still on, so it keeps its fade-out
+                if generation == self.generation and self.current:
+                    remaining = self.current['duration'] - (time.time() - self.current['started'])
+                    self._arm(remaining, generation)
+            raise
+        clip = {'uri': uri, 'kind': kind, 'label': label, 'duration': duration,
+                'device_id': device_id, 'started': time.time(), 'backend': backend, **meta}
+        with self.lock:
+            overtaken = generation != self.generation
+            if not overtaken:
+                previous, self.current = self.current, clip
+                self._arm(duration, generation)
+            stop_again = overtaken and self.stopped_generation == self.generation
+        if overtaken:
+            # A newer press won; if it was a stop, it may have reached the
+            # player before this play did
+            if stop_again:
+                try:
+                    self.player.stop(device_id=device_id)
+                except Exception as e:
+                    print(f"⚠️ Stop after an overtaken play failed: {e}")
+            self._stopped(clip, 'preempted')
+            return backend
+        self._stopped(previous, 'preempted')
+        return backend
+
+    def adopt(self, clip, remaining):
+        # Takes over a clip started by an earlier run (see journal.py), so it
+        # still gets its fade-out
+        with self.lock:
+            self.generation += 1
+            self.current = dict(clip)
+            self._arm(remaining, self.generation)
+
+    def _stopped(self, clip, reason):
+        if clip and self.on_stop:
+            clip['ended'] = reason      # 'expired', 'stopped' or 'preempted'
+            self.on_stop(clip)
+
+    def _expire(self, generation):
+        with self.lock:
+            if generation != self.generation or self.current is None:
+                return
+            clip = self.current
+        try:
+            finished = self.player.fade_out(self.fade_seconds, device_id=clip.get('device_id'),
+                                            cancelled=lambda: generation != self.generation)
+        except Exception as e:
+            print(f"⚠️ Fade-out failed: {e}")
+            finished = True
+        with self.lock:
+            if not finished or generation != self.generation:
+                return
+            self.current = None
+        self._stopped(clip, 'expired')
+
+    def stop(self, device_id=None):
+        with self.lock:
+            self.generation += 1
+            self.stopped_generation = self.generation
+            if self.timer:
+                self.timer.cancel()
+            clip, self.current = self.current, None
+        try:
+            self.player.stop(device_id=device_id)
+        finally:
+            self._stopped(clip, 'stopped')
+
+    def status(self):
+        with self.lock:
+            if not self.current:
+                return None
+            clip = {k: v for k, v in self.current.items() if k != 'play'}
+        clip['remaining'] = round(max(0, clip['duration'] - (time.time() - clip['started'])), 1)
+        return clip
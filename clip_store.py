@@ -0,0 +1,367 @@
+# clip_store.py
+# Keeps only the part of each track that is ever played: the walk-up
+# window, start_ms for duration_ms (app.py's Player.start_ms and
+# duration_sec). Windows are 16-bit PCM WAV so LocalAudioBackend can
+# memory-map them like full clips, at a seventh of a track's size, and are
+# keyed by URI, offset and duration, so moving a player's offset caches a
+# new window instead of overwriting the old one. The store has a disk
+# budget and evicts the least recently played windows to stay under it.
+# Every window has a checksum that is verified before it is first played
+# in a process; a bad one is dropped and filled again.
+#
+# fill() cuts windows from the full tracks in CLIP_DIR on a thread pool,
+# in the background, with the same window requested twice cut once. A
+# window can also come without its full track: cut from a stored window
+# that covers it, or added from a WAV of just the walk-up part. Once a
+# track's window is stored, prune() deletes the full track from CLIP_DIR
+# (its window can then only be re-cut from a window that covers it).
+#
+#   python clip_store.py fill [--prune] [uri ...]   (every track in CLIP_DIR by default)
+#   python clip_store.py add <uri> <window.wav> [start_ms]
+#   python clip_store.py prune | stats | verify
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+from file_lock import locked
+from local_audio import CLIP_DIR, PLAY_MS, clip_path
+
+STORE_DIR = "clip_store"
+INDEX_FILE = "index.json"
+BUDGET_MB = float(os.getenv("WALKUP_CLIP_BUDGET_MB", "1024"))
+WINDOW_MS = PLAY_MS     # MAX_PLAY_TIME plus the fade-out
+FILL_WORKERS = 4
+TOUCH_SAVE_INTERVAL = 30  # seconds between index writes for play-order updates alone
+STALE_TMP = 600         # seconds before a half-written window is cleaned up
+
+
+def window_key(uri, start_ms, duration_ms):
+    return f"{uri}|{int(start_ms)}|{int(duration_ms)}"
+
+
+def checksum(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def track_window(uri, start_ms, duration_ms, clip_dir=CLIP_DIR):
+    # Cuts the window out of a full track in clip_dir: (frames, rate, channels, sampwidth)
+    path = clip_path(uri, clip_dir)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No local audio for {uri}")
+    return cut(path, start_ms, duration_ms)
+
+
+def cut(path, offset_ms, duration_ms):
+    with wave.open(path, 'rb') as w:
+        rate = w.getframerate()
+        w.setpos(min(w.getnframes(), rate * offset_ms // 1000))
+        frames = w.readframes(rate * duration_ms // 1000)
+        return frames, rate, w.getnchannels(), w.getsampwidth()
+
+
+class ClipStore:
+    def __init__(self, store_dir=STORE_DIR, budget_mb=BUDGET_MB, source=track_window, workers=FILL_WORKERS):
+        self.store_dir = store_dir
+        self.budget = int(budget_mb * 2 ** 20)
+        self.source = source        # (uri, start_ms, duration_ms) -> frames, rate, channels, sampwidth
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='clip-fill')
+        self.filling = {}           # key -> Future, so a window is only cut once at a time
+        self.verified = set()       # keys checked since this process started
+        self.stats_counts = {'hits': 0, 'misses': 0, 'filled': 0, 'evicted': 0, 'corrupt': 0, 'no_source': 0}
+        self.saved_at = 0.0
+        self.on_drop = []           # callables(path) run before a window file is deleted
+        os.makedirs(store_dir, exist_ok=True)
+        self.entries = self._load()
+
+    # === Index ===
+    def _index_path(self):
+        return os.path.join(self.store_dir, INDEX_FILE)
+
+    def _load(self):
+        # The directory is the truth and the index remembers checksums and play
+        # order, so windows another process (prewarm.py) cut are picked up too
+        with locked(self._index_path()):
+            index = self._read_index()
+        by_file = {e['file']: e for e in index.values()}
+        entries = {}
+        for name in os.listdir(self.store_dir):
+            full = os.path.join(self.store_dir, name)
+            if name.endswith('.tmp'):
+                # Left over from an interrupted fill
+                if time.time() - os.path.getmtime(full) > STALE_TMP:
+                    os.remove(full)
+                continue
+            if not name.endswith('.wav'):
+                continue
+            entry = by_file.get(name)
+            if entry is None:
+                track_id, start_ms, duration_ms = name[:-4].rsplit('_', 2)
+                entry = {'uri': f"spotify:track:{track_id}", 'start_ms': int(start_ms),
+                         'duration_ms': int(duration_ms), 'file': name, 'bytes': os.path.getsize(full),
+                         'checksum': checksum(full), 'last_used': os.path.getmtime(full)}
+            entries[window_key(entry['uri'], entry['start_ms'], entry['duration_ms'])] = entry
+        return entries
+
+    def reload(self):
+        with self.lock:
+            self.entries = self._load()
+            self.verified &= set(self.entries)
+            self._evict()
+            self._save()
+
+    def _read_index(self):
+        path = self._index_path()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                try:
+                    return json.load(f)
+                except json.JSONDecodeError:
+                    print("⚠️ Clip store index is invalid, rebuilding it.")
+        return {}
+
+    def _save(self):
+        # Called with the lock held. app2, prewarm.py and clip_store.py fill
+        # all write the index, so each merges into what is on disk under a
+        # file lock, through its own temp file; windows another process cut
+        # keep their entries
+        path = self._index_path()
+        with locked(path):
+            index = {key: entry for key, entry in self._read_index().items()
+                     if key not in self.entries and os.path.exists(os.path.join(self.store_dir, entry['file']))}
+            index.update(self.entries)
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=self.store_dir, prefix=INDEX_FILE + '.',
+                                             suffix='.tmp', delete=False) as f:
+                json.dump(index, f)
+            os.replace(f.name, path)
+        self.saved_at = time.monotonic()
+
+    def size(self):
+        with self.lock:
+            return sum(e['bytes'] for e in self.entries.values())
+
+    # === Lookup ===
+    def find(self, uri, position_ms=0, needed_ms=0):
+        # The stored window of uri with audio from position_ms for needed_ms, if any
+        with self.lock:
+            best = None
+            for e in self.entries.values():
+                end = e['start_ms'] + e['duration_ms']
+                if (e['uri'] == uri and e['start_ms'] <= position_ms < end
+                        and position_ms + needed_ms <= end):
+                    if best is None or e['last_used'] > best['last_used']:
+                        best = e
+            self.stats_counts['hits' if best else 'misses'] += 1
+            return dict(best) if best else None
+
+    def has(self, uri):
+        with self.lock:
+            return any(e['uri'] == uri for e in self.entries.values())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def open(self, entry):
+        # Path of a window to play, or None if it's gone or fails its checksum
+        key = window_key(entry['uri'], entry['start_ms'], entry['duration_ms'])
+        path = os.path.join(self.store_dir, entry['file'])
+        if key not in self.verified and not self.verify(key):
+            return None
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries[key]['last_used'] = time.time()
+            if time.monotonic() - self.saved_at > TOUCH_SAVE_INTERVAL:
+                self._save()
+        return path
+
+    def verify(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return False
+        path = os.path.join(self.store_dir, entry['file'])
+        try:
+            ok = checksum(path) == entry['checksum']
+        except OSError:
+            ok = False
+        if ok:
+            self.verified.add(key)
+            return True
+        print(f"⚠️ Clip window for {entry['uri']} at {entry['start_ms']} ms failed its checksum, refilling it")
+        with self.lock:
+            self.stats_counts['corrupt'] += 1
+            self._drop(key)
+            self._save()
+        self.fill([(entry['uri'], entry['start_ms'], entry['duration_ms'])])
+        return False
+
+    def verify_all(self):
+        with self.lock:
+            keys = [k for k in self.entries if k not in self.verified]
+        return sum(1 for k in keys if not self.verify(k))
+
+    # === Filling ===
+    def add(self, uri, path, start_ms=0):
+        # A window cut elsewhere (just the walk-up part), for a track with no full copy here
+        with wave.open(path, 'rb') as w:
+            duration_ms = w.getnframes() * 1000 // w.getframerate()
+        frames, rate, channels, sampwidth = cut(path, 0, duration_ms)
+        return self.put(uri, start_ms, duration_ms, frames, rate, channels, sampwidth)
+
+    def put(self, uri, start_ms, duration_ms, frames, rate, channels, sampwidth):
+        key = window_key(uri, start_ms, duration_ms)
+        name = f"{uri.split(':')[-1]}_{int(start_ms)}_{int(duration_ms)}.wav"
+        path = os.path.join(self.store_dir, name)
+        tmp = path + ".tmp"
+        with wave.open(tmp, 'wb') as w:
+            w.setnchannels(channels)
+            w.setsampwidth(sampwidth)
+            w.setframerate(rate)
+            w.writeframes(frames)
+        entry = {'uri': uri, 'start_ms': int(start_ms), 'duration_ms': int(duration_ms), 'file': name,
+                 'bytes': os.path.getsize(tmp), 'checksum': checksum(tmp), 'last_used': time.time()}
+        os.replace(tmp, path)
+        with self.lock:
+            self.entries[key] = entry
+            self.verified.add(key)
+            self.stats_counts['filled'] += 1
+            self._evict(keep=key)
+            self._save()
+        return entry
+
+    def fill(self, windows):
+        # Cuts (uri, start_ms, duration_ms) windows in the background; returns the futures
+        futures = []
+        with self.lock:
+            for uri, start_ms, duration_ms in windows:
+                key = window_key(uri, start_ms, duration_ms)
+                if key in self.entries:
+                    continue
+                if key not in self.filling:
+                    future = self.pool.submit(self._fill_one, key, uri, int(start_ms), int(duration_ms))
+                    self.filling[key] = future
+                futures.append(self.filling[key])
+        return futures
+
+    def _fill_one(self, key, uri, start_ms, duration_ms):
+        try:
+            try:
+                audio = self.source(uri, start_ms, duration_ms)
+            except FileNotFoundError:
+                audio = self._from_window(uri, start_ms, duration_ms)
+            return self.put(uri, start_ms, duration_ms, *audio)
+        except FileNotFoundError:
+            with self.lock:
+                self.stats_counts['no_source'] += 1
+        except Exception as e:
+            print(f"⚠️ Could not store the clip window for {uri}: {e}")
+        finally:
+            with self.lock:
+                self.filling.pop(key, None)
+
+    def _from_window(self, uri, start_ms, duration_ms):
+        # No full track: cut from a stored window that covers this one
+        entry = self.find(uri, start_ms, duration_ms)
+        path = self.open(entry) if entry else None
+        if not path:
+            raise FileNotFoundError(f"No local audio for {uri} at {start_ms} ms")
+        return cut(path, start_ms - entry['start_ms'], duration_ms)
+
+    def prune(self, windows, clip_dir=CLIP_DIR):
+        # Deletes the full tracks in clip_dir whose (uri, start_ms, duration_ms)
+        # window is stored and passes its checksum; returns the bytes freed
+        freed = 0
+        for uri, start_ms, duration_ms in windows:
+            key = window_key(uri, start_ms, duration_ms)
+            path = clip_path(uri, clip_dir)
+            with self.lock:
+                stored = key in self.entries
+            if not stored or not os.path.exists(path) or (key not in self.verified and not self.verify(key)):
+                continue
+            size = os.path.getsize(path)
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"⚠️ Could not prune {path}: {e}")
+                continue
+            freed += size
+        return freed
+
+    # === Eviction ===
+    def _drop(self, key):
+        entry = self.entries.pop(key)
+        self.verified.discard(key)
+        path = os.path.join(self.store_dir, entry['file'])
+        for forget in self.on_drop:
+            forget(path)
+        try:
+            os.remove(os.path.join(self.store_dir, entry['file']))
+        except OSError:
+            pass    # open for playback on Windows; the next start cleans it up
+
+    def _evict(self, keep=None):
+        # Called with the lock held: least recently played first
+        total = sum(e['bytes'] for e in self.entries.values())
+        for key in sorted(self.entries, key=lambda k: self.entries[k]['last_used']):
+            if total <= self.budget:
+                break
+            if key == keep:
+                continue
+            total -= self.entries[key]['bytes']
+            self._drop(key)
+            self.stats_counts['evicted'] += 1
+
+    def set_budget(self, budget_mb):
+        with self.lock:
+            self.budget = int(budget_mb * 2 ** 20)
+            self._evict()
+            self._save()
+
+    def stats(self):
+        with self.lock:
+            return {'windows': len(self.entries), 'mb': round(sum(e['bytes'] for e in self.entries.values()) / 2 ** 20, 1),
+                    'budget_mb': round(self.budget / 2 ** 20, 1), 'filling': len(self.filling), **self.stats_counts}
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        with self.lock:
+            self._save()
+
+
+if __name__ == '__main__':
+    import sys
+
+    store = ClipStore()
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    if command in ('fill', 'prune'):
+        from hooks import start_offset
+        uris = [a for a in sys.argv[2:] if not a.startswith('--')]
+        if not uris and os.path.isdir(CLIP_DIR):
+            uris = ["spotify:track:" + n[:-4] for n in sorted(os.listdir(CLIP_DIR)) if n.endswith('.wav')]
+        windows = [(u, start_offset(u), WINDOW_MS) for u in uris]
+        if command == 'fill':
+            start = time.perf_counter()
+            for future in store.fill(windows):
+                future.result()
+            print(f"✅ {len(uris)} windows checked in {time.perf_counter() - start:.1f}s")
+        if command == 'prune' or '--prune' in sys.argv:
+            freed = store.prune(windows)
+            print(f"✅ Pruned full tracks with stored windows, {freed / 2 ** 20:.1f} MB freed")
+    elif command == 'add':
+        entry = store.add(sys.argv[2], sys.argv[3], int(sys.argv[4]) if len(sys.argv) > 4 else 0)
+        print(f"✅ Stored a {entry['duration_ms'] / 1000:.1f}s window for {entry['uri']}")
+    elif command == 'verify':
+        bad = store.verify_all()
+        print(f"{'✅ All windows verified' if not bad else f'❌ {bad} windows failed and were dropped'}")
+    store.close()
+    print(store.stats())
@@ -0,0 +1,96 @@
+# confirm.py
+# Checks that a start_playback actually produced audio. Polls
+# current_playback quickly at first and backs off, retries once on a
+# fallback device, and reports the time from the button press to
+# confirmed audio.
+import time
+
+FIRST_POLL = 0.05       # seconds before the first check
+MAX_INTERVAL = 0.4      # polling backs off up to this interval
+BACKOFF = 2
+TIME_BUDGET = 3.0       # seconds from press to confirmed audio, retries included
+PRIMARY_SHARE = 0.6     # part of the budget the first device gets
+# Hard cap on polls per attempt, so confirmation can never use more than a
+# couple of dozen calls of the rate limit no matter how slow the device is
+MAX_POLLS = 8
+POSITION_TOLERANCE_MS = 2000
+
+
+def is_confirmed(state, uri, position_ms=0):
+    if not state or not state.get('is_playing') or not state.get('item'):
+        return False
+    return (state['item'].get('uri') == uri
+            and state.get('progress_ms', 0) >= position_ms - POSITION_TOLERANCE_MS)
+
+
+def wait_for_playback(sp, uri, position_ms, deadline, clock=time.monotonic, sleep=time.sleep):
+    interval = FIRST_POLL
+    polls = 0
+    while polls < MAX_POLLS:
+        remaining = deadline - clock()
+        if remaining <= 0:
+            break
+        sleep(min(interval, remaining))
+        polls += 1
+        try:
+            state = sp.current_playback()
+        except Exception as e:
+            print(f"⚠️ Could not read playback state: {e}")
+            state = None
+        if is_confirmed(state, uri, position_ms):
+            return True, polls
+        interval = min(interval * BACKOFF, MAX_INTERVAL)
+    return False, polls
+
+
+def pick_fallback(sp, tried):
+    try:
+        devices = sp.devices().get('devices', [])
+    except Exception as e:
+        print(f"⚠️ Could not list devices: {e}")
+        return None
+    for d in devices:
+        # None means "whatever device is active", so skip the active one too
+        if d['id'] in tried or (None in tried and d.get('is_active')):
+            continue
+        return d['id']
+    return None
+
+
+def confirm_playback(sp, uri, position_ms=0, device_id=None, play=None, started=None,
+                     budget=TIME_BUDGET, clock=time.monotonic, sleep=time.sleep):
+    # The caller has already issued the first start_playback; `play(device_id)`
+    # is only used to retry on the fallback device.
+    if started is None:
+        started = clock()
+    deadline = started + budget
+    if play is None:
+        def play(dev):
+            sp.start_playback(device_id=dev, uris=[uri], position_ms=position_ms or None)
+    result = {'ok': False, 'uri': uri, 'device_id': device_id, 'attempts': 1,
+              'polls': 0, 'elapsed_ms': None, 'error': None}
+
+    ok, polls = wait_for_playback(sp, uri, position_ms, started + budget * PRIMARY_SHARE, clock, sleep)
+    result['polls'] += polls
+    if not ok:
+        fallback = pick_fallback(sp, [device_id])
+        if fallback is None:
+            result['error'] = 'no audio and no fallback device'
+        else:
+            result['attempts'] += 1
+            result['device_id'] = fallback
+            try:
+                play(fallback)
+                ok, polls = wait_for_playback(sp, uri, position_ms, deadline, clock, sleep)
+                result['polls'] += polls
+                if not ok:
+                    result['error'] = 'no audio on fallback device'
+            except Exception as e:
+                result['error'] = f"fallback failed: {e}"
+    result['ok'] = ok
+    result['elapsed_ms'] = round((clock() - started) * 1000)
+    if ok:
+        print(f"✅ Audio confirmed in {result['elapsed_ms']} ms ({result['polls']} polls)")
+    else:
+        print(f"❌ No audio after {result['elapsed_ms']} ms: {result['error']}")
+    return result
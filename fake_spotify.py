@@ -0,0 +1,262 @@
+# fake_spotify.py
+# In-process stand-in for the spotipy client, used for benchmarks and for
+# running the apps without a Spotify account (WALKUP_FAKE_SPOTIFY=1).
+# Only the calls the walk-up apps make are implemented.
+import threading
+import time
+import zlib
+
+# Songs from saved_assignments.json, so the demo lineup resolves
+SAMPLE_SONGS = [
+    ("What's Up Danger (with Black Caviar)", "Blackway"),
+    ("Party Rock Anthem", "LMFAO"),
+    ("O.P.P", "Naughty By Nature"),
+    ("Sweet Caroline", "Neil Diamond"),
+    ("Truth Hurts", "Lizzo"),
+    ("Radioactive", "Imagine Dragons"),
+    ("Eye of the Tiger", "Survivor"),
+    ("Shake It Off", "Taylor Swift"),
+    ("Can't Stop the Feeling", "Justin Timberlake"),
+]
+
+BUFFER_DELAY = 0.35   # seconds for a device to fetch and buffer a cold track
+SEEK_DELAY = 0.03     # seconds to seek inside an already buffered track
+API_LATENCY = 0.02    # seconds per Web API round trip
+PAGE_SIZE = 100
+
+
+class FakeSpotifyError(Exception):
+    # Mirrors the attributes of spotipy.SpotifyException
+    def __init__(self, http_status, msg, headers=None):
+        super().__init__(f"http status: {http_status}, {msg}")
+        self.http_status = http_status
+        self.msg = msg
+        self.headers = headers or {}
+
+
+def make_track(n, name=None, artist=None):
+    track_id = f"fake{n:018d}"
+    return {
+        'id': track_id,
+        'uri': f"spotify:track:{track_id}",
+        'name': name or f"Track {n:03d}",
+        'artists': [{'name': artist or f"Artist {n % 40:02d}"}],
+        'duration_ms': 150000 + (n * 7919) % 90000,
+        'preview_url': None,
+    }
+
+
+def make_catalog(size=200):
+    tracks = [make_track(i, name, artist) for i, (name, artist) in enumerate(SAMPLE_SONGS)]
+    tracks += [make_track(i) for i in range(len(tracks), size)]
+    return tracks
+
+
+class FakeSpotify:
+    def __init__(self, tracks=None, devices=None, buffer_delay=BUFFER_DELAY,
+                 seek_delay=SEEK_DELAY, api_latency=API_LATENCY,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.tracks = tracks if tracks is not None else make_catalog()
+        self.by_uri = {t['uri']: t for t in self.tracks}
+        self.playlists = {}
+        self.device_list = devices or [
+            {'id': 'fake-device-1', 'name': 'Press Box Speaker', 'type': 'Speaker',
+             'is_active': True, 'volume_percent': 100},
+            {'id': 'fake-device-2', 'name': 'Backup Phone', 'type': 'Smartphone',
+             'is_active': False, 'volume_percent': 100},
+        ]
+        self.buffer_delay = buffer_delay
+        self.seek_delay = seek_delay
+        self.api_latency = api_latency
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.call_counts = {}
+        # Playback state
+        self.uri = None
+        self.is_playing = False
+        self.audio_at = None        # clock time the current track became audible
+        self.position_ms = 0        # position at audio_at (or at pause)
+        self.queue_uris = []
+        self.buffered = {}          # uri -> clock time its buffer is ready
+
+    # --- internals ---
+    def _call(self, name):
+        with self.lock:
+            self.call_counts[name] = self.call_counts.get(name, 0) + 1
+        if self.api_latency:
+            self.sleep(self.api_latency)
+
+    def _device(self, device_id):
+        if device_id is None:
+            active = [d for d in self.device_list if d['is_active']]
+            if not active:
+                raise FakeSpotifyError(404, "Player command failed: No active device found")
+            return active[0]
+        for d in self.device_list:
+            if d['id'] == device_id:
+                return d
+        raise FakeSpotifyError(404, "Device not found")
+
+    def _activate(self, device):
+        for d in self.device_list:
+            d['is_active'] = d is device
+
+    def _load_delay(self, uri, now):
+        ready = self.buffered.get(uri)
+        if ready is None:
+            return self.buffer_delay
+        return max(0.0, ready - now)
+
+    def _start(self, uri, position_ms, delay, now):
+        self.uri = uri
+        self.is_playing = True
+        self.position_ms = position_ms or 0
+        self.audio_at = now + delay
+        self.buffered[uri] = min(self.buffered.get(uri, self.audio_at), self.audio_at)
+
+    def progress_ms(self, now=None):
+        if self.uri is None:
+            return 0
+        now = self.clock() if now is None else now
+        if not self.is_playing or now < self.audio_at:
+            return self.position_ms
+        return self.position_ms + int((now - self.audio_at) * 1000)
+
+    # --- catalog ---
+    def playlist(self, playlist_id, fields=None, market=None, additional_types=None):
+        self._call('playlist')
+        tracks = self.playlists.get(playlist_id, self.tracks)
+        # Changes whenever the playlist's tracks do, like Spotify's snapshot_id
+        snapshot = zlib.crc32(" ".join(t['uri'] for t in tracks).encode())
+        return {'id': playlist_id, 'name': f"Playlist {playlist_id}", 'snapshot_id': f"{len(tracks)}-{snapshot:08x}",
+                'tracks': {'total': len(tracks)}}
+
+    def playlist_tracks(self, playlist_id, fields=None, limit=PAGE_SIZE, offset=0, market=None):
+        self._call('playlist_tracks')
+        tracks = self.playlists.get(playlist_id, self.tracks)
+        items = [{'track': t} for t in tracks[offset:offset + limit]]
+        more = offset + limit < len(tracks)
+        return {
+            'items': items, 'total': len(tracks), 'offset': offset, 'limit': limit,
+            'next': {'playlist_id': playlist_id, 'offset': offset + limit, 'limit': limit} if more else None,
+        }
+
+    def next(self, result):
+        page = result.get('next')
+        if not page:
+            return None
+        return self.playlist_tracks(page['playlist_id'], limit=page['limit'], offset=page['offset'])
+
+    def search(self, q, limit=10, offset=0, type='track', market=None):
+        self._call('search')
+        words = q.lower().replace('–', ' ').replace('-', ' ').split()
+        hits = []
+        for t in self.tracks:
+            text = f"{t['name']} {t['artists'][0]['name']}".lower()
+            if words and all(w in text for w in words):
+                hits.append(t)
+        return {'tracks': {'items': hits[offset:offset + limit], 'total': len(hits)}}
+
+    def track(self, track_id, market=None):
+        self._call('track')
+        uri = track_id if track_id.startswith('spotify:') else f"spotify:track:{track_id}"
+        if uri not in self.by_uri:
+            raise FakeSpotifyError(404, "non existing id")
+        return self.by_uri[uri]
+
+    # --- devices and playback ---
+    def devices(self):
+        self._call('devices')
+        return {'devices': [dict(d) for d in self.device_list]}
+
+    def transfer_playback(self, device_id, force_play=True):
+        self._call('transfer_playback')
+        with self.lock:
+            self._activate(self._device(device_id))
+            if force_play and self.uri:
+                now = self.clock()
+                self._start(self.uri, self.progress_ms(now), self.buffer_delay, now)
+
+    def start_playback(self, device_id=None, context_uri=None, uris=None, offset=None, position_ms=None):
+        self._call('start_playback')
+        with self.lock:
+            device = self._device(device_id)
+            self._activate(device)
+            now = self.clock()
+            if not uris:
+                if self.uri is None:
+                    raise FakeSpotifyError(404, "Player command failed: Nothing to play")
+                self._start(self.uri, self.progress_ms(now), self._load_delay(self.uri, now), now)
+                return
+            for uri in uris:
+                if uri not in self.by_uri:
+                    raise FakeSpotifyError(400, f"Invalid track uri: {uri}")
+            # Extra uris become the upcoming context, buffered from now
+            for uri in uris[1:]:
+                self.buffered.setdefault(uri, now + self.buffer_delay)
+            self.queue_uris = list(uris[1:]) + self.queue_uris
+            self._start(uris[0], position_ms, self._load_delay(uris[0], now), now)
+
+    def pause_playback(self, device_id=None):
+        self._call('pause_playback')
+        with self.lock:
+            self._device(device_id)
+            if self.is_playing:
+                now = self.clock()
+                self.position_ms = self.progress_ms(now)
+                self.is_playing = False
+
+    def add_to_queue(self, uri, device_id=None):
+        self._call('add_to_queue')
+        with self.lock:
+            self._device(device_id)
+            if uri not in self.by_uri:
+                raise FakeSpotifyError(400, f"Invalid track uri: {uri}")
+            self.queue_uris.append(uri)
+            self.buffered.setdefault(uri, self.clock() + self.buffer_delay)
+
+    def queue(self):
+        self._call('queue')
+        with self.lock:
+            current = self.by_uri.get(self.uri)
+            return {'currently_playing': current, 'queue': [self.by_uri[u] for u in self.queue_uris]}
+
+    def next_track(self, device_id=None):
+        self._call('next_track')
+        with self.lock:
+            self._device(device_id)
+            if not self.queue_uris:
+                self.is_playing = False
+                return
+            uri = self.queue_uris.pop(0)
+            now = self.clock()
+            self._start(uri, 0, self._load_delay(uri, now), now)
+
+    def seek_track(self, position_ms, device_id=None):
+        self._call('seek_track')
+        with self.lock:
+            self._device(device_id)
+            now = self.clock()
+            delay = max(self.seek_delay, self.audio_at - now) if self.is_playing else 0
+            self.position_ms = position_ms
+            self.audio_at = now + delay
+
+    def volume(self, volume_percent, device_id=None):
+        self._call('volume')
+        with self.lock:
+            self._device(device_id)['volume_percent'] = int(volume_percent)
+
+    def current_playback(self, market=None, additional_types=None):
+        self._call('current_playback')
+        with self.lock:
+            if self.uri is None:
+                return None
+            now = self.clock()
+            device = next((d for d in self.device_list if d['is_active']), None)
+            return {
+                'device': dict(device) if device else None,
+                'is_playing': self.is_playing and now >= self.audio_at,
+                'progress_ms': self.progress_ms(now),
+                'item': self.by_uri[self.uri],
+            }
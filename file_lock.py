@@ -0,0 +1,33 @@
+# file_lock.py
+# Cross-process lock for the logs and caches that several processes append
+# to or rewrite (app2 workers, the Tk apps, prewarm.py). The lock is taken
+# on a "<path>.lock" file next to the data, so the data file itself can be
+# replaced while it is held.
+import contextlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+
+@contextlib.contextmanager
+def locked(path):
+    with open(path + ".lock", 'a+b') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        elif msvcrt:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            elif msvcrt:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
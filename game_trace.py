@@ -0,0 +1,233 @@
+# game_trace.py
+# Records a game so it can be replayed later as a performance regression
+# test. With WALKUP_TRACE=<file>, app2.py writes one JSON line per HTTP
+# request (/api/next, /api/save, /api/reload, polling...) and per Spotify
+# call, with timestamps and latencies.
+#
+#   python game_trace.py replay <trace> [--speed 10] [--report out.json] [--baseline base.json]
+#
+# replays the requests against app2.py running on the fake Spotify client
+# (catalog rebuilt from the trace, API latency set to the recorded median),
+# prints latency percentiles per endpoint plus press-to-audio, and fails
+# if any of them regressed against a baseline report.
+import json
+import os
+import threading
+import time
+
+TRACE_ENV = "WALKUP_TRACE"
+REGRESSION = 1.2        # a percentile 20% over its baseline is a regression
+PERCENTILES = (50, 90, 99)
+
+
+class TraceRecorder:
+    def __init__(self, path):
+        self.file = open(path, 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+
+    def now(self):
+        return round(time.monotonic() - self.start, 6)
+
+    def write(self, record):
+        with self.lock:
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.file.flush()
+
+
+_recorder = None
+
+
+def recorder():
+    global _recorder
+    if _recorder is None and os.getenv(TRACE_ENV):
+        _recorder = TraceRecorder(os.getenv(TRACE_ENV))
+    return _recorder
+
+
+class TracingClient:
+    # Proxies a spotipy client and records every call with its latency
+    def __init__(self, sp, rec):
+        self.sp = sp
+        self.rec = rec
+
+    def __getattr__(self, attr):
+        fn = getattr(self.sp, attr)
+        if not callable(fn):
+            return fn
+
+        def call(*args, **kwargs):
+            t = self.rec.now()
+            start = time.perf_counter()
+            error = None
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                error = str(e)
+                raise
+            finally:
+                self.rec.write({'type': 'spotify', 't': t, 'call': attr,
+                                'ms': round((time.perf_counter() - start) * 1000, 3), 'error': error})
+        return call
+
+
+def trace_client(sp):
+    rec = recorder()
+    return TracingClient(sp, rec) if rec else sp
+
+
+def trace_app(app, header=None):
+    rec = recorder()
+    if not rec:
+        return
+    from flask import g, request
+
+    if header:
+        rec.write({'type': 'header', 't': rec.now(), **header()})
+
+    @app.before_request
+    def start_request():
+        g.trace_t = rec.now()
+        g.trace_start = time.perf_counter()
+
+    @app.after_request
+    def end_request(response):
+        if 'trace_start' in g:
+            rec.write({
+                'type': 'http', 't': g.trace_t, 'method': request.method, 'path': request.full_path.rstrip('?'),
+                'body': request.get_json(silent=True), 'status': response.status_code,
+                'ms': round((time.perf_counter() - g.trace_start) * 1000, 3),
+            })
+        return response
+
+
+# === Replay ===
+def load_trace(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+    out = {f"p{p}": round(values[min(len(values) - 1, int(len(values) * p / 100))], 3) for p in PERCENTILES}
+    out['count'] = len(values)
+    return out
+
+
+def catalog_from_songs(songs):
+    from fake_spotify import make_track
+
+    tracks = []
+    for i, song in enumerate(songs):
+        name, _, artist = song.rpartition(" – ")
+        tracks.append(make_track(i, name or song, artist or "Unknown"))
+    return tracks
+
+
+def replay(records, speed=1.0, workdir=None):
+    import shutil
+    import sys
+    import tempfile
+
+    header = next((r for r in records if r['type'] == 'header'), {})
+    spotify_ms = sorted(r['ms'] for r in records if r['type'] == 'spotify')
+    requests = [r for r in records if r['type'] == 'http']
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    tmp = workdir or tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(tmp)
+    sys.path.insert(0, here)
+    for var in (TRACE_ENV, 'WALKUP_SHARED_DB', 'WALKUP_ACCOUNTS'):
+        os.environ.pop(var, None)
+    os.environ['WALKUP_FAKE_SPOTIFY'] = '1'
+    with open("saved_assignments.json", 'w', encoding='utf-8') as f:
+        json.dump(header.get('assignments', {}), f, ensure_ascii=False)
+    try:
+        import fake_spotify
+        if header.get('songs'):
+            fake_spotify.make_catalog = lambda size=0: catalog_from_songs(header['songs'])
+        if spotify_ms:
+            fake_spotify.API_LATENCY = spotify_ms[len(spotify_ms) // 2] / 1000
+        import app2
+        fake = app2.sp
+        while not isinstance(fake, fake_spotify.FakeSpotify):
+            # Under the priority queue / tracing proxies
+            fake = fake.sp
+        fake.api_latency = fake_spotify.API_LATENCY
+        client = app2.app.test_client()
+
+        latencies = {}
+        press_to_audio = []
+        start = time.monotonic()
+        for r in requests:
+            # Keep the recorded pacing, compressed by speed
+            delay = r['t'] / speed - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+            path = r['path']
+            pressed = time.monotonic()
+            t0 = time.perf_counter()
+            if r['method'] == 'POST':
+                resp = client.post(path, json=r.get('body') or {})
+            else:
+                resp = client.get(path)
+            latencies.setdefault(f"{r['method']} {path.split('?')[0]}", []).append(
+                (time.perf_counter() - t0) * 1000)
+            if path.startswith('/api/next') and resp.status_code == 200 and fake.audio_at:
+                press_to_audio.append((fake.audio_at - pressed) * 1000)
+        report = {name: percentiles(v) for name, v in sorted(latencies.items())}
+        report['press_to_audio'] = percentiles(press_to_audio)
+        app2.journal.close()
+        return report
+    finally:
+        os.chdir(cwd)
+        if not workdir:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+def compare(report, baseline, threshold=REGRESSION):
+    regressions = []
+    for name, stats in report.items():
+        base = baseline.get(name, {})
+        for p in PERCENTILES:
+            key = f"p{p}"
+            if key in stats and base.get(key):
+                ratio = stats[key] / base[key]
+                if ratio > threshold:
+                    regressions.append(f"{name} {key}: {base[key]:.1f} -> {stats[key]:.1f} ms ({ratio:.2f}x)")
+    return regressions
+
+
+def print_report(report):
+    for name, stats in report.items():
+        if stats:
+            cols = "  ".join(f"{k} {stats[k]:8.2f}" for k in (f"p{p}" for p in PERCENTILES))
+            print(f"{name:<24} n={stats['count']:<5} {cols}  (ms)")
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Replay a recorded game trace")
+    parser.add_argument('command', choices=['replay'])
+    parser.add_argument('trace')
+    parser.add_argument('--speed', type=float, default=1.0, help="1 = real time, 10 = ten times faster")
+    parser.add_argument('--report', help="write the report JSON here")
+    parser.add_argument('--baseline', help="report JSON from an earlier replay to compare against")
+    args = parser.parse_args()
+
+    result = replay(load_trace(args.trace), speed=args.speed)
+    print_report(result)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            problems = compare(result, json.load(f))
+        for line in problems:
+            print(f"❌ Regression: {line}")
+        sys.exit(1 if problems else 0)
@@ -4,15 +4,57 @@ import tkinter as tk
 from tkinter import ttk
 from spotipy import Spotify
 from spotipy.oauth2 import SpotifyOAuth
+import threading
 import time
+from preload import Preloader, resolve_uri
+from journal import GameJournal
+from lineup_history import LineupHistory
+from local_audio import FailoverPlayer, LocalAudioBackend, SpotifyBackend
+from clip_scheduler import ClipScheduler
+from programs import ProgramLibrary
+from play_history import PlayHistory
+from call_queue import PriorityClient
+from breaker import CircuitBreaker, GuardedClient, MeteredClient, readiness
+from loudness import target_volume
+from hooks import start_offset
+from catalog import FederatedCatalog, load_playlists
+from walkup_daemon import DaemonError, connect
+import profiling
+from profiling import profiled, timed
 
 # === CONFIGURATION ===
-PLAYLIST_ID = "116HUEoHRJLuIvrVXSNTTS"  # Your playlist ID
+PLAYLIST_ID = "116HUEoHRJLuIvrVXSNTTS"  # Your playlist ID, when there's no playlists.json
+TEAM = os.getenv("WALKUP_TEAM")  # whose playlists to show; unset shows the whole league's
 SAVE_FILE = "saved_assignments.json"
 MAX_PLAY_TIME = 30  # seconds
-
-# Spotify client setup
-sp = Spotify(auth_manager=SpotifyOAuth(scope="user-modify-playback-state,user-read-playback-state"))
+PRELOAD = True  # queue the on-deck batter's track while the current clip plays
+
+READY_POLL_MS = 2000
+
+# === Local playback ===
+# Built only when this window plays clips itself: not while the walk-up
+# daemon owns playback, and at once if the daemon goes away
+sp = preloader = player = scheduler = history = None
+
+
+def start_local():
+    global sp, preloader, player, scheduler, history
+    if sp is not None:
+        return
+    breaker = CircuitBreaker()
+    client = Spotify(auth_manager=SpotifyOAuth(scope="user-modify-playback-state,user-read-playback-state"))
+    # The breaker times only the calls at Spotify, not the queue in front of them
+    client = MeteredClient(client, breaker)
+    # Stop and play go out ahead of preloads and program staging
+    client = PriorityClient(client)
+    # Per-call deadlines and a circuit breaker, so an outage fails fast
+    sp = GuardedClient(client, breaker)
+    preloader = Preloader(sp, enabled=PRELOAD)
+    # Falls back to cached clips on disk when Spotify can't be reached
+    player = FailoverPlayer(SpotifyBackend(sp, preloader), LocalAudioBackend())
+    # Batter clips and music programs share one scheduler and fade-out path
+    scheduler = ClipScheduler(player)
+    history = PlayHistory()
 
 # === FUNCTIONS ===
 
@@ -31,14 +73,14 @@ def save_data(assignments, filename=SAVE_FILE):
         json.dump(assignments, f, indent=2, ensure_ascii=False)
 
 
-def get_playlist_tracks(playlist_id):
-    results = sp.playlist_tracks(playlist_id)
-    return [
-        item['track']['name'] + " – " + item['track']['artists'][0]['name']
-        for item in results['items'] if item.get('track')
-    ]
+def load_catalog():
+    # The league's (or TEAM's) songs; only changed playlists are refetched
+    catalog = FederatedCatalog(sp, load_playlists(default=PLAYLIST_ID))
+    catalog.sync()
+    return catalog.songs(TEAM)
 
 
+@timed('build_lineup')
 def build_lineup(assignments, available_songs):
     lineup = []
     for name, info in assignments.items():
@@ -50,7 +92,11 @@ def build_lineup(assignments, available_songs):
 
 
 def fetch_devices():
-    return sp.devices().get('devices', [])
+    try:
+        return sp.devices().get('devices', [])
+    except Exception as e:
+        print(f"⚠️ Could not list devices: {e}")
+        return []
 
 
 def ensure_device(device_id):
@@ -61,34 +107,43 @@ def ensure_device(device_id):
         print(f"⚠️ Could not transfer playback: {e}")
 
 
-def play_song(song_name, device_id=None):
-    # Ensure correct device
-    if device_id:
-        ensure_device(device_id)
-    res = sp.search(q=song_name, type='track', limit=1)
-    items = res['tracks']['items']
-    if not items:
+def play_song(song_name, device_id=None, label=None):
+    requested = time.time()
+    uri = resolve_uri(sp, song_name)
+    if not uri:
         print(f"❌ Song not found: {song_name}")
+        history.failed(None, 'not_found', batter=label, requested=requested)
         return False
-    uri = items[0]['uri']
+    # A preloaded track is already on this device, so skip the transfer
+    if device_id and not (preloader.device_id == device_id and uri in preloader.queued):
+        ensure_device(device_id)
+    play = history.begin(uri, batter=label, requested=requested)
     try:
         # Play on specified device or current active
-        if device_id:
-            sp.start_playback(device_id=device_id, uris=[uri])
-        else:
-            sp.start_playback(uris=[uri])
+        backend = scheduler.play(uri, MAX_PLAY_TIME, label=label, device_id=device_id,
+                                 position_ms=start_offset(uri), volume=target_volume(uri), play=play)
+        history.accepted(play, backend, device_id)
         return True
     except Exception as e:
         print(f"❌ Playback error: {e}")
+        play['failure'] = 'playback_error'
+        history.finish(play)
         return False
 
 
+def preload_song(song_name, device_id=None):
+    # Runs off the Tk thread; the on-deck track buffers while the clip plays
+    def stage():
+        try:
+            preloader.stage(resolve_uri(sp, song_name), device_id=device_id)
+        except Exception as e:
+            print(f"⚠️ Could not preload {song_name}: {e}")
+    threading.Thread(target=stage, daemon=True).start()
+
+
 def stop_song(device_id=None):
     try:
-        if device_id:
-            sp.pause_playback(device_id=device_id)
-        else:
-            sp.pause_playback()
+        scheduler.stop(device_id=device_id)
     except Exception as e:
         print(f"⚠️ Could not stop playback: {e}")
 
@@ -99,14 +154,28 @@ class WalkupApp:
         root.title("Walk-up Song App")
 
         self.assignments = load_saved_data()
-        self.available_songs = get_playlist_tracks(PLAYLIST_ID)
-        self.batter_index = 0
         self.playing = False
         self.device_id = None
+        self.showing = False  # filling the table from history, not an edit
+        # With the walk-up daemon running it owns playback and the batter
+        # pointer, and this window is one more front end on the same game
+        self.daemon = connect()
+        self.available_songs = None
+        if self.daemon:
+            try:
+                self.available_songs = self.daemon.call('songs')['songs']
+                self.batter_index = self.daemon.call('state')['current_index']
+                self.program_list = self.daemon.call('programs')['programs']
+            except DaemonError as e:
+                print(f"⚠️ {e}")
+                self.daemon = None
+        if not self.daemon:
+            self.go_local()
 
         self.create_widgets()
         self.update_device_list()
         self.update_display()
+        self.check_ready()
 
     def create_widgets(self):
         # Device selector
@@ -127,6 +196,8 @@ class WalkupApp:
         self.next_label.pack()
         self.next_next_label = ttk.Label(self.root, text="", font=("Arial", 12))
         self.next_next_label.pack(pady=(0,10))
+        self.mode_label = ttk.Label(self.root, text="", font=("Arial", 11), foreground="red")
+        self.mode_label.pack()
 
         # Control buttons
         ctrl_frame = ttk.Frame(self.root)
@@ -134,6 +205,25 @@ class WalkupApp:
         ttk.Button(ctrl_frame, text="▶️ Next Batter", command=self.play_next_batter).grid(row=0, column=0, padx=5)
         ttk.Button(ctrl_frame, text="⏹️ Stop", command=self.stop_playback).grid(row=0, column=1, padx=5)
 
+        # Lineup history: undo a wrong pick, or go back to an inning's lineup
+        hist_frame = ttk.Frame(self.root)
+        hist_frame.pack(pady=5)
+        ttk.Button(hist_frame, text="↩️ Undo", command=lambda: self.lineup_action('undo')).grid(row=0, column=0, padx=5)
+        ttk.Button(hist_frame, text="↪️ Redo", command=lambda: self.lineup_action('redo')).grid(row=0, column=1, padx=5)
+        ttk.Label(hist_frame, text="Inning:").grid(row=0, column=2, padx=(15, 2))
+        self.inning_var = tk.StringVar(value="1")
+        ttk.Spinbox(hist_frame, from_=1, to=20, textvariable=self.inning_var, width=4).grid(row=0, column=3)
+        ttk.Button(hist_frame, text="⚾ Start Inning", command=self.mark_inning).grid(row=0, column=4, padx=5)
+        ttk.Button(hist_frame, text="⏪ Restore Inning",
+                   command=lambda: self.lineup_action('restore', inning=self.inning_var.get())).grid(row=0, column=5, padx=5)
+
+        # Music programs
+        prog_frame = ttk.Frame(self.root)
+        prog_frame.pack(pady=5)
+        for col, item in enumerate(self.program_list):
+            ttk.Button(prog_frame, text=item['label'],
+                       command=lambda n=item['name']: self.play_program(n)).grid(row=0, column=col, padx=5)
+
         # Roster table
         table_frame = ttk.Frame(self.root)
         table_frame.pack(padx=10, pady=10)
@@ -162,7 +252,9 @@ class WalkupApp:
             self.song_vars[name] = svar
 
     def update_device_list(self):
-        devices = fetch_devices()
+        devices = self.daemon_call('devices').get('devices') if self.daemon else None
+        if devices is None:
+            devices = [] if self.daemon else fetch_devices()
         names = [d['name'] for d in devices]
         self.device_map = {d['name']: d['id'] for d in devices}
         self.device_combo['values'] = names
@@ -170,15 +262,125 @@ class WalkupApp:
             self.device_var.set(names[0])
             self.device_id = self.device_map[names[0]]
 
+    def go_local(self):
+        # Plays clips from this window: at start without a daemon, or when
+        # the daemon stops answering mid-game
+        start_local()
+        if self.available_songs is None:
+            self.available_songs = load_catalog()
+        # The daemon kept the batter pointer in the same journal
+        self.journal = GameJournal()
+        self.lineup_history = LineupHistory()
+        self.lineup_history.record(self.assignments, note='loaded')
+        # Resume at the batter the last run left off on
+        self.batter_index = self.journal.state['batter_index']
+        # The scheduler fades clips out on its own timer; this just keeps track
+        scheduler.on_stop = self.on_clip_stopped
+        self.programs = ProgramLibrary(sp, scheduler, history=history)
+        self.programs.start_staging()
+        self.program_list = self.programs.listing()
+
+    def daemon_call(self, cmd, **args):
+        # The reply has 'lost' set when the daemon went away and this window
+        # took over playback; the caller then does the local thing instead
+        try:
+            reply = self.daemon.call(cmd, **args)
+        except DaemonError as e:
+            print(f"⚠️ {e}; playing from this window instead")
+            self.daemon = None
+            self.go_local()
+            return {'error': str(e), 'lost': True}
+        if reply.get('error'):
+            print(f"❌ {reply['error']}")
+        return reply
+
+    def check_ready(self):
+        # Shows degraded mode as soon as the breaker opens
+        if self.daemon:
+            status = self.daemon_call('ready')
+            # Another front end may have moved the batter pointer or edited the lineup
+            state = self.daemon_call('state')
+            changed = {name: info for name, info in state.get('assignments', {}).items()
+                       if self.assignments.get(name) != info}
+            if changed:
+                self.show_assignments(changed)
+            if state.get('current_index', self.batter_index) != self.batter_index:
+                self.batter_index = state['current_index']
+                self.update_display()
+            if 'error' in status and not status.get('lost'):
+                self.mode_label.config(text="⚠️ Walk-up daemon unavailable")
+                self.root.after(READY_POLL_MS, self.check_ready)
+                return
+        if not self.daemon:
+            status = readiness(sp.breaker, player)
+        self.mode_label.config(text="" if status['ready'] else
+                               "⚠️ Spotify unavailable: playing cached clips" if status['mode'] == 'local' else
+                               "⚠️ Spotify unavailable: no cached clips, music is off")
+        self.root.after(READY_POLL_MS, self.check_ready)
+
     def on_device_select(self, event=None):
         self.device_id = self.device_map.get(self.device_var.get())
+        if self.daemon and self.device_id:
+            self.daemon_call('use_device', device_id=self.device_id)
 
     def on_assign(self, player):
+        if self.showing:
+            return
         self.assignments[player] = {
             'batting_number': self.batting_vars[player].get(),
             'song': self.song_vars[player].get()
         }
+        # Only this player goes to the daemon, so edits made elsewhere stay
+        if self.daemon and not self.daemon_call('assign', player=player, **self.assignments[player]).get('lost'):
+            return
+        save_data(self.assignments)
+        self.journal.record('lineup_edited', assignments={player: self.assignments[player]})
+        self.lineup_history.record(self.assignments)
+
+    def lineup_action(self, action, inning=None):
+        # Undo, redo or restore, then show the lineup it went back to
+        if self.daemon:
+            args = {'inning': inning} if action == 'restore' else {}
+            reply = self.daemon_call(action, **args)
+            if not reply.get('lost'):
+                if 'error' not in reply:
+                    self.show_assignments(reply['assignments'])
+                return
+        if action == 'restore':
+            if not str(inning).isdigit():
+                print("❌ Which inning?")
+                return
+            version = self.lineup_history.restore(inning=inning)
+        else:
+            version = getattr(self.lineup_history, action)()
+        if version is None:
+            print(f"❌ Nothing to {action}" if action != 'restore' else f"❌ No lineup saved for inning {inning}")
+            return
+        self.assignments = self.lineup_history.assignments()
         save_data(self.assignments)
+        self.journal.record('lineup_edited', assignments=self.assignments)
+        self.show_assignments(self.assignments)
+
+    def mark_inning(self):
+        inning = self.inning_var.get()
+        if not inning.isdigit():
+            print("❌ Which inning?")
+            return
+        if not self.daemon or self.daemon_call('inning', inning=inning).get('lost'):
+            self.lineup_history.mark_inning(inning)
+        print(f"⚾ Lineup saved for inning {inning}")
+
+    def show_assignments(self, assignments):
+        self.showing = True
+        try:
+            for name, info in assignments.items():
+                if name in self.batting_vars:
+                    self.batting_vars[name].set(info.get('batting_number', 'Not in lineup'))
+                    self.song_vars[name].set(info.get('song', ''))
+        finally:
+            self.showing = False
+        self.assignments.update(assignments)
+        self.update_display()
 
     def update_display(self):
         lineup = build_lineup(self.assignments, self.available_songs)
@@ -195,33 +397,61 @@ class WalkupApp:
             self.next_label.config(text="")
             self.next_next_label.config(text="")
 
+    @profiled('play_next_batter')
     def play_next_batter(self):
+        if self.daemon:
+            self.update_display()
+            reply = self.daemon_call('next')
+            if not reply.get('lost'):
+                self.batter_index = reply.get('current_index', self.batter_index)
+                return
         lineup = build_lineup(self.assignments, self.available_songs)
         if not lineup or not self.device_id:
             return
         idx = self.batter_index % len(lineup)
         curr = lineup[idx]
         self.update_display()
-        if curr['song'] and play_song(curr['song'], self.device_id):
+        if curr['song'] and play_song(curr['song'], self.device_id, label=curr['name']):
             self.playing = True
-            self.root.after(MAX_PLAY_TIME * 1000, self.auto_stop)
+            self.journal.record('clip_started', uri=resolve_uri(sp, curr['song']), batter=curr['name'])
+            nxt = lineup[(idx + 1) % len(lineup)]
+            if nxt['song']:
+                preload_song(nxt['song'], self.device_id)
         self.batter_index = (self.batter_index + 1) % len(lineup)
+        self.journal.record('batter_advanced', index=self.batter_index)
 
-    def auto_stop(self):
-        if self.playing:
-            stop_song(self.device_id)
-            print(f"⏹️ Auto-stopped after {MAX_PLAY_TIME}s.")
-            self.playing = False
-            self.update_display()
+    def play_program(self, name):
+        if self.daemon and not self.daemon_call('program', name=name).get('lost'):
+            return
+        try:
+            pick = self.programs.trigger(name, device_id=self.device_id)
+        except Exception as e:
+            print(f"❌ Program error: {e}")
+            return
+        if pick:
+            self.playing = True
+            self.journal.record('clip_started', uri=pick['uri'], program=name)
+
+    def on_clip_stopped(self, clip):
+        # Runs on the scheduler's timer thread, so no Tk calls here
+        if clip['ended'] == 'expired':
+            print(f"⏹️ Auto-stopped {clip.get('label') or clip['uri']}.")
+        self.playing = False
+        self.journal.record('clip_stopped')
+        if clip.get('play'):
+            history.finish(clip['play'], time.time() - clip['started'])
 
     def stop_playback(self):
-        if self.device_id:
-            stop_song(self.device_id)
+        if self.daemon and not self.daemon_call('stop').get('lost'):
+            print("⏹️ Playback manually stopped.")
+        elif self.device_id:
             self.playing = False
+            stop_song(self.device_id)
             print("⏹️ Playback manually stopped.")
             self.update_display()
 
 if __name__ == '__main__':
+    profiling.install_signal_handler()
     root = tk.Tk()
     app = WalkupApp(root)
     root.mainloop()
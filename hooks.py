@@ -0,0 +1,162 @@
+# hooks.py
+# Suggests each track's clip start offset by finding its "hook": the part
+# that repeats (self-similarity of spectral band energies), is loud, and
+# comes right after an energy rise. Offsets are snapped to the strongest
+# onset just before the hook so the clip starts on a beat. Results are
+# cached per URI in HOOKS_FILE, and a playlist is analyzed as one batch
+# across a process pool.
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from local_audio import CLIP_DIR, clip_path
+from loudness import load_cache, read_wav, save_cache
+
+HOOKS_FILE = "hooks_cache.json"
+CLIP_MS = 30000         # the offset must leave room for a full clip
+BANDS = 24              # log-spaced spectral bands
+MIN_LAG_S = 8           # repeats closer than this don't count as a chorus
+RISE_S = 4              # energy is compared over this many seconds either side
+EARLY_BIAS = 0.5        # prefer an earlier hook when scores are close
+BATCH_SIZE = 8
+MAX_TRACK_MS = 15 * 60 * 1000
+
+
+def band_matrix(n_fft, rate, bands=BANDS, low=60.0):
+    freqs = np.fft.rfftfreq(n_fft, 1 / rate)
+    edges = np.geomspace(low, rate / 2, bands + 1)
+    idx = np.digitize(freqs, edges) - 1
+    matrix = np.zeros((len(freqs), bands), dtype=np.float32)
+    valid = (idx >= 0) & (idx < bands)
+    matrix[np.nonzero(valid)[0], idx[valid]] = 1.0
+    return matrix
+
+
+def zscore(x):
+    std = x.std()
+    return (x - x.mean()) / std if std > 0 else np.zeros_like(x)
+
+
+def hook_offset(samples, rate, clip_ms=CLIP_MS):
+    # samples: (channels, n) float array. Returns the suggested start in ms.
+    mono = samples.mean(axis=0)
+    hop = rate // 10                                   # 100 ms frames
+    n = len(mono) // hop
+    seconds = n // 10
+    room = seconds - clip_ms // 1000
+    if room < 2:
+        return 0
+    frames = mono[:n * hop].reshape(n, hop)
+    mag = np.abs(np.fft.rfft(frames * np.hanning(hop), axis=1))
+    spec = np.log1p(mag @ band_matrix(hop, rate))      # (frames, bands)
+    energy = np.sqrt((frames ** 2).mean(axis=1))
+    onset = np.maximum(np.diff(spec, axis=0, prepend=spec[:1]), 0).sum(axis=1)
+
+    # 1 s segments: repetition from the self-similarity matrix
+    feats = spec[:seconds * 10].reshape(seconds, 10, -1).mean(axis=1)
+    feats = feats - feats.mean(axis=1, keepdims=True)
+    feats /= np.maximum(np.linalg.norm(feats, axis=1, keepdims=True), 1e-9)
+    ssm = feats @ feats.T
+    lag = np.abs(np.arange(seconds)[:, None] - np.arange(seconds)[None, :])
+    ssm[lag < MIN_LAG_S] = -1.0
+    repetition = np.sort(ssm, axis=1)[:, -3:].mean(axis=1)
+
+    seg_energy = energy[:seconds * 10].reshape(seconds, 10).mean(axis=1)
+    csum = np.concatenate(([0.0], np.cumsum(seg_energy)))
+    idx = np.arange(seconds)
+    after = (csum[np.minimum(idx + RISE_S, seconds)] - csum[idx]) / np.maximum(np.minimum(RISE_S, seconds - idx), 1)
+    before = (csum[idx] - csum[np.maximum(idx - RISE_S, 0)]) / np.maximum(np.minimum(RISE_S, idx), 1)
+    rise = after - before
+
+    score = zscore(repetition) + zscore(seg_energy) + 0.5 * zscore(rise)
+    score = score[:room] - EARLY_BIAS * np.arange(room) / seconds
+    best = int(np.argmax(score))
+    # Snap to the strongest onset in the second leading into the hook
+    lo = max(0, best * 10 - 10)
+    frame = lo + int(np.argmax(onset[lo:best * 10 + 1]))
+    return frame * 100
+
+
+def analyze_batch(jobs):
+    results = {}
+    for job in jobs:
+        try:
+            path = clip_path(job['uri'], job.get('clip_dir', CLIP_DIR))
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"No local audio for {job['uri']}")
+            samples, rate = read_wav(path, 0, MAX_TRACK_MS)
+            results[job['uri']] = {'start_ms': hook_offset(samples, rate, job.get('clip_ms', CLIP_MS))}
+        except Exception as e:
+            results[job['uri']] = {'error': str(e)}
+    return results
+
+
+def analyze_tracks(uris, workers=None, filename=HOOKS_FILE, clip_dir=CLIP_DIR,
+                   batch_size=BATCH_SIZE, progress=None):
+    if np is None:
+        raise RuntimeError("numpy is required for hook detection")
+    cache = load_cache(filename)
+    todo = [{'uri': u, 'clip_dir': clip_dir} for u in dict.fromkeys(uris)
+            if u not in cache or 'error' in cache[u]]
+    if not todo:
+        return cache
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(analyze_batch, batch) for batch in batches]
+        for done, future in enumerate(as_completed(futures), start=1):
+            cache.update(future.result())
+            save_cache(cache, filename)
+            if progress:
+                progress(done, len(batches))
+    reload_offsets()
+    return cache
+
+
+def playlist_uris(sp, playlist_id):
+    results = sp.playlist_tracks(playlist_id)
+    items = list(results['items'])
+    while results.get('next'):
+        results = sp.next(results)
+        items.extend(results['items'])
+    return [item['track']['uri'] for item in items if item.get('track')]
+
+
+def analyze_playlist(sp, playlist_id, workers=None, **kwargs):
+    # The whole playlist goes to the pool as one job list
+    return analyze_tracks(playlist_uris(sp, playlist_id), workers=workers, **kwargs)
+
+
+# === Playback ===
+_offsets = None
+
+
+def start_offset(uri, filename=HOOKS_FILE):
+    # Suggested start in ms, or 0 when the track hasn't been analyzed
+    global _offsets
+    if _offsets is None:
+        _offsets = {u: r['start_ms'] for u, r in load_cache(filename).items() if 'start_ms' in r}
+    return _offsets.get(uri, 0)
+
+
+def reload_offsets():
+    global _offsets
+    _offsets = None
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    uris = sys.argv[1:]
+    if not uris and os.path.isdir(CLIP_DIR):
+        uris = ["spotify:track:" + name[:-4] for name in sorted(os.listdir(CLIP_DIR)) if name.endswith('.wav')]
+    start = time.perf_counter()
+    cache = analyze_tracks(uris, progress=lambda d, n: print(f"  batch {d}/{n}", end='\r'))
+    print(f"\n{len(uris)} tracks checked in {time.perf_counter() - start:.1f}s")
+    for uri in uris:
+        r = cache.get(uri, {})
+        print(f"{uri}: {r.get('start_ms', r.get('error'))}")
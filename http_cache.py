@@ -0,0 +1,102 @@
+# http_cache.py
+# Response caching for the Flask routes. A rendered body is kept per state
+# key together with its strong ETag and a pre-gzipped copy, so a repeat
+# request costs a key comparison: 304 if the client already has it, the
+# stored bytes otherwise.
+import gzip
+import hashlib
+import threading
+
+from flask import Response, request
+
+GZIP_MIN = 1024     # smaller bodies aren't worth compressing
+
+
+class CachedBody:
+    def __init__(self, body, mimetype):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self.gzipped = gzip.compress(body, 6) if len(body) >= GZIP_MIN else None
+
+
+class VersionedCache:
+    # Holds one body, rebuilt only when its key changes
+    def __init__(self, build, mimetype):
+        self.build = build
+        self.mimetype = mimetype
+        self.key = None
+        self.cached = None
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if self.cached is None or key != self.key:
+                self.cached = CachedBody(self.build(), self.mimetype)
+                self.key = key
+            return self.cached
+
+
+def respond(cached):
+    headers = {'ETag': f'"{cached.etag}"', 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    if request.if_none_match.contains(cached.etag):
+        return Response(status=304, headers=headers)
+    if cached.gzipped and 'gzip' in request.accept_encodings:
+        headers['Content-Encoding'] = 'gzip'
+        return Response(cached.gzipped, mimetype=cached.mimetype, headers=headers)
+    return Response(cached.body, mimetype=cached.mimetype, headers=headers)
+
+
+# === Load test: app2.py against the fake Spotify client ===
+def poll(client, path, requests, gzip_ok=True):
+    etag = None
+    sent = 0
+    for _ in range(requests):
+        headers = {'Accept-Encoding': 'gzip'} if gzip_ok else {}
+        if etag:
+            headers['If-None-Match'] = etag
+        resp = client.get(path, headers=headers)
+        etag = resp.headers.get('ETag') or etag
+        sent += len(resp.get_data())
+    return sent
+
+
+if __name__ == '__main__':
+    import json
+    import os
+    import shutil
+    import sys
+    import tempfile
+    import time
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    tmp = tempfile.mkdtemp()
+    os.chdir(tmp)
+    sys.path.insert(0, here)
+    os.environ['WALKUP_FAKE_SPOTIFY'] = '1'
+    from fake_spotify import make_catalog
+
+    tracks = make_catalog()
+    songs = [f"{t['name']} – {t['artists'][0]['name']}" for t in tracks]
+    with open("saved_assignments.json", 'w', encoding='utf-8') as f:
+        json.dump({f"Player {i}": {'batting_number': str(i + 1), 'song': songs[i]} for i in range(12)}, f)
+
+    import app2
+
+    client = app2.app.test_client()
+    requests = 2000
+    try:
+        for label, enabled in (("before", False), ("after", True)):
+            app2.HTTP_CACHE = enabled
+            for path in ('/api/lineup', '/'):
+                start = time.perf_counter()
+                sent = poll(client, path, requests)
+                elapsed = time.perf_counter() - start
+                print(f"{label:>6} {path:<12} {requests / elapsed:8.0f} req/s  "
+                      f"{sent / requests:9.0f} bytes/req")
+    finally:
+        app2.journal.close()
+        os.chdir(here)
+        shutil.rmtree(tmp)
@@ -0,0 +1,156 @@
+# journal.py
+# Append-only game journal so a crash or restart resumes at the exact
+# batter instead of the leadoff hitter. Events are JSON lines, written
+# straight through to the OS and fsync'd in batches by a background thread.
+# Every SNAPSHOT_EVERY events the state is written to a snapshot and the
+# journal is truncated, so restart time doesn't grow with the game.
+import json
+import os
+import threading
+import time
+
+JOURNAL_FILE = "game_journal.log"
+FLUSH_INTERVAL = 0.05   # seconds between batched fsyncs
+SNAPSHOT_EVERY = 500    # events between compactions
+
+EVENTS = ('batter_advanced', 'clip_started', 'clip_stopped', 'lineup_edited')
+
+
+def initial_state():
+    return {'batter_index': 0, 'playing': None, 'assignments': {}}
+
+
+def apply_event(state, rec):
+    event = rec['event']
+    if event == 'batter_advanced':
+        state['batter_index'] = rec['index']
+    elif event == 'clip_started':
+        state['playing'] = {'uri': rec.get('uri'), 'batter': rec.get('batter'), 'started': rec['t']}
+    elif event == 'clip_stopped':
+        state['playing'] = None
+    elif event == 'lineup_edited':
+        state['assignments'].update(rec.get('assignments', {}))
+
+
+class GameJournal:
+    def __init__(self, path=JOURNAL_FILE, flush_interval=FLUSH_INTERVAL, snapshot_every=SNAPSHOT_EVERY):
+        self.path = path
+        self.snapshot_path = path + ".snapshot.json"
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self.lock = threading.Lock()
+        self.state = initial_state()
+        self.seq = 0
+        self.since_snapshot = 0
+        self.recover()
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.dirty = False
+        self.closed = False
+        self.wake = threading.Event()
+        self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+
+    # === Recovery ===
+    def recover(self):
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                    snap = json.load(f)
+                self.state = snap['state']
+                self.seq = snap['seq']
+            except (json.JSONDecodeError, KeyError) as e:
+                print(f"⚠️ Journal snapshot is invalid, replaying from the log: {e}")
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn last line from a crash mid-write
+                    break
+                # Events already folded into the snapshot are skipped
+                if rec['seq'] <= self.seq:
+                    continue
+                apply_event(self.state, rec)
+                self.seq = rec['seq']
+                self.since_snapshot += 1
+
+    # === Writing ===
+    def record(self, event, **data):
+        if event not in EVENTS:
+            raise ValueError(f"Unknown journal event: {event}")
+        with self.lock:
+            self.seq += 1
+            rec = {'seq': self.seq, 't': time.time(), 'event': event, **data}
+            apply_event(self.state, rec)
+            self.file.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            # Hand the line to the OS now so a process crash loses nothing;
+            # only the fsync for power loss is batched
+            self.file.flush()
+            self.dirty = True
+            self.since_snapshot += 1
+            if self.since_snapshot >= self.snapshot_every:
+                self._compact()
+        return rec
+
+    def _flush_loop(self):
+        while not self.closed:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.sync()
+
+    def sync(self):
+        with self.lock:
+            if self.dirty and not self.file.closed:
+                os.fsync(self.file.fileno())
+                self.dirty = False
+
+    def _compact(self):
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'seq': self.seq, 'state': self.state}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        # A crash between the replace and the truncate is harmless: replay
+        # skips events at or below the snapshot's seq
+        self.file.close()
+        self.file = open(self.path, 'w', encoding='utf-8')
+        self.dirty = False
+        self.since_snapshot = 0
+
+    def compact(self):
+        with self.lock:
+            self._compact()
+
+    def close(self):
+        self.closed = True
+        self.wake.set()
+        self.sync()
+        with self.lock:
+            self.file.close()
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, JOURNAL_FILE)
+        journal = GameJournal(path)
+        start = time.perf_counter()
+        events = 10000
+        for i in range(events):
+            journal.record('batter_advanced', index=i % 9)
+            journal.record('clip_started', uri=f"spotify:track:{i}", batter=f"Player {i % 9}")
+            if i % 50 == 0:
+                journal.record('lineup_edited', assignments={f"Player {i % 9}": {'batting_number': str(i % 9 + 1), 'song': ''}})
+        write_ms = 1000 * (time.perf_counter() - start)
+        journal.close()
+
+        start = time.perf_counter()
+        restored = GameJournal(path)
+        recover_ms = 1000 * (time.perf_counter() - start)
+        restored.close()
+        print(f"wrote {restored.seq} events in {write_ms:.0f} ms; "
+              f"restart replayed to batter {restored.state['batter_index']} in {recover_ms:.2f} ms")
@@ -0,0 +1,35 @@
+# json_files.py
+# The JSON files several apps and tools share, and how they read and write
+# them: walkup_app.py's catalog cache, the saved assignments, the league
+# catalog, the pre-warm report. Kept out of the apps so importing these
+# helpers doesn't pull in any app's Spotify client setup.
+import json
+import os
+import tempfile
+
+CATALOG_CACHE = "catalog_cache.json"
+SAVE_FILE = "saved_assignments.json"
+
+
+def load_json(path, default):
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        try:
+            text = raw.decode('utf-8')
+        except UnicodeDecodeError:
+            # Written with the Windows default encoding by an older version
+            text = raw.decode('cp1252', errors='replace')
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            print(f"⚠️ {path} is invalid, ignoring it.")
+    return default
+
+
+def save_json(path, data):
+    # A temp file of its own, so two processes saving at once can't mix their writes
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=os.path.dirname(os.path.abspath(path)),
+                                     prefix=os.path.basename(path) + '.', suffix='.tmp', delete=False) as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(f.name, path)
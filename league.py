@@ -0,0 +1,326 @@
+# league.py
+# League operations view: every active game's current batter, what is
+# playing, the last press-to-audio latency, the Spotify breaker and the
+# error counts, on one page (/league) and from one call (/api/league).
+#
+# Each game's server (app2.py with WALKUP_LEAGUE_URL set) runs a
+# LeagueReporter, which looks at the game's own status every PUSH_INTERVAL
+# and sends the hub only the fields that changed, plus a heartbeat. The hub
+# folds those patches into one in-memory snapshot, so nothing asks 50 games
+# for anything when a dashboard loads. The snapshot is serialized once per
+# change and served with an ETag; /api/league?since=<version> waits until
+# something newer than version arrives, so an open dashboard costs one idle
+# request per LONG_POLL seconds between changes.
+#
+#   python league.py [--port 5050]
+#   python league.py bench [--games 50] [--watchers 12] [--seconds 20]
+#
+# Games are keyed by WALKUP_GAME, so each game's server needs its own.
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from flask import Flask, jsonify, render_template, request
+
+from http_cache import VersionedCache, respond
+
+LEAGUE_URL = os.getenv("WALKUP_LEAGUE_URL")  # e.g. http://pressbox:5050
+PORT = 5050
+PUSH_INTERVAL = 0.5     # seconds a reporter gathers changes before sending them
+HEARTBEAT = 5.0         # seconds between reports when nothing changed
+PUSH_TIMEOUT = 2.0
+STALE_AFTER = 15.0      # seconds without a report before a game shows as stale
+FORGET_AFTER = 3600.0   # seconds before a silent game leaves the dashboard
+LONG_POLL = 25.0        # seconds /api/league?since= holds a request
+
+
+# === Hub ===
+class LeagueSnapshot:
+    # Every game's last reported status, changed one patch at a time
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.changed = threading.Condition()
+        self.games = {}
+        self.version = 0
+
+    def apply(self, game, patch, full=False):
+        # False when the hub doesn't know the game and the patch isn't a full
+        # status (the hub restarted); the reporter then sends everything
+        with self.changed:
+            state = self.games.get(game)
+            if state is None:
+                if not full:
+                    return False
+                state = self.games[game] = {'game': game}
+            state.update(patch)
+            state['updated'] = self.clock()
+            if patch or state.get('stale'):
+                state['stale'] = False
+                self._bump(state)
+            return True
+
+    def _bump(self, state):
+        # Called with the lock held
+        self.version += 1
+        state['version'] = self.version
+        self.changed.notify_all()
+
+    def expire(self):
+        # Marks games that stopped reporting stale, and drops long-gone ones
+        now = self.clock()
+        with self.changed:
+            for game, state in list(self.games.items()):
+                age = now - state['updated']
+                if age > FORGET_AFTER:
+                    del self.games[game]
+                    self.version += 1
+                    self.changed.notify_all()
+                elif age > STALE_AFTER and not state.get('stale'):
+                    state['stale'] = True
+                    self._bump(state)
+
+    def wait(self, since, timeout=LONG_POLL):
+        with self.changed:
+            self.changed.wait_for(lambda: self.version > since, timeout)
+            return self.version
+
+    def serialize(self):
+        with self.changed:
+            games = sorted((dict(g) for g in self.games.values()),
+                           key=lambda g: (str(g.get('field') or ''), g['game']))
+            version = self.version
+        summary = {
+            'games': len(games),
+            'playing': sum(1 for g in games if (g.get('playback') or {}).get('state') == 'playing'),
+            'stale': sum(1 for g in games if g.get('stale')),
+            'degraded': sum(1 for g in games if g.get('mode') not in (None, 'spotify')),
+            'errors': sum(n for g in games for k, n in (g.get('errors') or {}).items() if k != 'plays'),
+        }
+        return json.dumps({'version': version, 'generated': self.clock(), 'summary': summary, 'games': games})
+
+    def run_expiry(self, interval=1.0):
+        while True:
+            time.sleep(interval)
+            self.expire()
+
+
+def make_app(snapshot):
+    app = Flask(__name__)
+    cache = VersionedCache(snapshot.serialize, 'application/json')
+
+    @app.route('/league')
+    def league_page():
+        return render_template('league.html')
+
+    @app.route('/api/league')
+    def api_league():
+        since = request.args.get('since', type=int)
+        version = snapshot.wait(since) if since is not None else snapshot.version
+        return respond(cache.get(version))
+
+    @app.route('/api/league/report', methods=['POST'])
+    def api_report():
+        report = request.get_json(force=True)
+        if not report.get('game'):
+            return jsonify({'error': 'No game'}), 400
+        if not snapshot.apply(report['game'], report.get('patch') or {}, full=report.get('full', False)):
+            return jsonify({'error': 'Unknown game, send the full status'}), 409
+        return jsonify({'ok': True})
+
+    return app
+
+
+def serve(port=PORT):
+    snapshot = LeagueSnapshot()
+    threading.Thread(target=snapshot.run_expiry, name="league-expiry", daemon=True).start()
+    # Every game reports every few seconds; the request log would be nothing else
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    print(f"🏟️ League dashboard on http://0.0.0.0:{port}/league")
+    make_app(snapshot).run(host='0.0.0.0', port=port, threaded=True)
+
+
+# === Game side ===
+class LeagueReporter:
+    # Sends the hub what changed in status() since the last report
+    def __init__(self, url, game, status, interval=PUSH_INTERVAL, heartbeat=HEARTBEAT, timeout=PUSH_TIMEOUT):
+        self.url = url.rstrip('/') + '/api/league/report' if url else None
+        self.game = game
+        self.status = status        # () -> dict of JSON-able fields
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.timeout = timeout
+        self.sent = {}              # what the hub has for this game
+        self.sent_at = 0.0
+        self.reachable = True
+        self.wake = threading.Event()
+        self.stopped = False
+        self.thread = None
+
+    def start(self):
+        if self.url:
+            self.thread = threading.Thread(target=self._run, name="league-reporter", daemon=True)
+            self.thread.start()
+            print(f"🏟️ Reporting {self.game} to the league dashboard at {self.url}")
+        return self
+
+    def poke(self):
+        # Something the dashboard shows changed; report it without waiting out the interval
+        self.wake.set()
+
+    def _run(self):
+        while not self.stopped:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self.report()
+            # Changes in quick succession go out together
+            time.sleep(self.interval / 5)
+
+    def report(self):
+        try:
+            current = self.status()
+        except Exception as e:
+            print(f"⚠️ League status failed: {e}")
+            return
+        patch = {k: v for k, v in current.items() if k not in self.sent or self.sent[k] != v}
+        if not patch and time.monotonic() - self.sent_at < self.heartbeat:
+            return
+        self._send(patch, full=not self.sent)
+
+    def _send(self, patch, full):
+        body = json.dumps({'game': self.game, 'full': full, 'patch': patch}, default=str).encode('utf-8')
+        req = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 409:
+                self.sent = {}  # the hub restarted; everything goes next time
+            else:
+                print(f"⚠️ League report rejected: {e}")
+            return
+        except OSError as e:
+            if self.reachable:
+                print(f"⚠️ League dashboard unreachable: {e}")
+            self.reachable = False
+            return
+        if not self.reachable:
+            print("✅ League dashboard reachable again")
+        self.reachable = True
+        self.sent.update(patch)
+        self.sent_at = time.monotonic()
+
+    def close(self):
+        self.stopped = True
+        self.wake.set()
+        if self.thread:
+            self.thread.join(self.timeout)
+
+
+# === Benchmark: 50 games reporting, a dozen dashboards watching ===
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else None
+
+
+def fake_game(i, rng):
+    # A game whose batter changes every few seconds instead of every few minutes
+    state = {'index': 0, 'next_at': time.monotonic() + rng.uniform(1, 4)}
+
+    def status():
+        if time.monotonic() >= state['next_at']:
+            state['index'] = (state['index'] + 1) % 12
+            state['next_at'] = time.monotonic() + rng.uniform(2, 6)
+        n = state['index']
+        return {'field': f"Field {i % 12 + 1}", 'batter': f"Player {n + 1}", 'index': n,
+                'playback': {'state': 'playing', 'kind': 'batter', 'label': f"Player {n + 1}", 'backend': 'spotify'},
+                'latency_ms': 180 + (i * 7 + n * 13) % 120, 'confirmed': True, 'mode': 'spotify',
+                'breaker': {'state': 'closed', 'trips': 0, 'failures': 0, 'last_error': None},
+                'errors': {'plays': n, 'not_found': 0, 'no_device': 0, 'not_confirmed': 0,
+                           'playback_error': 0, 'other': 0}}
+    return status
+
+
+def bench(games=50, watchers=12, seconds=20.0):
+    import contextlib
+    import io
+    import random
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    snapshot = LeagueSnapshot()
+    server = make_server('127.0.0.1', 0, make_app(snapshot), threaded=True)
+    url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    push_ms = []
+    lock = threading.Lock()
+
+    class TimedReporter(LeagueReporter):
+        def _send(self, patch, full):
+            start = time.perf_counter()
+            super()._send(patch, full)
+            with lock:
+                push_ms.append((time.perf_counter() - start) * 1000)
+
+    rng = random.Random(1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        reporters = [TimedReporter(url, f"game-{i:02d}", fake_game(i, rng)).start() for i in range(games)]
+    lags = []
+    fetches = [0]
+    stop = threading.Event()
+
+    def watch():
+        # What the page does: wait for the next version, then show it
+        version = 0
+        while not stop.is_set():
+            with urllib.request.urlopen(f"{url}/api/league?since={version}", timeout=LONG_POLL + 5) as response:
+                league = json.loads(response.read())
+            received = time.time()
+            if league['games']:
+                lags.append((received - max(g['updated'] for g in league['games'])) * 1000)
+            version = league['version']
+            fetches[0] += 1
+
+    threads = [threading.Thread(target=watch, daemon=True) for _ in range(watchers)]
+    for t in threads:
+        t.start()
+    cpu = time.process_time()
+    time.sleep(seconds)
+    cpu = time.process_time() - cpu
+    stop.set()
+
+    full = []
+    for _ in range(200):
+        start = time.perf_counter()
+        with urllib.request.urlopen(f"{url}/api/league", timeout=5) as response:
+            size = len(response.read())
+        full.append((time.perf_counter() - start) * 1000)
+    for r in reporters:
+        r.close()
+    server.shutdown()
+
+    print(f"  {games} games, {watchers} watchers, {seconds:.0f}s: {snapshot.version} changes, "
+          f"{len(push_ms)} reports, {fetches[0]} dashboard updates")
+    print(f"  report round trip   p50 {percentile(push_ms, 50):6.1f} ms   p99 {percentile(push_ms, 99):6.1f} ms")
+    print(f"  change to dashboard p50 {percentile(lags, 50):6.1f} ms   p99 {percentile(lags, 99):6.1f} ms")
+    print(f"  whole league GET    p50 {percentile(full, 50):6.1f} ms   p99 {percentile(full, 99):6.1f} ms   "
+          f"{size / 1024:.0f} KB")
+    print(f"  CPU {cpu / seconds * 100:.0f}% of one core (games, hub and watchers together)")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args[:1] == ['bench']:
+        opts = {'--games': 50, '--watchers': 12, '--seconds': 20.0}
+        for i in range(1, len(args) - 1, 2):
+            if args[i] in opts:
+                opts[args[i]] = type(opts[args[i]])(args[i + 1])
+        print("League dashboard under load")
+        bench(opts['--games'], opts['--watchers'], opts['--seconds'])
+        sys.exit(0)
+    serve(int(args[args.index('--port') + 1]) if '--port' in args else PORT)
@@ -0,0 +1,435 @@
+# lineup_history.py
+# Every version of the lineup, for undoing a wrong batting number or song
+# mid-inning and for putting the lineup back as it was at the start of an
+# inning. Versions are immutable maps of player -> assignment that share
+# everything an edit didn't touch (a small hash trie, PersistentMap below),
+# so each edit costs the players it changed, not the whole roster, and
+# undo, redo and restore only move a pointer to a version that already
+# exists. A restore is itself a version, so it can be undone too.
+#
+# Edits, undo/redo and inning marks are appended to HISTORY_FILE as JSON
+# lines and replayed on start, so the history lasts the tournament. Every
+# process with the lineup open (app2 workers, the Tk app) appends under a
+# file lock and first applies what the others appended, so version numbers
+# agree everywhere. A record that doesn't fit the history before it (its
+# version number is off) ends the replay, and it and everything after it
+# are moved to "<log>.rejected".
+#
+#   python lineup_history.py [log]            (recent versions)
+#   python lineup_history.py bench [--edits 10000]
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import nullcontext
+
+from file_lock import locked
+
+HISTORY_FILE = "lineup_history.log"
+BITS = 5                # children per trie node: 2 ** BITS
+DEPTH = 2               # levels before keys share a bucket (1024 buckets)
+MASK = (1 << BITS) - 1
+
+
+# === Persistent map ===
+# A node is (bitmap, children): bit i of bitmap says slot i is present and
+# children holds only the present slots, in order. Below DEPTH levels a
+# "node" is a bucket, a tuple of (key, value) pairs.
+def _slot(bitmap, bit):
+    return bin(bitmap & (bit - 1)).count('1')
+
+
+def _assoc(node, h, key, value, level):
+    # Returns (new node, 1 if key was added else 0)
+    if level == DEPTH:
+        bucket = node or ()
+        kept = tuple(pair for pair in bucket if pair[0] != key)
+        return kept + ((key, value),), int(len(kept) == len(bucket))
+    bitmap, children = node or (0, ())
+    bit = 1 << ((h >> (BITS * level)) & MASK)
+    i = _slot(bitmap, bit)
+    if bitmap & bit:
+        child, added = _assoc(children[i], h, key, value, level + 1)
+        return (bitmap, children[:i] + (child,) + children[i + 1:]), added
+    child, added = _assoc(None, h, key, value, level + 1)
+    return (bitmap | bit, children[:i] + (child,) + children[i:]), added
+
+
+def _dissoc(node, h, key, level):
+    # Returns the new node (None once empty), or node itself if key isn't there
+    if level == DEPTH:
+        kept = tuple(pair for pair in node if pair[0] != key)
+        return node if len(kept) == len(node) else (kept or None)
+    bitmap, children = node
+    bit = 1 << ((h >> (BITS * level)) & MASK)
+    if not bitmap & bit:
+        return node
+    i = _slot(bitmap, bit)
+    child = _dissoc(children[i], h, key, level + 1)
+    if child is children[i]:
+        return node
+    if child is None:
+        bitmap &= ~bit
+        return (bitmap, children[:i] + children[i + 1:]) if bitmap else None
+    return (bitmap, children[:i] + (child,) + children[i + 1:])
+
+
+def _walk(node, level):
+    if node is None:
+        return
+    if level == DEPTH:
+        yield from node
+        return
+    for child in node[1]:
+        yield from _walk(child, level + 1)
+
+
+class PersistentMap:
+    __slots__ = ('root', 'size')
+
+    def __init__(self, root=None, size=0):
+        self.root = root
+        self.size = size
+
+    def get(self, key, default=None):
+        node, h = self.root, hash(key)
+        for level in range(DEPTH):
+            if node is None:
+                return default
+            bitmap, children = node
+            bit = 1 << ((h >> (BITS * level)) & MASK)
+            if not bitmap & bit:
+                return default
+            node = children[_slot(bitmap, bit)]
+        for k, v in node or ():
+            if k == key:
+                return v
+        return default
+
+    def set(self, key, value):
+        root, added = _assoc(self.root, hash(key), key, value, 0)
+        return PersistentMap(root, self.size + added)
+
+    def delete(self, key):
+        if self.root is None:
+            return self
+        root = _dissoc(self.root, hash(key), key, 0)
+        return self if root is self.root else PersistentMap(root, self.size - 1)
+
+    def items(self):
+        return _walk(self.root, 0)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return self.size
+
+
+_MISSING = object()
+
+
+def freeze(info):
+    # Assignments are stored as sorted item tuples, so nothing can change a
+    # version after the fact
+    return tuple(sorted(info.items()))
+
+
+# === History ===
+class Version:
+    __slots__ = ('id', 'parent', 'lineup', 't', 'note', 'changed')
+
+    def __init__(self, id, parent, lineup, t, note, changed):
+        self.id = id
+        self.parent = parent    # the version this one was made from
+        self.lineup = lineup    # PersistentMap of player -> frozen assignment
+        self.t = t
+        self.note = note
+        self.changed = changed  # players this version changed
+
+
+class LineupHistory:
+    def __init__(self, path=HISTORY_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.versions = [Version(0, None, PersistentMap(), 0.0, 'empty', ())]
+        self.head = 0
+        self.redo_stack = []
+        self.innings = {}           # inning -> version the inning started with
+        self.offset = 0             # bytes of the log applied so far
+        self.file = open(path, 'ab') if path else None
+        with self.lock, self._shared():
+            self._catch_up()
+
+    # === Log ===
+    def _shared(self):
+        # The cross-process lock on the log
+        return locked(self.path) if self.path else nullcontext()
+
+    def _catch_up(self):
+        # Called with both locks held: applies what was appended since offset
+        if not self.path:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        applied = 0
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break       # torn by a crash mid-write: nobody is writing, we hold the lock
+            try:
+                rec = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                applied += len(line)
+                continue
+            if not self._apply(rec):
+                print(f"⚠️ {self.path} doesn't follow on from version {len(self.versions) - 1}; "
+                      f"moving the rest to {self.path}.rejected")
+                break
+            applied += len(line)
+        self.offset += applied
+        if applied < len(data):
+            with open(self.path + ".rejected", 'ab') as f:
+                f.write(data[applied:])
+            self.file.truncate(self.offset)
+
+    def _apply(self, rec):
+        # One log record; False if it doesn't fit the versions so far
+        op, v = rec.get('op'), rec.get('v')
+        known = isinstance(v, int) and 0 <= v < len(self.versions)
+        if op in ('edit', 'restore'):
+            if v != len(self.versions) or not 0 <= rec.get('parent', -1) < len(self.versions):
+                return False
+            if op == 'edit':
+                lineup = self.versions[rec['parent']].lineup
+                for player, info in rec['set'].items():
+                    lineup = lineup.set(player, freeze(info))
+                for player in rec['drop']:
+                    lineup = lineup.delete(player)
+                self._add(rec['parent'], lineup, rec['t'], rec['note'], list(rec['set']) + rec['drop'])
+            else:
+                if not 0 <= rec.get('source', -1) < len(self.versions):
+                    return False
+                self._add(rec['parent'], self.versions[rec['source']].lineup, rec['t'], rec['note'], ())
+        elif op in ('undo', 'redo') and v is None:
+            # Written before undo and redo recorded where they went
+            return (self._undo() if op == 'undo' else self._redo()) is not None
+        elif op == 'undo':
+            if not known:
+                return False
+            self.redo_stack.append(self.head)
+            self.head = v
+        elif op == 'redo':
+            if not known:
+                return False
+            if self.redo_stack and self.redo_stack[-1] == v:
+                self.redo_stack.pop()
+            else:
+                self.redo_stack.clear()
+            self.head = v
+        elif op == 'inning':
+            if not known:
+                return False
+            self.innings[rec['inning']] = v
+        else:
+            return False
+        return True
+
+    def _log(self, **rec):
+        # Called with both locks held, after _catch_up
+        if self.file:
+            line = (json.dumps(rec, ensure_ascii=False) + "\n").encode('utf-8')
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.offset += len(line)
+
+    def _add(self, parent, lineup, t, note, changed):
+        version = Version(len(self.versions), parent, lineup, t, note, tuple(changed))
+        self.versions.append(version)
+        self.head = version.id
+        self.redo_stack.clear()
+        return version
+
+    # === Editing ===
+    def record(self, assignments, note='edit'):
+        # A new version if assignments differ from the current one; returns its id
+        with self.lock, self._shared():
+            self._catch_up()
+            current = self.versions[self.head].lineup
+            changes = {p: info for p, info in assignments.items() if current.get(p) != freeze(info)}
+            dropped = [p for p, _ in current.items() if p not in assignments]
+            if not changes and not dropped:
+                return self.head
+            lineup = current
+            for player, info in changes.items():
+                lineup = lineup.set(player, freeze(info))
+            for player in dropped:
+                lineup = lineup.delete(player)
+            parent, t = self.head, time.time()
+            self._add(parent, lineup, t, note, list(changes) + dropped)
+            self._log(op='edit', v=self.head, parent=parent, set=changes, drop=dropped, t=t, note=note)
+            return self.head
+
+    def undo(self):
+        # Back to the version before the current one; None if there isn't one
+        with self.lock, self._shared():
+            self._catch_up()
+            if self._undo() is None:
+                return None
+            self._log(op='undo', v=self.head)
+            return self.head
+
+    def _undo(self):
+        parent = self.versions[self.head].parent
+        if not parent:
+            return None     # version 0 is the empty lineup before any load
+        self.redo_stack.append(self.head)
+        self.head = parent
+        return parent
+
+    def redo(self):
+        with self.lock, self._shared():
+            self._catch_up()
+            if self._redo() is None:
+                return None
+            self._log(op='redo', v=self.head)
+            return self.head
+
+    def _redo(self):
+        if not self.redo_stack:
+            return None
+        self.head = self.redo_stack.pop()
+        return self.head
+
+    # === Innings ===
+    def mark_inning(self, inning):
+        # The current lineup is the one inning starts with
+        with self.lock, self._shared():
+            self._catch_up()
+            self.innings[int(inning)] = self.head
+            self._log(op='inning', inning=int(inning), v=self.head)
+            return self.head
+
+    def restore(self, inning=None, version=None):
+        # Makes the lineup as of inning (or version) current; returns the new
+        # version's id, or None if there is no such inning or version
+        with self.lock, self._shared():
+            self._catch_up()
+            if inning is not None:
+                version = self.innings.get(int(inning))
+            if version is None or not 0 < int(version) < len(self.versions):
+                return None
+            source = self.versions[int(version)]
+            note = f"restored inning {inning}" if inning is not None else f"restored version {source.id}"
+            parent, t = self.head, time.time()
+            self._add(parent, source.lineup, t, note, ())
+            self._log(op='restore', v=self.head, parent=parent, source=source.id, t=t, note=note)
+            return self.head
+
+    # === Reading ===
+    def assignments(self, version=None):
+        with self.lock, self._shared():
+            self._catch_up()
+            lineup = self.versions[self.head if version is None else version].lineup
+        return {player: dict(info) for player, info in lineup.items()}
+
+    def listing(self, limit=50):
+        with self.lock, self._shared():
+            self._catch_up()
+            marks = {}
+            for inning, v in self.innings.items():
+                marks.setdefault(v, []).append(inning)
+            recent = self.versions[-limit:] if limit else self.versions[1:]
+            return {
+                'head': self.head, 'can_undo': bool(self.versions[self.head].parent),
+                'can_redo': bool(self.redo_stack), 'innings': dict(sorted(self.innings.items())),
+                'versions': [{'version': v.id, 'parent': v.parent, 't': v.t, 'note': v.note,
+                              'changed': list(v.changed), 'innings': sorted(marks.get(v.id, []))}
+                             for v in reversed(recent) if v.id],
+            }
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+
+# === Benchmark: a tournament of edits, shared versions vs. full copies ===
+def bench(edits=10000, players=15):
+    import random
+    import tracemalloc
+
+    rng = random.Random(3)
+    names = [f"Player {i}" for i in range(players)]
+    start_lineup = {p: {'batting_number': str(i + 1), 'song': f"Song {i}"} for i, p in enumerate(names)}
+
+    def edit(assignments):
+        player = rng.choice(names)
+        changed = dict(assignments)
+        changed[player] = {'batting_number': str(rng.randint(1, players)), 'song': f"Song {rng.randint(0, 400)}"}
+        return changed
+
+    # Full copies: what keeping a copy of saved_assignments.json per edit costs
+    tracemalloc.start()
+    copies = [json.loads(json.dumps(start_lineup))]
+    current = start_lineup
+    for _ in range(edits):
+        current = edit(current)
+        copies.append(json.loads(json.dumps(current)))
+    full_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del copies
+
+    def replay_edits():
+        rng.seed(3)
+        history = LineupHistory(path=None)
+        current = start_lineup
+        history.record(current)
+        for i in range(edits):
+            current = edit(current)
+            history.record(current)
+            if i % 200 == 0:
+                history.mark_inning(i // 200 + 1)
+        return history
+
+    tracemalloc.start()
+    history = replay_edits()
+    shared_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del history
+    record_s = time.perf_counter()
+    history = replay_edits()
+    record_s = time.perf_counter() - record_s
+
+    def per_step(step, n=edits):
+        start = time.perf_counter()
+        for _ in range(n):
+            step()
+        return (time.perf_counter() - start) / n * 1e6
+
+    undo_us = per_step(history.undo)
+    redo_us = per_step(history.redo)
+    restore_us = per_step(lambda: history.restore(inning=rng.randint(1, edits // 200)), 1000)
+    print(f"  {edits} edits of a {players}-player lineup")
+    print(f"  full copies     {full_bytes / 2 ** 20:7.1f} MB  ({full_bytes / edits:6.0f} bytes/edit)")
+    print(f"  shared versions {shared_bytes / 2 ** 20:7.1f} MB  ({shared_bytes / edits:6.0f} bytes/edit)")
+    print(f"  record {record_s / edits * 1e6:.1f} µs   undo {undo_us:.1f} µs   redo {redo_us:.1f} µs   "
+          f"restore inning {restore_us:.1f} µs")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args[:1] == ['bench']:
+        bench(int(args[args.index('--edits') + 1]) if '--edits' in args else 10000)
+        sys.exit(0)
+    history = LineupHistory(args[0] if args else HISTORY_FILE)
+    listing = history.listing(limit=20)
+    for v in listing['versions']:
+        marks = f"  ⚾ inning {', '.join(map(str, v['innings']))}" if v['innings'] else ""
+        head = "→" if v['version'] == listing['head'] else " "
+        print(f"{head} v{v['version']:<5} {time.strftime('%H:%M:%S', time.localtime(v['t']))}  {v['note']:<20} "
+              f"{', '.join(v['changed'][:4])}{' …' if len(v['changed']) > 4 else ''}{marks}")
+    history.close()
@@ -0,0 +1,464 @@
+# local_audio.py
+# Offline playback for when the field Wi-Fi can't reach Spotify. Each
+# player's clip is cached on disk as a WAV file and memory-mapped, so
+# starting at the player's offset is a slice, not a read. A feeder thread
+# streams the clip into a ring buffer that the sink's audio callback drains.
+# With a ClipStore (clip_store.py) a stored walk-up window is played in
+# preference to the full track, when it holds the whole play (PLAY_MS).
+# SpotifyBackend and LocalAudioBackend share the play/stop/set_volume/fade_out
+# interface, and FailoverPlayer switches to local audio when a Spotify call
+# times out or fails.
+import array
+import mmap
+import os
+import struct
+import threading
+import time
+import wave
+
+from profiling import timed
+
+CLIP_DIR = "clips"
+PERIOD_MS = 20          # audio callback size
+RING_MS = 500           # audio buffered ahead of the callback
+SPOTIFY_TIMEOUT = 1.5   # seconds before a Spotify call counts as failed
+FADE_STEPS = 5          # volume calls for a Spotify fade
+DEFAULT_VOLUME = 100    # percent, for a clip without a normalized level
+PLAY_MS = 32000         # longest walk-up play, MAX_PLAY_TIME plus the fade-out
+
+try:
+    import sounddevice
+except ImportError:
+    sounddevice = None
+
+
+def clip_path(uri, clip_dir=CLIP_DIR):
+    return os.path.join(clip_dir, uri.split(":")[-1] + ".wav")
+
+
+def scale_pcm16(data, gain):
+    if gain >= 0.999:
+        return data
+    samples = array.array('h')
+    samples.frombytes(data)
+    return array.array('h', [int(s * gain) for s in samples]).tobytes()
+
+
+# === Ring buffer ===
+class RingBuffer:
+    def __init__(self, capacity):
+        self.buf = bytearray(capacity)
+        self.capacity = capacity
+        self.read_pos = 0   # total bytes ever read
+        self.write_pos = 0  # total bytes ever written
+        self.cond = threading.Condition()
+
+    def available(self):
+        return self.write_pos - self.read_pos
+
+    def write(self, data, stop):
+        # Blocks while full; returns early once stop() is true
+        view = memoryview(data)
+        while len(view):
+            with self.cond:
+                while self.capacity - self.available() == 0 and not stop():
+                    self.cond.wait(0.05)
+                if stop():
+                    return
+                n = min(len(view), self.capacity - self.available())
+                start = self.write_pos % self.capacity
+                first = min(n, self.capacity - start)
+                self.buf[start:start + first] = view[:first]
+                self.buf[:n - first] = view[first:n]
+                self.write_pos += n
+            view = view[n:]
+
+    def read(self, n):
+        with self.cond:
+            n = min(n, self.available())
+            start = self.read_pos % self.capacity
+            first = min(n, self.capacity - start)
+            data = bytes(self.buf[start:start + first]) + bytes(self.buf[:n - first])
+            self.read_pos += n
+            self.cond.notify_all()
+        return data
+
+    def clear(self):
+        with self.cond:
+            self.read_pos = self.write_pos
+            self.cond.notify_all()
+
+
+# === Sinks ===
+class NullSink:
+    # Pulls audio at the real-time rate (times `speed`) and throws it away,
+    # recording when the first non-silent period came out
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.thread = None
+        self.running = False
+        self.first_audio_at = None
+        self.bytes_played = 0
+
+    def start(self, callback, rate, channels, sampwidth):
+        self.running = True
+        period_bytes = rate * PERIOD_MS // 1000 * channels * sampwidth
+        self.thread = threading.Thread(target=self._run, args=(callback, period_bytes), daemon=True)
+        self.thread.start()
+
+    def _run(self, callback, period_bytes):
+        period = PERIOD_MS / 1000 / self.speed
+        next_tick = time.perf_counter()
+        while self.running:
+            data = callback(period_bytes)
+            if data.strip(b"\0"):
+                if self.first_audio_at is None:
+                    self.first_audio_at = time.perf_counter()
+                self.bytes_played += len(data)
+            next_tick += period
+            time.sleep(max(0, next_tick - time.perf_counter()))
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+
+
+class SoundDeviceSink:
+    def __init__(self):
+        self.stream = None
+
+    def start(self, callback, rate, channels, sampwidth):
+        def fill(outdata, frames, time_info, status):
+            outdata[:] = callback(len(outdata))
+        self.stream = sounddevice.RawOutputStream(
+            samplerate=rate, channels=channels, dtype=f"int{8 * sampwidth}",
+            blocksize=rate * PERIOD_MS // 1000, latency='low', callback=fill)
+        self.stream.start()
+
+    def stop(self):
+        if self.stream:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+
+
+def default_sink():
+    # None without an audio device: NullSink plays nothing anyone can hear
+    return SoundDeviceSink() if sounddevice else None
+
+
+# === Local backend ===
+def data_offset(buf):
+    # Where the 'data' chunk's samples start; chunks (LIST, id3, ...) may
+    # come before or after it, each padded to an even length
+    pos = 12
+    while pos + 8 <= len(buf):
+        size = struct.unpack_from('<I', buf, pos + 4)[0]
+        if buf[pos:pos + 4] == b'data':
+            return pos + 8
+        pos += 8 + size + (size & 1)
+    raise wave.Error("no data chunk")
+
+
+class Clip:
+    def __init__(self, path):
+        with wave.open(path, 'rb') as w:
+            self.rate = w.getframerate()
+            self.channels = w.getnchannels()
+            self.sampwidth = w.getsampwidth()
+            self.frames = w.getnframes()
+        self.frame_bytes = self.channels * self.sampwidth
+        data_len = self.frames * self.frame_bytes
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        start = data_offset(self.map)
+        self.data = memoryview(self.map)[start:start + data_len]
+
+    def window(self, position_ms):
+        start = min(self.frames, self.rate * position_ms // 1000) * self.frame_bytes
+        return self.data[start:]
+
+    def format(self):
+        return self.rate, self.channels, self.sampwidth
+
+    def close(self):
+        try:
+            self.data.release()
+            self.map.close()
+        except BufferError:
+            # A feeder thread still holds a slice; the map closes with it
+            pass
+
+
+class LocalAudioBackend:
+    name = 'local'
+
+    def __init__(self, clip_dir=CLIP_DIR, sink=None, store=None):
+        self.clip_dir = clip_dir
+        self.store = store
+        self.sink = sink or default_sink()
+        # Without a sink there is no local audio to fail over to, and the
+        # readiness mode is 'silent', not 'local'
+        self.audible = self.sink is not None
+        if not self.audible:
+            print("⚠️ No audio output (sounddevice is not installed); local clips are off")
+            self.sink = NullSink()
+        self.sink_format = None
+        self.clips = {}
+        self.lock = threading.Lock()
+        if store is not None:
+            store.on_drop.append(self.forget)
+        self.ring = None
+        self.generation = 0
+        self.playing = False
+        self.volume = 1.0
+        self.fade_gain = 1.0
+        self.fade_step = 0.0
+
+    def has_clip(self, uri):
+        return self.audible and (uri in self.clips or os.path.exists(clip_path(uri, self.clip_dir))
+                or bool(self.store and self.store.has(uri)))
+
+    def has_any_clip(self):
+        if not self.audible:
+            return False
+        return bool(self.clips) or bool(self.store and len(self.store)) or (
+            os.path.isdir(self.clip_dir) and any(n.endswith('.wav') for n in os.listdir(self.clip_dir)))
+
+    def open_clip(self, uri):
+        if uri not in self.clips:
+            self.clips[uri] = Clip(clip_path(uri, self.clip_dir))
+        return self.clips[uri]
+
+    def locate(self, uri, position_ms=0, needed_ms=PLAY_MS):
+        # (clip, offset into it): the stored window holding the whole play,
+        # else the full track, else a stored window that ends early
+        entry = path = None
+        if self.store:
+            entry = self.store.find(uri, position_ms, needed_ms)
+            if entry is None and not os.path.exists(clip_path(uri, self.clip_dir)):
+                entry = self.store.find(uri, position_ms)
+            path = self.store.open(entry) if entry else None
+        if not path:
+            return self.open_clip(uri), position_ms
+        if path not in self.clips:
+            self.clips[path] = Clip(path)
+        return self.clips[path], position_ms - entry['start_ms']
+
+    def forget(self, path):
+        # The store evicted a window: unmap it (a playing feeder keeps its slice)
+        clip = self.clips.pop(path, None)
+        if clip is not None:
+            clip.close()
+
+    def play(self, uri, position_ms=0, device_id=None):
+        clip, position_ms = self.locate(uri, position_ms)
+        if self.sink_format != clip.format():
+            # Reopen the sink outside the lock, its callback takes the lock too
+            self.stop()
+            self.sink.stop()
+            self.ring = RingBuffer(clip.rate * RING_MS // 1000 * clip.frame_bytes)
+            self.sink_format = clip.format()
+            self.sink.start(self.render, *self.sink_format)
+        period_bytes = clip.rate * PERIOD_MS // 1000 * clip.frame_bytes
+        window = clip.window(position_ms)
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+            self.ring.clear()
+            self.fade_gain = 1.0
+            self.fade_step = 0.0
+            # Prefill two periods so the very next callback has audio
+            self.ring.write(window[:2 * period_bytes], lambda: False)
+            self.playing = True
+        threading.Thread(target=self._feed, args=(window[2 * period_bytes:], generation), daemon=True).start()
+
+    def _feed(self, window, generation):
+        self.ring.write(window, lambda: generation != self.generation)
+
+    def render(self, nbytes):
+        with self.lock:
+            if not self.playing:
+                return b"\0" * nbytes
+            data = self.ring.read(nbytes)
+            gain = self.volume * self.fade_gain
+            if self.fade_step:
+                self.fade_gain = max(0.0, self.fade_gain - self.fade_step)
+                if self.fade_gain == 0.0:
+                    self._stop()
+        if self.sink_format[2] == 2:
+            data = scale_pcm16(data, gain)
+        return data + b"\0" * (nbytes - len(data))
+
+    def _stop(self):
+        self.generation += 1
+        self.playing = False
+        self.fade_step = 0.0
+        if self.ring:
+            self.ring.clear()
+
+    def stop(self, device_id=None):
+        with self.lock:
+            self._stop()
+
+    def set_volume(self, percent, device_id=None):
+        with self.lock:
+            self.volume = percent / 100
+
+    def fade_out(self, seconds, device_id=None, cancelled=None):
+        # The ramp runs inside the audio callback, one step per period; a new
+        # play() resets it, so there is nothing to cancel
+        with self.lock:
+            self.fade_step = 1.0 / max(1, seconds * 1000 / PERIOD_MS)
+        return True
+
+    def close(self):
+        self.stop()
+        self.sink.stop()
+        for clip in self.clips.values():
+            clip.close()
+        self.clips = {}
+
+
+# === Spotify backend ===
+class SpotifyBackend:
+    name = 'spotify'
+
+    def __init__(self, sp, preloader=None):
+        self.sp = sp
+        self.preloader = preloader
+        self.current_volume = 100
+
+    def play(self, uri, position_ms=0, device_id=None):
+        if self.preloader:
+            self.preloader.play(uri, device_id=device_id, position_ms=position_ms)
+        else:
+            self.sp.start_playback(device_id=device_id, uris=[uri], position_ms=position_ms or None)
+
+    def stop(self, device_id=None):
+        self.sp.pause_playback(device_id=device_id)
+
+    def set_volume(self, percent, device_id=None):
+        # Consecutive clips at the same level don't cost a call
+        if int(percent) != self.current_volume:
+            self.sp.volume(int(percent), device_id=device_id)
+            self.current_volume = int(percent)
+
+    def fade_out(self, seconds, device_id=None, cancelled=None):
+        # Each step is a Web API call, so keep the fade coarse. If another
+        # clip takes over mid-fade (cancelled() turns true) the ramp stops
+        # and the level that clip asked for is put back.
+        volume = self.current_volume
+        for i in range(FADE_STEPS - 1, -1, -1):
+            if cancelled and cancelled():
+                self.sp.volume(self.current_volume, device_id=device_id)
+                return False
+            self.sp.volume(volume * i // FADE_STEPS, device_id=device_id)
+            time.sleep(seconds / FADE_STEPS)
+        if cancelled and cancelled():
+            self.sp.volume(self.current_volume, device_id=device_id)
+            return False
+        self.sp.pause_playback(device_id=device_id)
+        self.sp.volume(self.current_volume, device_id=device_id)
+        return True
+
+
+# === Failover ===
+class FailoverPlayer:
+    def __init__(self, primary, fallback, timeout=SPOTIFY_TIMEOUT):
+        self.primary = primary
+        self.fallback = fallback
+        self.timeout = timeout
+        self.active = primary
+
+    def _call(self, fn, *args, **kwargs):
+        # Runs fn with a deadline. If it finishes after we've given up on it,
+        # the late play is paused so both backends don't sound at once.
+        outcome = {}
+        done = threading.Event()
+
+        def run():
+            try:
+                fn(*args, **kwargs)
+                outcome['ok'] = True
+            except Exception as e:
+                outcome['error'] = e
+            done.set()
+            if outcome.get('abandoned') and outcome.get('ok') and fn == self.primary.play:
+                try:
+                    self.primary.stop(device_id=kwargs.get('device_id'))
+                except Exception:
+                    pass
+
+        threading.Thread(target=run, daemon=True).start()
+        if not done.wait(self.timeout):
+            outcome['abandoned'] = True
+            raise TimeoutError(f"{self.primary.name} call timed out after {self.timeout}s")
+        if 'error' in outcome:
+            raise outcome['error']
+
+    @timed('start_playback')
+    def play(self, uri, position_ms=0, device_id=None, volume=None):
+        # volume is the clip's normalized level in percent (see loudness.py);
+        # a clip without one plays at DEFAULT_VOLUME, not the last clip's level.
+        # Spotify's volume call goes out alongside the play, not before it.
+        volume = DEFAULT_VOLUME if volume is None else volume
+        self.fallback.set_volume(volume)
+        threading.Thread(target=self._set_volume, args=(volume, device_id), daemon=True).start()
+        if not self.fallback.has_clip(uri):
+            self.primary.play(uri, position_ms=position_ms, device_id=device_id)
+            self.active = self.primary
+            return self.primary.name
+        try:
+            self._call(self.primary.play, uri, position_ms=position_ms, device_id=device_id)
+            self.active = self.primary
+        except Exception as e:
+            print(f"⚠️ Spotify playback failed ({e}), playing local clip")
+            self.fallback.play(uri, position_ms=position_ms)
+            self.active = self.fallback
+        return self.active.name
+
+    def _set_volume(self, volume, device_id):
+        try:
+            self.primary.set_volume(volume, device_id=device_id)
+        except Exception as e:
+            print(f"⚠️ Could not set volume: {e}")
+
+    def stop(self, device_id=None):
+        if self.active is self.fallback:
+            self.fallback.stop()
+        else:
+            self.primary.stop(device_id=device_id)
+
+    def fade_out(self, seconds, device_id=None, cancelled=None):
+        if self.active is self.fallback:
+            return self.fallback.fade_out(seconds, cancelled=cancelled)
+        return self.primary.fade_out(seconds, device_id=device_id, cancelled=cancelled)
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = "spotify:track:localbenchmark"
+        rate, seconds = 44100, 40
+        with wave.open(clip_path(uri, tmp), 'wb') as w:
+            w.setnchannels(2)
+            w.setsampwidth(2)
+            w.setframerate(rate)
+            w.writeframes(array.array('h', [1000, -1000] * rate * seconds).tobytes())
+        sink = NullSink()
+        backend = LocalAudioBackend(tmp, sink=sink)
+        runs = []
+        for _ in range(5):
+            start = time.perf_counter()
+            sink.first_audio_at = None
+            backend.play(uri, position_ms=15000)
+            while sink.first_audio_at is None:
+                time.sleep(0.001)
+            runs.append(1000 * (sink.first_audio_at - start))
+            time.sleep(0.1)
+            backend.stop()
+        backend.close()
+        print(f"play-to-first-audio: mean {sum(runs) / len(runs):.1f} ms, max {max(runs):.1f} ms")
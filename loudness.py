@@ -0,0 +1,221 @@
+# loudness.py
+# Measures the integrated loudness of each player's clip window so playback
+# can set a per-clip volume instead of the announcer riding the fader.
+# Loudness follows ITU-R BS.1770 (K-weighting, 400 ms gated blocks) with the
+# K-weighting applied in the frequency domain, so a whole clip is a handful
+# of NumPy array operations. Results are cached by track URI in
+# LOUDNESS_FILE and only new or changed clips are analyzed.
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import urllib.request
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from local_audio import CLIP_DIR, clip_path
+
+LOUDNESS_FILE = "loudness_cache.json"
+TARGET_LUFS = -18.0     # clips louder than this are turned down to it
+MIN_VOLUME = 30         # never duck a clip below this percent
+WINDOW_MS = 30000       # default clip window (MAX_PLAY_TIME)
+ANALYSIS_RATE = 22050   # audio is decoded/resampled to this rate
+BATCH_SIZE = 16         # clips per worker task
+
+
+# === Audio loading ===
+def read_wav(path, start_ms, duration_ms):
+    with wave.open(path, 'rb') as w:
+        rate, channels, width = w.getframerate(), w.getnchannels(), w.getsampwidth()
+        w.setpos(min(w.getnframes(), rate * start_ms // 1000))
+        raw = w.readframes(rate * duration_ms // 1000)
+    if width != 2:
+        raise ValueError(f"{path}: only 16-bit PCM clips are supported")
+    samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768.0
+    return samples.reshape(-1, channels).T, rate
+
+
+def decode_preview(url, start_ms, duration_ms):
+    # Spotify previews are MP3, so decoding needs ffmpeg on the PATH
+    if not shutil.which('ffmpeg'):
+        raise RuntimeError("ffmpeg is required to analyze preview audio")
+    with tempfile.NamedTemporaryFile(suffix='.mp3') as f:
+        with urllib.request.urlopen(url, timeout=10) as resp:
+            f.write(resp.read())
+        f.flush()
+        out = subprocess.run(
+            ['ffmpeg', '-v', 'quiet', '-ss', str(start_ms / 1000), '-t', str(duration_ms / 1000),
+             '-i', f.name, '-f', 'f32le', '-ac', '2', '-ar', str(ANALYSIS_RATE), '-'],
+            check=True, capture_output=True).stdout
+    return np.frombuffer(out, dtype='<f4').reshape(-1, 2).T, ANALYSIS_RATE
+
+
+def load_window(job):
+    path = clip_path(job['uri'], job.get('clip_dir', CLIP_DIR))
+    if os.path.exists(path):
+        return read_wav(path, job['start_ms'], job['duration_ms']) + ('local',)
+    if job.get('preview_url'):
+        return decode_preview(job['preview_url'], job['start_ms'], job['duration_ms']) + ('preview',)
+    raise FileNotFoundError(f"No local clip or preview for {job['uri']}")
+
+
+# === Loudness ===
+def k_weighting_power(freqs, rate):
+    # |H(f)|^2 of the BS.1770 pre-filter (high shelf) and RLB high-pass,
+    # with coefficients derived for the given sample rate
+    def biquad_power(b, a):
+        z = np.exp(-2j * np.pi * freqs / rate)
+        h = (b[0] + b[1] * z + b[2] * z ** 2) / (a[0] + a[1] * z + a[2] * z ** 2)
+        return np.abs(h) ** 2
+
+    f0, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = np.tan(np.pi * f0 / rate)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = biquad_power(
+        [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0],
+        [1, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0])
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = np.tan(np.pi * f0 / rate)
+    a0 = 1 + k / q + k * k
+    highpass = biquad_power([1, -2, 1], [1, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0])
+    return shelf * highpass
+
+
+def integrated_loudness(samples, rate):
+    # samples: (channels, n) float array in [-1, 1]
+    step = rate // 10                          # 100 ms sub-blocks
+    n = samples.shape[1] // step
+    if n < 4:
+        return None
+    sub = samples[:, :n * step].reshape(samples.shape[0], n, step)
+    spectrum = np.fft.rfft(sub, axis=2)
+    weight = k_weighting_power(np.fft.rfftfreq(step, 1 / rate), rate)
+    # Parseval: mean square of the filtered sub-block from its spectrum
+    power = np.abs(spectrum) ** 2 * weight
+    # Every bin but DC (and Nyquist, for even lengths) stands for two
+    power[..., 1:len(weight) - (step % 2 == 0)] *= 2
+    sub_ms = power.sum(axis=2) / step ** 2
+    # 400 ms blocks with 75% overlap are the mean of four sub-blocks,
+    # summed over channels (stereo channel weights are 1.0)
+    block_ms = np.convolve(sub_ms.sum(axis=0), np.ones(4) / 4, mode='valid')
+    block_lufs = -0.691 + 10 * np.log10(np.maximum(block_ms, 1e-12))
+    gated = block_ms[block_lufs > -70]
+    if not len(gated):
+        return None
+    relative = -0.691 + 10 * np.log10(gated.mean()) - 10
+    gated = gated[-0.691 + 10 * np.log10(gated) > relative]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def analyze_batch(jobs):
+    results = {}
+    for job in jobs:
+        try:
+            samples, rate, source = load_window(job)
+            lufs = integrated_loudness(samples, rate)
+            results[job['uri']] = {'lufs': lufs, 'start_ms': job['start_ms'],
+                                   'duration_ms': job['duration_ms'], 'source': source}
+        except Exception as e:
+            results[job['uri']] = {'error': str(e), 'start_ms': job['start_ms'],
+                                   'duration_ms': job['duration_ms']}
+    return results
+
+
+# === Cache ===
+def load_cache(filename=LOUDNESS_FILE):
+    if os.path.exists(filename):
+        with open(filename, 'r', encoding='utf-8') as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                print("⚠️ Loudness cache is invalid. Starting fresh.")
+    return {}
+
+
+def save_cache(cache, filename=LOUDNESS_FILE):
+    tmp = filename + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=1)
+    os.replace(tmp, filename)
+
+
+def pending_jobs(jobs, cache):
+    # Only clips that are new, or whose window moved, need analysis
+    todo = []
+    for job in jobs:
+        hit = cache.get(job['uri'])
+        if not hit or hit.get('error') or (hit['start_ms'], hit['duration_ms']) != (job['start_ms'], job['duration_ms']):
+            todo.append(job)
+    return todo
+
+
+def make_job(uri, start_ms=0, duration_ms=WINDOW_MS, preview_url=None, clip_dir=CLIP_DIR):
+    return {'uri': uri, 'start_ms': start_ms, 'duration_ms': duration_ms,
+            'preview_url': preview_url, 'clip_dir': clip_dir}
+
+
+def analyze_catalog(jobs, workers=None, filename=LOUDNESS_FILE, batch_size=BATCH_SIZE, progress=None):
+    if np is None:
+        raise RuntimeError("numpy is required for loudness analysis")
+    cache = load_cache(filename)
+    todo = pending_jobs(jobs, cache)
+    if not todo:
+        return cache
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(analyze_batch, batch) for batch in batches]
+        for done, future in enumerate(as_completed(futures), start=1):
+            cache.update(future.result())
+            # Saved per batch, so an interrupted run resumes where it stopped
+            save_cache(cache, filename)
+            if progress:
+                progress(done, len(batches))
+    return cache
+
+
+# === Playback ===
+_volumes = None
+
+
+def target_volume(uri, filename=LOUDNESS_FILE):
+    # Volume percent that brings the clip to TARGET_LUFS; None if unanalyzed
+    global _volumes
+    if _volumes is None:
+        _volumes = {u: r['lufs'] for u, r in load_cache(filename).items() if r.get('lufs') is not None}
+    lufs = _volumes.get(uri)
+    if lufs is None:
+        return None
+    gain = 10 ** ((TARGET_LUFS - lufs) / 20)
+    return int(max(MIN_VOLUME, min(100, round(100 * gain))))
+
+
+def reload_volumes():
+    global _volumes
+    _volumes = None
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    # Analyze every cached clip in CLIP_DIR (or the given URIs)
+    uris = sys.argv[1:]
+    if not uris and os.path.isdir(CLIP_DIR):
+        uris = ["spotify:track:" + name[:-4] for name in sorted(os.listdir(CLIP_DIR)) if name.endswith('.wav')]
+    # Measure the window that will actually play, from the hook offset
+    from hooks import start_offset
+    start = time.perf_counter()
+    cache = analyze_catalog([make_job(u, start_ms=start_offset(u)) for u in uris],
+                            progress=lambda d, n: print(f"  batch {d}/{n}", end='\r'))
+    print(f"\n{len(uris)} clips checked in {time.perf_counter() - start:.1f}s")
+    for uri in uris:
+        r = cache.get(uri, {})
+        print(f"{uri}: {r.get('lufs', r.get('error'))} -> volume {target_volume(uri)}")
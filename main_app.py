@@ -6,13 +6,39 @@ from spotipy import Spotify
 from spotipy.oauth2 import SpotifyOAuth
 import threading
 import time
+from journal import GameJournal
+from local_audio import FailoverPlayer, LocalAudioBackend, SpotifyBackend
+from loudness import target_volume
+from hooks import start_offset
+import profiling
+from profiling import profiled, timed
+from preload import resolve_uri
+from play_history import PlayHistory
+from breaker import GuardedClient
+from catalog import FederatedCatalog, load_playlists
+from walkup_daemon import DaemonError, connect
 
 # === CONFIGURATION ===
-PLAYLIST_ID = "116HUEoHRJLuIvrVXSNTTS"  # Your playlist ID
+PLAYLIST_ID = "116HUEoHRJLuIvrVXSNTTS"  # Your playlist ID, when there's no playlists.json
+TEAM = os.getenv("WALKUP_TEAM")  # whose playlists to show; unset shows the whole league's
 SAVE_FILE = "saved_assignments.json"
 MAX_PLAY_TIME = 30  # seconds
 
-sp = Spotify(auth_manager=SpotifyOAuth(scope="user-modify-playback-state,user-read-playback-state"))
+# === Local playback ===
+# Built only when this window plays clips itself: not while the walk-up
+# daemon owns playback, and at once if the daemon goes away
+sp = player = history = None
+
+def start_local():
+    global sp, player, history
+    if sp is not None:
+        return
+    client = Spotify(auth_manager=SpotifyOAuth(scope="user-modify-playback-state,user-read-playback-state"))
+    # Per-call deadlines and a circuit breaker, so an outage fails fast
+    sp = GuardedClient(client)
+    # Falls back to cached clips on disk when Spotify can't be reached
+    player = FailoverPlayer(SpotifyBackend(sp), LocalAudioBackend())
+    history = PlayHistory()
 
 # === FUNCTIONS ===
 def load_saved_data(filename=SAVE_FILE):
@@ -29,10 +55,13 @@ def save_data(assignments, filename=SAVE_FILE):
     with open(filename, 'w') as f:
         json.dump(assignments, f, indent=2)
 
-def get_playlist_tracks(playlist_id):
-    results = sp.playlist_tracks(playlist_id)
-    return [item['track']['name'] + " – " + item['track']['artists'][0]['name'] for item in results['items'] if item['track']]
+def load_catalog():
+    # The league's (or TEAM's) songs; only changed playlists are refetched
+    catalog = FederatedCatalog(sp, load_playlists(default=PLAYLIST_ID))
+    catalog.sync()
+    return catalog.songs(TEAM)
 
+@timed('build_lineup')
 def initialize_roster(saved_data, available_songs):
     roster = []
     for name, info in saved_data.items():
@@ -54,18 +83,38 @@ def get_batter_by_order(roster, current_index):
     next_next = roster[(current_index + 2) % len(roster)]
     return current, next_, next_next
 
-def play_song(song_name):
-    results = sp.search(q=song_name, type='track', limit=1)
-    if results['tracks']['items']:
-        uri = results['tracks']['items'][0]['uri']
+@profiled('play_song')
+def play_song(song_name, batter=None):
+    # Returns the play-history entry of a clip that started, else None
+    requested = time.time()
+    uri = resolve_uri(sp, song_name)
+    if not uri:
+        history.failed(None, 'not_found', batter=batter, requested=requested)
+        return None
+    try:
         devices = sp.devices()['devices']
-        if devices:
-            sp.start_playback(device_id=devices[0]['id'], uris=[uri])
-            return True
-    return False
+    except Exception as e:
+        print(f"⚠️ Could not list devices: {e}")
+        devices = []
+    if not devices and not player.fallback.has_clip(uri):
+        history.failed(uri, 'no_device', batter=batter, requested=requested)
+        return None
+    play = history.begin(uri, batter=batter, requested=requested)
+    device_id = devices[0]['id'] if devices else None
+    try:
+        backend = player.play(uri, device_id=device_id, position_ms=start_offset(uri), volume=target_volume(uri))
+    except Exception:
+        play['failure'] = 'playback_error'
+        history.finish(play)
+        raise
+    history.accepted(play, backend, device_id)
+    return play
 
 def stop_song():
-    sp.pause_playback()
+    try:
+        player.stop()
+    except Exception as e:
+        print(f"⚠️ Could not stop playback: {e}")
 
 # === GUI ===
 class WalkupApp:
@@ -74,14 +123,47 @@ class WalkupApp:
         self.root.title("Walk-up Song App")
 
         self.assignments = load_saved_data()
-        self.available_songs = get_playlist_tracks(PLAYLIST_ID)
-        self.roster = initialize_roster(self.assignments, self.available_songs)
-        self.batter_index = 0
+        # With the walk-up daemon running, Next and Stop go to it and this
+        # window follows the same batter pointer as the other front ends
+        self.daemon = connect()
+        if self.daemon:
+            try:
+                state = self.daemon.call('state')
+                self.batter_index = state['current_index']
+                # The daemon's lineup, so the pointer means the same batter here
+                self.roster = [{'name': b['name'], 'batting_number': b['number'], 'song': b['song']}
+                               for b in state['lineup']]
+            except DaemonError as e:
+                print(f"⚠️ {e}")
+                self.daemon = None
+        if not self.daemon:
+            self.go_local()
         self.playing = False
+        self.current_play = None
 
         self.create_widgets()
         self.update_display()
 
+    def go_local(self):
+        # Plays clips from this window: at start without a daemon, or when
+        # the daemon stops answering mid-game
+        start_local()
+        self.available_songs = load_catalog()
+        self.journal = GameJournal()
+        # Resume at the batter the last run left off on (the daemon kept it in the same journal)
+        self.batter_index = self.journal.state['batter_index']
+        self.roster = initialize_roster(self.assignments, self.available_songs)
+
+    def daemon_call(self, cmd):
+        # None when the daemon went away and this window took over playback
+        try:
+            return self.daemon.call(cmd)
+        except DaemonError as e:
+            print(f"⚠️ {e}; playing from this window instead")
+            self.daemon = None
+            self.go_local()
+            return None
+
     def create_widgets(self):
         self.info_label = tk.Label(self.root, text="", font=("Arial", 16))
         self.info_label.pack(pady=10)
@@ -115,35 +197,59 @@ class WalkupApp:
         else:
             self.next_next_label.config(text="")
 
+    @profiled('play_next_batter')
     def play_next_batter(self):
         if not self.roster:
             return
+        if self.daemon:
+            self.update_display()
+            reply = self.daemon_call('next')
+            if reply is not None:
+                self.batter_index = reply.get('current_index', self.batter_index)
+                return
+            if not self.roster:
+                return
 
         current = self.roster[self.batter_index % len(self.roster)]
         self.update_display()
 
         if current['song']:
             self.playing = True
-            threading.Thread(target=self._play_and_limit_duration, args=(current['song'],)).start()
+            threading.Thread(target=self._play_and_limit_duration, args=(current['song'], current['name']),
+                             daemon=True).start()
+            self.journal.record('clip_started', batter=current['name'], song=current['song'])
             self.batter_index = (self.batter_index + 1) % len(self.roster)
+            self.journal.record('batter_advanced', index=self.batter_index)
         else:
             self.batter_index = (self.batter_index + 1) % len(self.roster)
+            self.journal.record('batter_advanced', index=self.batter_index)
             self.play_next_batter()
 
-    def _play_and_limit_duration(self, song):
-        if play_song(song):
+    def _play_and_limit_duration(self, song, batter=None):
+        play = play_song(song, batter)
+        if play:
+            self.current_play = play
             time.sleep(MAX_PLAY_TIME)
             if self.playing:
                 stop_song()
+                self.journal.record('clip_stopped')
                 print(f"⏹️ Stopped after {MAX_PLAY_TIME}s with fade-out.")
+            history.finish(play, min(MAX_PLAY_TIME, time.time() - play['requested']))
         self.playing = False
 
     def stop_playback(self):
+        if self.daemon and self.daemon_call('stop') is not None:
+            print("⏹️ Playback manually stopped.")
+            return
         stop_song()
+        if self.current_play:
+            history.finish(self.current_play, time.time() - self.current_play['requested'])
         self.playing = False
+        self.journal.record('clip_stopped')
         print("⏹️ Playback manually stopped.")
 
 if __name__ == "__main__":
+    profiling.install_signal_handler()
     root = tk.Tk()
     app = WalkupApp(root)
     root.mainloop()
@@ -0,0 +1,331 @@
+# play_history.py
+# Append-only log of every clip played: game, field, device, batter, URI,
+# requested and confirmed times, how long it played and why it failed.
+# Records are fixed-width (RECORD below) after a small header, so the file
+# is read back with numpy.memmap and every query is a few array operations
+# over the columns, never one Python object per play. Strings (game, batter,
+# URI...) are interned to ids in a names file next to the log.
+#
+#   python play_history.py usage|latency|failures [--by field|device|game] [--file LOG ...]
+#   python play_history.py bench [--plays 2000000]
+import json
+import os
+import struct
+import threading
+import time
+
+from file_lock import locked
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HISTORY_FILE = "play_history.bin"
+MAGIC = b"WALKHIST"
+VERSION = 1
+# game, field, device, batter, uri, requested, confirmed, played_ms, failure, backend, kind
+RECORD = struct.Struct('<5I2dI3Bx')
+HEADER = struct.Struct('<8sII')
+
+FAILURES = ('', 'not_found', 'no_device', 'not_confirmed', 'playback_error', 'other')
+BACKENDS = ('', 'spotify', 'local')
+KINDS = ('batter', 'program')
+PERCENTILES = (50, 90, 99)
+
+if np is not None:
+    DTYPE = np.dtype([('game', '<u4'), ('field', '<u4'), ('device', '<u4'), ('batter', '<u4'), ('uri', '<u4'),
+                      ('requested', '<f8'), ('confirmed', '<f8'), ('played_ms', '<u4'),
+                      ('failure', 'u1'), ('backend', 'u1'), ('kind', 'u1'), ('pad', 'u1')])
+    assert DTYPE.itemsize == RECORD.size
+
+
+def names_path(path):
+    return path + ".names"
+
+
+def read_names(path):
+    if not os.path.exists(names_path(path)):
+        return []
+    with open(names_path(path), 'rb') as f:
+        data = f.read()
+    # A line still being written is left for next time
+    return [json.loads(line) for line in data[:data.rfind(b"\n") + 1].splitlines() if line.strip()]
+
+
+# === Writing ===
+class PlayHistory:
+    # Several processes (app2 workers, the Tk apps) can append to one log.
+    # Records and new names are written under a file lock, and the names
+    # other writers added are read in first, so an id means the same name
+    # to everyone.
+    def __init__(self, path=HISTORY_FILE, game=None, field=None):
+        self.path = path
+        self.game = game or os.getenv("WALKUP_GAME", "default")
+        self.field = field or os.getenv("WALKUP_FIELD", "")
+        self.lock = threading.Lock()
+        self.names = []
+        self.ids = {}
+        self.names_read = 0         # bytes of the names file already in self.names
+        self.counts = {'plays': 0, **{f: 0 for f in FAILURES if f}}  # since this process started
+        self.file = open(path, 'ab')
+        self.names_file = open(names_path(path), 'ab')
+        with locked(path):
+            size = os.path.getsize(path)
+            if size < HEADER.size:
+                self.file.truncate(0)
+                self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+                self.file.flush()
+            elif (size - HEADER.size) % RECORD.size:
+                # Drop a record torn by a crash mid-write
+                self.file.truncate(size - (size - HEADER.size) % RECORD.size)
+            self._read_names()
+
+    def _read_names(self):
+        # Called with the file lock held: names other writers appended
+        with open(names_path(self.path), 'rb') as f:
+            f.seek(self.names_read)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if line.strip():
+                name = json.loads(line)
+                self.ids.setdefault(name, len(self.names))
+                self.names.append(name)
+        self.names_read += end
+
+    def intern(self, name):
+        # Called with the file lock held
+        name = name or ''
+        i = self.ids.get(name)
+        if i is None:
+            self._read_names()
+            i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+            # The name has to be on disk before a record points at it
+            line = (json.dumps(name, ensure_ascii=False) + "\n").encode('utf-8')
+            self.names_file.write(line)
+            self.names_file.flush()
+            self.names_read += len(line)
+        return i
+
+    def begin(self, uri, batter=None, kind='batter', requested=None):
+        # An open play; confirm() and finish() fill in the rest
+        return {'uri': uri, 'batter': batter, 'kind': kind, 'requested': requested or time.time(),
+                'confirmed': 0.0, 'device': '', 'backend': '', 'failure': ''}
+
+    def accepted(self, play, backend, device_id=None):
+        # For front ends that don't poll for playback: confirmed is when the
+        # play call returned (audio started, or Spotify accepted the command)
+        play['backend'] = backend or ''
+        play['device'] = device_id or ('local' if backend == 'local' else '')
+        if backend and not play['confirmed']:
+            play['confirmed'] = time.time()
+
+    def confirm(self, play, result):
+        # result is confirm_playback()'s dict
+        if result.get('ok'):
+            play['confirmed'] = play['requested'] + result['elapsed_ms'] / 1000
+            play['device'] = result.get('device_id') or 'active'
+        else:
+            play['failure'] = 'not_confirmed'
+
+    def finish(self, play, played_seconds=0.0):
+        if play.get('written'):
+            return
+        play['written'] = True
+        failure = play['failure'] if play['failure'] in FAILURES else 'other'
+        with self.lock, locked(self.path):
+            self.counts['plays'] += 1
+            if failure:
+                self.counts[failure] += 1
+            record = RECORD.pack(
+                self.intern(self.game), self.intern(self.field), self.intern(play['device']),
+                self.intern(play['batter']), self.intern(play['uri']),
+                play['requested'], play['confirmed'], int(max(0, played_seconds) * 1000),
+                FAILURES.index(failure), BACKENDS.index(play['backend'] or ''), KINDS.index(play['kind']))
+            self.file.write(record)
+            self.file.flush()
+
+    def failed(self, uri, reason, batter=None, kind='batter', requested=None):
+        play = self.begin(uri, batter, kind, requested)
+        play['failure'] = reason
+        self.finish(play)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            self.names_file.close()
+
+
+# === Reading ===
+def open_log(path):
+    # Columns straight off the disk, plus the log's names
+    # Under the writers' lock, so the header is whole and every record's names are on disk
+    with locked(path):
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f"{path} is not a play history yet")
+        magic, version, size = HEADER.unpack(header)
+        if magic != MAGIC or size != RECORD.size:
+            raise ValueError(f"{path} is not a version {VERSION} play history")
+        count = (os.path.getsize(path) - HEADER.size) // RECORD.size
+        names = read_names(path)
+    if count == 0:
+        return np.zeros(0, dtype=DTYPE), names
+    return np.memmap(path, dtype=DTYPE, mode='r', offset=HEADER.size, shape=(count,)), names
+
+
+class HistoryReader:
+    # One or more logs (e.g. every field's box for a season) queried as one.
+    # Each log has its own names file, so ids are remapped to a shared table.
+    def __init__(self, paths):
+        if np is None:
+            raise RuntimeError("play history queries need numpy (pip install numpy)")
+        self.names = []
+        ids = {}
+        parts = {column: [] for column in ('game', 'field', 'device', 'batter', 'uri')}
+        rest = []
+        for path in paths if isinstance(paths, (list, tuple)) else [paths]:
+            records, names = open_log(path)
+            remap = np.empty(max(len(names), 1), dtype=np.uint32)
+            for i, name in enumerate(names):
+                if name not in ids:
+                    ids[name] = len(self.names)
+                    self.names.append(name)
+                remap[i] = ids[name]
+            for column, out in parts.items():
+                out.append(remap[records[column]])
+            rest.append(records)
+        self.columns = {column: np.concatenate(out) if out else np.zeros(0, np.uint32)
+                        for column, out in parts.items()}
+        for column in ('requested', 'confirmed', 'played_ms', 'failure', 'backend', 'kind'):
+            self.columns[column] = np.concatenate([r[column] for r in rest]) if rest else np.zeros(0)
+
+    def __len__(self):
+        return len(self.columns['uri'])
+
+    def name(self, i):
+        return self.names[i]
+
+    def batter_song_usage(self, batter=None):
+        # {batter: {uri: plays}} for batter clips
+        c = self.columns
+        mask = c['kind'] == KINDS.index('batter')
+        if batter is not None:
+            if batter not in self.names:
+                return {}
+            mask &= c['batter'] == self.names.index(batter)
+        keys = (c['batter'][mask].astype(np.uint64) << np.uint64(32)) | c['uri'][mask]
+        keys, counts = np.unique(keys, return_counts=True)
+        usage = {}
+        for key, n in zip(keys.tolist(), counts.tolist()):
+            usage.setdefault(self.names[key >> 32], {})[self.names[key & 0xFFFFFFFF]] = n
+        return usage
+
+    def latency_percentiles(self, by='field'):
+        # Press-to-confirmed latency (ms) per field/device/game, confirmed plays only
+        c = self.columns
+        mask = c['confirmed'] > 0
+        groups = c[by][mask]
+        latency = (c['confirmed'][mask] - c['requested'][mask]) * 1000
+        # Sort by latency, then stably by group: cheaper than a lexsort
+        order = np.argsort(latency)
+        order = order[np.argsort(groups[order], kind='stable')]
+        groups, latency = groups[order], latency[order]
+        keys, starts, counts = np.unique(groups, return_index=True, return_counts=True)
+        out = {}
+        rows = {f"p{p}": latency[starts + ((counts - 1) * p // 100)] for p in PERCENTILES}
+        for i, key in enumerate(keys.tolist()):
+            out[self.names[key]] = {name: round(float(v[i]), 1) for name, v in rows.items()}
+            out[self.names[key]]['count'] = int(counts[i])
+        return out
+
+    def failure_rates(self, by='field'):
+        c = self.columns
+        groups = c[by]
+        size = len(self.names)
+        total = np.bincount(groups, minlength=size)
+        failures = {}
+        for code, reason in enumerate(FAILURES):
+            if reason:
+                failures[reason] = np.bincount(groups[c['failure'] == code], minlength=size)
+        failed = total - np.bincount(groups[c['failure'] == 0], minlength=size)
+        out = {}
+        for key in np.nonzero(total)[0].tolist():
+            out[self.names[key]] = {
+                'plays': int(total[key]), 'rate': round(float(failed[key] / total[key]), 4),
+                'reasons': {r: int(n[key]) for r, n in failures.items() if n[key]},
+            }
+        return out
+
+
+# === Benchmark ===
+def fake_season(path, plays=2_000_000, games=1500, fields=12, devices=30, batters=2000, uris=400, seed=1):
+    # Writes a season straight in the log format (much faster than finish())
+    rng = np.random.default_rng(seed)
+    names = ([f"game-{i}" for i in range(games)] + [f"Field {i}" for i in range(fields)]
+             + [f"device-{i}" for i in range(devices)] + [f"Player {i}" for i in range(batters)]
+             + [f"spotify:track:{i:022d}" for i in range(uris)])
+    base = {'game': 0, 'field': games, 'device': games + fields, 'batter': games + fields + devices,
+            'uri': games + fields + devices + batters}
+    records = np.zeros(plays, dtype=DTYPE)
+    records['game'] = base['game'] + rng.integers(0, games, plays)
+    records['field'] = base['field'] + (records['game'] - base['game']) % fields
+    records['device'] = base['device'] + rng.integers(0, devices, plays)
+    records['batter'] = base['batter'] + rng.integers(0, batters, plays)
+    records['uri'] = base['uri'] + (records['batter'] - base['batter']) * 7 % uris
+    records['requested'] = 1.7e9 + np.sort(rng.uniform(0, 1.5e7, plays))
+    failed = rng.random(plays) < 0.03
+    records['failure'] = np.where(failed, rng.integers(1, len(FAILURES), plays), 0)
+    records['confirmed'] = np.where(failed, 0, records['requested'] + rng.gamma(2.0, 0.08, plays))
+    records['played_ms'] = np.where(failed, 0, rng.integers(5000, 30000, plays))
+    records['backend'] = 1
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        records.tofile(f)
+    with open(names_path(path), 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(name) + "\n" for name in names)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query the play history")
+    parser.add_argument('query', choices=['usage', 'latency', 'failures', 'bench'])
+    parser.add_argument('--file', nargs='+', default=[HISTORY_FILE])
+    parser.add_argument('--by', choices=['field', 'device', 'game'], default='field')
+    parser.add_argument('--batter')
+    parser.add_argument('--plays', type=int, default=2_000_000, help="records in the benchmark season")
+    args = parser.parse_args()
+
+    if args.query == 'bench':
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, HISTORY_FILE)
+            fake_season(path, plays=args.plays)
+            print(f"{args.plays} plays, {os.path.getsize(path) / 1e6:.0f} MB")
+            for label, query in (('open', lambda: HistoryReader(path)),
+                                 ('usage', lambda: reader.batter_song_usage()),
+                                 ('latency by field', lambda: reader.latency_percentiles('field')),
+                                 ('latency by device', lambda: reader.latency_percentiles('device')),
+                                 ('failures by field', lambda: reader.failure_rates('field'))):
+                start = time.perf_counter()
+                result = query()
+                if label == 'open':
+                    reader = result
+                print(f"  {label:<20} {(time.perf_counter() - start) * 1000:8.1f} ms")
+            del reader
+    else:
+        reader = HistoryReader(args.file)
+        if args.query == 'usage':
+            result = reader.batter_song_usage(args.batter)
+        elif args.query == 'latency':
+            result = reader.latency_percentiles(args.by)
+        else:
+            result = reader.failure_rates(args.by)
+        print(json.dumps(result, indent=2, ensure_ascii=False))
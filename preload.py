@@ -0,0 +1,127 @@
+# preload.py
+# Keeps the on-deck batter's track queued on the device while the current
+# clip plays, so "Next Batter" is a skip the device serves from its buffer
+# instead of a cold start_playback.
+import json
+import os
+import tempfile
+import threading
+
+from file_lock import locked
+from profiling import timed
+
+URI_CACHE = "uri_cache.json"  # song name -> URI, filled ahead of games by prewarm.py
+
+_uri_cache = None
+
+
+def load_uris(filename=URI_CACHE):
+    if os.path.exists(filename):
+        with open(filename, 'r', encoding='utf-8') as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                print(f"⚠️ {filename} is invalid, ignoring it.")
+    return {}
+
+
+def remember_uris(uris, filename=URI_CACHE):
+    # Adds resolved songs to the cache file; misses aren't kept, so they get
+    # searched again. app2 workers and prewarm.py all add to it, so each one
+    # merges into what is on disk under a lock, through its own temp file.
+    with locked(filename):
+        cache = load_uris(filename)
+        cache.update({song: uri for song, uri in uris.items() if uri})
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=os.path.dirname(os.path.abspath(filename)),
+                                         prefix=os.path.basename(filename) + '.', suffix='.tmp',
+                                         delete=False) as f:
+            json.dump(cache, f, indent=2, ensure_ascii=False)
+        os.replace(f.name, filename)
+    reload_uris()
+
+
+def reload_uris():
+    global _uri_cache
+    _uri_cache = None
+
+
+@timed('search')
+def resolve_uri(sp, song_name):
+    # Song names come from the playlist, so the first search hit never changes
+    global _uri_cache
+    if _uri_cache is None:
+        _uri_cache = load_uris()
+    if song_name not in _uri_cache:
+        items = sp.search(q=song_name, type='track', limit=1)['tracks']['items']
+        _uri_cache[song_name] = items[0]['uri'] if items else None
+    return _uri_cache[song_name]
+
+
+class Preloader:
+    def __init__(self, sp, enabled=True):
+        self.sp = sp
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        # Tracks we have added to the device queue and not yet skipped to.
+        # Spotify has no "clear queue" call, so stale entries stay here until
+        # we skip past them.
+        self.queued = []
+        self.device_id = None
+
+    def play(self, uri, device_id=None, position_ms=0):
+        with self.lock:
+            if self.enabled and device_id == self.device_id and uri in self.queued:
+                skips = self.queued.index(uri) + 1
+                for _ in range(skips):
+                    self.sp.next_track(device_id=device_id)
+                del self.queued[:skips]
+                if position_ms:
+                    self.sp.seek_track(position_ms, device_id=device_id)
+                return 'preloaded'
+            if device_id != self.device_id:
+                self.queued = []
+            self.device_id = device_id
+            self.sp.start_playback(device_id=device_id, uris=[uri], position_ms=position_ms or None)
+            return 'cold'
+
+    def stage(self, uri, device_id=None):
+        with self.lock:
+            if not self.enabled or not uri:
+                return False
+            if device_id != self.device_id or (self.queued and self.queued[-1] == uri):
+                return False
+            try:
+                self.sp.add_to_queue(uri, device_id=device_id)
+            except Exception as e:
+                print(f"⚠️ Could not preload track: {e}")
+                return False
+            self.queued.append(uri)
+            return True
+
+
+# === Benchmark: press-to-audio, cold vs preloaded ===
+def measure(sp, preloader, uris, position_ms=0):
+    gaps = []
+    for i, uri in enumerate(uris):
+        press = sp.clock()
+        preloader.play(uri, position_ms=position_ms)
+        gaps.append(sp.audio_at - press)
+        preloader.stage(uris[(i + 1) % len(uris)])
+        # Let the clip play long enough for the device to buffer the next track
+        sp.sleep(sp.buffer_delay * 2)
+        sp.pause_playback()
+    return gaps
+
+
+if __name__ == '__main__':
+    from fake_spotify import FakeSpotify
+
+    batters = 9
+    for label, enabled in (("cold", False), ("preloaded", True)):
+        sp = FakeSpotify()
+        uris = [t['uri'] for t in sp.tracks[:batters]]
+        gaps = measure(sp, Preloader(sp, enabled=enabled), uris, position_ms=15000)
+        # The first press is always cold, so report the steady state
+        steady = gaps[1:]
+        print(f"{label:>10}: mean press-to-audio {1000 * sum(steady) / len(steady):7.1f} ms "
+              f"(first press {1000 * gaps[0]:.1f} ms)")
@@ -0,0 +1,235 @@
+# prewarm.py
+# Tournament-day pre-warm. SCHEDULE_FILE lists the day's games; ahead of
+# time this loads every game's roster and assignments, resolves every
+# track (the playlist first, then search), finds hook offsets and loudness
+# for the clips, cuts the walk-up windows into the clip store for offline
+# play and renders the batter announcements, so a game that goes
+# live starts with every cache hot:
+#
+#   {"games": [{"game": "field1-0900", "field": "Field 1", "start": "09:00",
+#               "assignments": "tigers.json", "roster": ["Isaac", "Courtney"]}]}
+#
+# "assignments" defaults to saved_assignments.json and "roster" to
+# roster.py. Tracks come from the league catalog (catalog.py: every team's
+# playlists, plus a game's own "playlist" if it has one), so a prewarm
+# refetches only the playlists that changed. Songs shared by several games are
+# resolved once; lookups and rendering run on a thread pool and the offset
+# and loudness analysis runs once for the whole day on the analyzers'
+# process pools.
+#
+#   python prewarm.py [schedule.json] [--workers N]
+#   python prewarm.py live <game>       (make a warmed game the live one)
+#
+# `live` hands the game to the running daemon (walkup_daemon.py), which
+# re-reads the caches and queues the leadoff clip on the device, so the
+# first "Next Batter" is served like every later one.
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from account_pool import TokenBucket
+from announce import engine, announcement_text, render
+from catalog import FederatedCatalog, load_playlists, playlist_id
+from clip_store import WINDOW_MS, ClipStore
+from hooks import HOOKS_FILE, analyze_tracks, start_offset
+from loudness import analyze_catalog, load_cache, make_job, target_volume
+from preload import load_uris, remember_uris
+from json_files import SAVE_FILE, load_json, save_json
+from walkup_daemon import connect
+
+SCHEDULE_FILE = "schedule.json"
+REPORT_FILE = "prewarm_report.json"
+PLAYLIST_ID = os.getenv("SPOTIPY_PLAYLIST_URI", "").split(":")[-1]
+WORKERS = 8             # lookups and renders in flight
+SEARCH_RATE = 5.0       # searches per second
+
+
+def progress(label):
+    def show(done, total):
+        print(f"  {label}: {done}/{total}", end='\n' if done == total else '\r', flush=True)
+    return show
+
+
+# === Games ===
+def load_schedule(path=SCHEDULE_FILE):
+    games = load_json(path, {}).get('games', [])
+    return [g for g in games if g.get('game')]
+
+
+def load_assignments(game):
+    assignments = load_json(game.get('assignments', SAVE_FILE), {})
+    roster = game.get('roster')
+    if roster is None:
+        import roster as roster_module
+        roster = roster_module.roster
+    for player in roster:
+        assignments.setdefault(player, {'batting_number': '', 'song': ''})
+    return assignments
+
+
+def game_lineup(assignments):
+    lineup = []
+    for name, info in assignments.items():
+        num = str(info.get('batting_number', '')).strip()
+        song = (info.get('song') or '').strip()
+        if num.isdigit() and song:
+            lineup.append({'name': name, 'number': int(num), 'song': song})
+    return sorted(lineup, key=lambda x: x['number'])
+
+
+# === Pre-warm ===
+def prewarm(sp, games, workers=WORKERS, rate=SEARCH_RATE):
+    start = time.perf_counter()
+    bucket = TokenBucket(rate, capacity=workers)
+    lineups = {g['game']: game_lineup(load_assignments(g)) for g in games}
+    print(f"🗓️ {len(games)} games, {sum(len(l) for l in lineups.values())} batters")
+
+    # Tracks: the league catalog (changed playlists only), then a search for
+    # whatever isn't in it
+    teams = load_playlists(default=PLAYLIST_ID)
+    for g in games:
+        if g.get('playlist'):
+            teams[g['game']] = [playlist_id(g['playlist'])]
+    catalog = FederatedCatalog(sp, teams)
+    catalog.sync()
+    in_catalog = catalog.uris()
+    known = load_uris()
+    songs = sorted({b['song'] for lineup in lineups.values() for b in lineup})
+    uris = {s: in_catalog[s] for s in songs if in_catalog.get(s)}
+    uris.update({s: known[s] for s in songs if s not in uris and known.get(s)})
+    todo = [s for s in songs if s not in uris]
+
+    def search(song):
+        bucket.acquire()
+        try:
+            items = sp.search(q=song, type='track', limit=1)['tracks']['items']
+        except Exception as e:
+            print(f"⚠️ Search failed for {song!r}: {e}")
+            return song, None
+        return song, items[0]['uri'] if items else None
+
+    show = progress("Searching")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for done, (song, uri) in enumerate(pool.map(search, todo), start=1):
+            uris[song] = uri
+            show(done, len(todo))
+    remember_uris(uris)
+    print(f"🔎 {len(songs)} songs: {len(songs) - len(todo)} already known, {len(todo)} searched")
+
+    # Offsets, then loudness over the window that will actually play
+    tracks = sorted({u for u in uris.values() if u})
+    previews = {t['uri']: t.get('preview_url') for t in catalog.tracks.values()}
+    try:
+        analyze_tracks(tracks, progress=progress("Hook offsets"))
+    except RuntimeError as e:
+        print(f"⚠️ Skipping hook offsets: {e}")
+    try:
+        analyze_catalog([make_job(u, start_ms=start_offset(u), preview_url=previews.get(u)) for u in tracks],
+                        progress=progress("Loudness"))
+    except RuntimeError as e:
+        print(f"⚠️ Skipping loudness: {e}")
+
+    # Walk-up windows for offline play, from whichever full tracks are on disk
+    store = ClipStore()
+    futures = store.fill([(u, start_offset(u), WINDOW_MS) for u in tracks])
+    show = progress("Clip windows")
+    for done, future in enumerate(futures, start=1):
+        future.result()
+        show(done, len(futures))
+    windows = {e['uri'] for e in store.entries.values()}
+    store.close()
+
+    # Announcements
+    texts = sorted({announcement_text(b) for lineup in lineups.values() for b in lineup})
+    rendered = set()
+    if engine() is None:
+        print("⚠️ No offline TTS engine found, announcements not rendered")
+    else:
+        def speak(text):
+            try:
+                render(text)
+                return text
+            except Exception as e:
+                print(f"⚠️ Could not render announcement {text!r}: {e}")
+
+        show = progress("Announcements")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for done, text in enumerate(pool.map(speak, texts), start=1):
+                if text:
+                    rendered.add(text)
+                show(done, len(texts))
+
+    # What each game will start with
+    offsets = load_cache(HOOKS_FILE)
+    report = {'t': time.time(), 'seconds': round(time.perf_counter() - start, 1), 'games': {}}
+    for game in games:
+        lineup = lineups[game['game']]
+        game_uris = [uris.get(b['song']) for b in lineup]
+        report['games'][game['game']] = {
+            'field': game.get('field'), 'start': game.get('start'), 'batters': len(lineup),
+            'missing': [b['song'] for b, u in zip(lineup, game_uris) if not u],
+            'offsets': sum(1 for u in game_uris if u and 'start_ms' in offsets.get(u, {})),
+            'volumes': sum(1 for u in game_uris if u and target_volume(u) is not None),
+            'windows': sum(1 for u in game_uris if u in windows),
+            'announcements': sum(1 for b in lineup if announcement_text(b) in rendered),
+        }
+    save_json(REPORT_FILE, report)
+    return report
+
+
+def print_report(report):
+    print(f"\n{'game':<20} {'start':<8} {'batters':>7} {'tracks':>6} {'offsets':>7} {'volumes':>7} {'clips':>5} {'voice':>5}")
+    for name, r in report['games'].items():
+        print(f"{name:<20} {str(r['start'] or ''):<8} {r['batters']:>7} {r['batters'] - len(r['missing']):>6} "
+              f"{r['offsets']:>7} {r['volumes']:>7} {r.get('windows', 0):>5} {r['announcements']:>5}")
+        for song in r['missing']:
+            print(f"  ❌ Song not found: {song}")
+    print(f"✅ Pre-warmed in {report['seconds']}s")
+
+
+# === Going live ===
+def go_live(name, schedule=SCHEDULE_FILE):
+    game = next((g for g in load_schedule(schedule) if g['game'] == name), None)
+    if not game:
+        print(f"❌ No game {name!r} in {schedule}")
+        return False
+    warmed = load_json(REPORT_FILE, {}).get('games', {})
+    if name not in warmed:
+        print(f"⚠️ {name} hasn't been pre-warmed; its first batter will start cold")
+    assignments = load_assignments(game)
+    daemon = connect()
+    if daemon:
+        reply = daemon.call('start_game', assignments=assignments, game=name)
+        daemon.close()
+        if reply.get('error'):
+            print(f"❌ {reply['error']}")
+            return False
+        print(f"🟢 {name} is live: {reply['batters']} batters, leadoff clip queued")
+        return True
+    # No daemon: the next app to start picks the game up from disk
+    from journal import GameJournal
+    save_json(SAVE_FILE, assignments)
+    journal = GameJournal()
+    journal.record('lineup_edited', assignments=assignments)
+    journal.record('batter_advanced', index=0)
+    journal.close()
+    print(f"🟢 {name} is live in {SAVE_FILE}")
+    return True
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    workers = WORKERS
+    if '--workers' in args:
+        i = args.index('--workers')
+        workers = int(args[i + 1])
+        del args[i:i + 2]
+    if args[:1] == ['live'] and len(args) >= 2:
+        sys.exit(0 if go_live(args[1], args[2] if len(args) > 2 else SCHEDULE_FILE) else 1)
+    games = load_schedule(args[0] if args else SCHEDULE_FILE)
+    if not games:
+        print(f"❌ No games in {args[0] if args else SCHEDULE_FILE}")
+        sys.exit(1)
+    from walkup_app import make_client
+    print_report(prewarm(make_client(), games, workers=workers))
@@ -0,0 +1,185 @@
+# profiling.py
+# Opt-in profiling (WALKUP_PROFILE=1). Each Flask request and each "Next
+# Batter" transition is timed as a whole and broken down into phases
+# (JSON load, build_lineup, search, start_playback...), one JSON line per
+# transition in a rotating PROFILE_LOG. A sampling profiler can be run on
+# demand and dumps collapsed stacks that flamegraph tools read.
+# When disabled, timed() and profiled() return the function unchanged and
+# span() returns a shared no-op, so the cost is nothing or one call.
+import functools
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+
+ENABLED = os.getenv("WALKUP_PROFILE") == "1"
+PROFILE_LOG = "profile.log"
+LOG_BYTES = 1_000_000
+LOG_BACKUPS = 5
+SAMPLE_INTERVAL = 0.005     # seconds between stack samples
+
+_local = threading.local()
+_logger = None
+
+
+def get_logger():
+    global _logger
+    if _logger is None:
+        _logger = logging.getLogger('walkup.profile')
+        _logger.setLevel(logging.INFO)
+        _logger.propagate = False
+        _logger.addHandler(RotatingFileHandler(PROFILE_LOG, maxBytes=LOG_BYTES, backupCount=LOG_BACKUPS))
+    return _logger
+
+
+def write_record(record):
+    get_logger().info(json.dumps(record))
+
+
+# === Spans ===
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        ms = (time.perf_counter() - self.start) * 1000
+        root = getattr(_local, 'root', None)
+        if root is None:
+            # A phase that ran outside any transition, e.g. on a worker thread
+            write_record({'transition': self.name, 'at': time.time(), 'total_ms': round(ms, 3), 'phases': {}})
+        else:
+            root['phases'][self.name] = round(root['phases'].get(self.name, 0) + ms, 3)
+        return False
+
+
+class _Transition:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.parent = getattr(_local, 'root', None)
+        self.record = {'transition': self.name, 'at': time.time(), 'phases': {}}
+        _local.root = self.record
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.record['total_ms'] = round((time.perf_counter() - self.start) * 1000, 3)
+        if exc_type:
+            self.record['error'] = exc_type.__name__
+        _local.root = self.parent
+        write_record(self.record)
+        return False
+
+
+def span(name):
+    return _Span(name) if ENABLED else NULL_SPAN
+
+
+def transition(name):
+    return _Transition(name) if ENABLED else NULL_SPAN
+
+
+def timed(name):
+    # Decorator: the call is a phase of whatever transition is running
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def profiled(name):
+    # Decorator: each call is a transition with its own breakdown
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Transition(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def profile_app(app):
+    # Times every Flask route as a transition named after its endpoint
+    if not ENABLED:
+        return
+    from flask import g, request
+
+    @app.before_request
+    def start_transition():
+        g.profile_transition = _Transition(f"{request.method} {request.endpoint}")
+        g.profile_transition.__enter__()
+
+    @app.teardown_request
+    def end_transition(exc):
+        t = g.pop('profile_transition', None)
+        if t is not None:
+            t.__exit__(type(exc) if exc else None, exc, None)
+
+
+# === Sampling profiler ===
+def sample_stacks(seconds=5.0, interval=SAMPLE_INTERVAL):
+    # Collapsed stacks ("outer;inner;leaf" -> count) across all other threads
+    me = threading.get_ident()
+    counts = Counter()
+    stop_at = time.perf_counter() + seconds
+    while time.perf_counter() < stop_at:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return counts
+
+
+def format_stacks(counts):
+    return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+
+
+def dump_stacks(seconds=5.0, path=None):
+    path = path or f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(format_stacks(sample_stacks(seconds)))
+    print(f"📈 Wrote sampling profile to {path}")
+    return path
+
+
+def install_signal_handler(sig=getattr(signal, 'SIGUSR1', None), seconds=5.0):
+    # `kill -USR1 <pid>` samples for a few seconds in the background
+    if not ENABLED or sig is None:
+        return
+    signal.signal(sig, lambda *a: threading.Thread(target=dump_stacks, args=(seconds,), daemon=True).start())
@@ -0,0 +1,122 @@
+# programs.py
+# Named music programs besides the batter walk-ups: between innings,
+# pitching change, home run and victory. Each has its own pool of songs
+# (playlist names or track URIs) and play time, and can be overridden in
+# PROGRAMS_FILE. While a game is on, a background thread keeps the next
+# pick of every program staged: URI resolved, start offset and volume
+# looked up. Triggering one is then a single start_playback through the
+# same ClipScheduler as batter clips, so an overlapping trigger preempts
+# the clip that was playing.
+import json
+import os
+import threading
+
+from hooks import start_offset
+from loudness import target_volume
+from preload import resolve_uri
+
+PROGRAMS_FILE = "programs.json"
+STAGE_INTERVAL = 60     # seconds between background re-staging passes
+
+DEFAULT_PROGRAMS = {
+    'between_innings': {'label': "Between Innings", 'duration': 90, 'songs': [
+        "Sweet Caroline – Neil Diamond", "Party Rock Anthem – LMFAO", "Shake It Off – Taylor Swift"]},
+    'pitching_change': {'label': "Pitching Change", 'duration': 60, 'songs': [
+        "Radioactive – Imagine Dragons", "Can't Stop the Feeling – Justin Timberlake"]},
+    'home_run': {'label': "Home Run", 'duration': 20, 'songs': ["Eye of the Tiger – Survivor"]},
+    'victory': {'label': "Victory", 'duration': 120, 'songs': ["Sweet Caroline – Neil Diamond"]},
+}
+
+
+def load_programs(filename=PROGRAMS_FILE):
+    programs = {name: dict(p) for name, p in DEFAULT_PROGRAMS.items()}
+    if os.path.exists(filename):
+        with open(filename, 'r', encoding='utf-8') as f:
+            try:
+                for name, p in json.load(f).items():
+                    programs.setdefault(name, {'label': name.replace('_', ' ').title(), 'duration': 60, 'songs': []})
+                    programs[name].update(p)
+            except json.JSONDecodeError:
+                print("⚠️ Programs file is invalid. Using the defaults.")
+    return programs
+
+
+class ProgramLibrary:
+    def __init__(self, sp, scheduler, programs=None, history=None):
+        self.sp = sp
+        self.scheduler = scheduler
+        self.history = history      # PlayHistory, if plays are being logged
+        self.programs = programs or load_programs()
+        self.turn = {name: 0 for name in self.programs}   # rotation through each pool
+        self.staged = {}                                   # name -> ready-to-play pick
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def _resolve(self, song):
+        return song if song.startswith('spotify:') else resolve_uri(self.sp, song)
+
+    def stage(self, name):
+        # Resolves the program's next pick so triggering costs one call
+        program = self.programs[name]
+        songs = program['songs']
+        for attempt in range(len(songs)):
+            song = songs[(self.turn[name] + attempt) % len(songs)]
+            try:
+                uri = self._resolve(song)
+            except Exception as e:
+                print(f"⚠️ Could not stage {song}: {e}")
+                uri = None
+            if uri:
+                staged = {'uri': uri, 'song': song, 'position_ms': start_offset(uri), 'volume': target_volume(uri)}
+                with self.lock:
+                    self.turn[name] = (self.turn[name] + attempt) % len(songs)
+                    self.staged[name] = staged
+                return staged
+        return None
+
+    def stage_all(self):
+        for name in self.programs:
+            if self.programs[name]['songs']:
+                self.stage(name)
+
+    def start_staging(self, interval=STAGE_INTERVAL):
+        def run():
+            while not self.stop_event.is_set():
+                self.stage_all()
+                self.stop_event.wait(interval)
+        threading.Thread(target=run, daemon=True).start()
+
+    def trigger(self, name, device_id=None):
+        if name not in self.programs:
+            raise KeyError(name)
+        with self.lock:
+            pick = self.staged.pop(name, None)
+        if pick is None:
+            # Not staged yet (or pool empty): resolve now, on the slow path
+            pick = self.stage(name)
+            with self.lock:
+                self.staged.pop(name, None)
+        if pick is None:
+            return None
+        program = self.programs[name]
+        play = self.history.begin(pick['uri'], batter=program['label'], kind='program') if self.history else None
+        try:
+            backend = self.scheduler.play(pick['uri'], program['duration'], kind='program', label=program['label'],
+                                          position_ms=pick['position_ms'], volume=pick['volume'],
+                                          device_id=device_id, play=play)
+        except Exception:
+            if play:
+                play['failure'] = 'playback_error'
+                self.history.finish(play)
+            raise
+        if play:
+            self.history.accepted(play, backend)
+        # Rotate and stage the next pick off the request path
+        with self.lock:
+            self.turn[name] = (self.turn[name] + 1) % len(program['songs'])
+        threading.Thread(target=self.stage, args=(name,), daemon=True).start()
+        return dict(pick, program=name, backend=backend)
+
+    def listing(self):
+        return [{'name': name, 'label': p['label'], 'duration': p['duration'],
+                 'staged': name in self.staged} for name, p in self.programs.items()]
@@ -0,0 +1,191 @@
+# shared_limiter.py
+# Rate limiting and response caching shared by every worker process on the
+# box, so several app2.py workers together stay under Spotify's 429 limit
+# and fetch the playlist, device list and searches once. State lives in a
+# SQLite file (WAL mode), so no outside service is needed. Each process
+# publishes its own hit rate and throttle wait time to the same file.
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from account_pool import AccountClient
+
+SHARED_DB = "walkup_shared.db"
+RATE = 5.0              # calls per second for all processes together
+BURST = 10
+CACHE_TTL = 300
+DEVICES_TTL = 5         # the device list goes stale much faster than the catalog
+SHARED_CALLS = ('playlist_tracks', 'next', 'devices', 'search', 'track')
+PUBLISH_INTERVAL = 5
+PURGE_INTERVAL = 60     # seconds between sweeps of expired cache rows
+
+
+class SharedDB:
+    def __init__(self, path=SHARED_DB):
+        self.path = path
+        self.local = threading.local()
+        with self.connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+            db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+            db.execute("CREATE TABLE IF NOT EXISTS process_stats (pid INTEGER PRIMARY KEY, stats TEXT, updated REAL)")
+
+    def connect(self):
+        # sqlite3 connections can't be shared between threads
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self.local.conn = conn
+        return conn
+
+
+class SharedTokenBucket:
+    def __init__(self, db, name='spotify', rate=RATE, capacity=BURST, sleep=time.sleep):
+        self.db = db
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.sleep = sleep
+
+    def try_acquire(self, tokens=1):
+        conn = self.db.connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (self.name,)).fetchone()
+            level = self.capacity if row is None else min(self.capacity, row[0] + (now - row[1]) * self.rate)
+            wait = 0.0
+            if level >= tokens:
+                level -= tokens
+            else:
+                wait = (tokens - level) / self.rate
+            conn.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (self.name, level, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def give_back(self, tokens=1):
+        self.db.connect().execute(
+            "UPDATE buckets SET tokens = MIN(?, tokens + ?) WHERE name = ?", (self.capacity, tokens, self.name))
+
+    def acquire(self, tokens=1):
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return waited
+            self.sleep(wait)
+            waited += wait
+
+
+class SharedCache:
+    # Same get/put interface as account_pool.ResponseCache; values are JSON
+    def __init__(self, db, ttl=CACHE_TTL):
+        self.db = db
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.purged_at = 0.0
+
+    def get(self, key):
+        row = self.db.connect().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires > ?", (key, time.time())).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value, ttl=None):
+        self.db.connect().execute(
+            "INSERT OR REPLACE INTO cache VALUES (?, ?, ?)",
+            (key, json.dumps(value), time.time() + (ttl or self.ttl)))
+        # Expired rows are only ever replaced, not read, so sweep them now and
+        # then or the table grows for the whole tournament
+        if time.monotonic() - self.purged_at > PURGE_INTERVAL:
+            self.purge()
+
+    def purge(self):
+        self.purged_at = time.monotonic()
+        self.db.connect().execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+
+
+def shared_client(sp, path=SHARED_DB, rate=RATE, burst=BURST):
+    db = SharedDB(path)
+    return AccountClient(f"pid-{os.getpid()}", sp, SharedTokenBucket(db, rate=rate, capacity=burst),
+                         SharedCache(db), cached_calls=SHARED_CALLS, ttls={'devices': DEVICES_TTL})
+
+
+def process_stats(client):
+    lookups = client.cache.hits + client.cache.misses
+    return {
+        'pid': os.getpid(),
+        'calls': client.calls,
+        'cache_hits': client.cache.hits,
+        'cache_misses': client.cache.misses,
+        'hit_rate': round(client.cache.hits / lookups, 3) if lookups else None,
+        'throttle_wait_s': round(client.waited, 3),
+    }
+
+
+def publish_stats(client):
+    client.cache.db.connect().execute(
+        "INSERT OR REPLACE INTO process_stats VALUES (?, ?, ?)",
+        (os.getpid(), json.dumps(process_stats(client)), time.time()))
+
+
+def all_stats(client, max_age=60):
+    rows = client.cache.db.connect().execute(
+        "SELECT stats FROM process_stats WHERE updated > ? ORDER BY pid", (time.time() - max_age,))
+    return [json.loads(r[0]) for r in rows]
+
+
+def start_publisher(client, interval=PUBLISH_INTERVAL):
+    def run():
+        while True:
+            try:
+                publish_stats(client)
+            except sqlite3.Error as e:
+                print(f"⚠️ Could not publish limiter stats: {e}")
+            time.sleep(interval)
+    threading.Thread(target=run, daemon=True).start()
+
+
+# === Benchmark: several workers sharing one budget ===
+def worker(path, seconds, results):
+    from fake_spotify import FakeSpotify
+
+    sp = shared_client(FakeSpotify(api_latency=0), path=path)
+    stop_at = time.time() + seconds
+    while time.time() < stop_at:
+        sp.search(q=f"Track {10 + sp.calls % 20:03d}", type='track', limit=1)
+        sp.devices()
+        sp.start_playback(uris=["spotify:track:fake000000000000000000"])
+    publish_stats(sp)
+    results.put(process_stats(sp))
+
+
+if __name__ == '__main__':
+    import multiprocessing
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, SHARED_DB)
+        SharedDB(path)
+        seconds, workers = 4, 4
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=worker, args=(path, seconds, results)) for _ in range(workers)]
+        for p in procs:
+            p.start()
+        stats = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+        total = sum(s['calls'] for s in stats)
+        for s in stats:
+            print(s)
+        print(f"{workers} workers made {total} Spotify calls in {seconds}s "
+              f"({total / seconds:.1f}/s against a shared budget of {RATE}/s + burst {BURST})")
@@ -0,0 +1,281 @@
+# soak.py
+# Soak and leak run for the playback server. Runs app2 in this process
+# against the fake Spotify client with every delay scaled down by SPEED
+# (clip length, fade-out, device buffering, API latency, confirmation
+# polls), so a 12-hour tournament's worth of batter transitions, lineup
+# saves and roster reloads goes by in minutes. A sampler records thread
+# count, RSS, open file handles and "Next Batter" latency over time; the
+# run fails if any of them is still growing after warm-up. The time series
+# is written to REPORT_FILE so releases can be compared, and what the
+# server prints goes to LOG_FILE.
+#
+#   python soak.py [--ops 40000] [--clients 2] [--speed 100] [--report soak_report.json]
+#   python soak.py --compare old_report.json new_report.json
+import contextlib
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+OPS = 40000             # requests across all clients
+CLIENTS = 2             # e.g. the web page and the Tk app pressing at once
+SPEED = 100             # how much faster than real time the clock runs
+SAMPLE_INTERVAL = 1.0   # seconds between samples
+REPORT_FILE = "soak_report.json"
+LOG_FILE = "soak.log"
+SEED = 7
+
+# What the front ends do, and how often
+MIX = (('next', 0.6), ('lineup', 0.15), ('save', 0.08), ('stop', 0.07), ('reload', 0.04),
+       ('program', 0.04), ('index', 0.02))
+
+# A metric fails when its late median exceeds early * (1 + ratio) + slack.
+# Early is 25-50% of the run (after warm-up), late is the last quarter.
+LIMITS = {'threads': (0.25, 5), 'fds': (0.25, 5), 'rss_mb': (0.2, 20), 'next_p50_ms': (1.0, 2.0),
+          'next_p99_ms': (1.0, 10.0)}
+
+
+# === Measurements ===
+def rss_mb():
+    if psutil:
+        return psutil.Process().memory_info().rss / 2 ** 20
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return None
+
+
+def open_files():
+    if os.path.isdir('/proc/self/fd'):
+        return len(os.listdir('/proc/self/fd'))
+    if psutil:
+        process = psutil.Process()
+        return process.num_handles() if hasattr(process, 'num_handles') else process.num_fds()
+    return None
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class Sampler:
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = []
+        self.lock = threading.Lock()
+        self.latencies = []     # /api/next times since the last sample, ms
+        self.ops = 0
+        self.errors = 0
+        self.start = time.monotonic()
+        self.stop_event = threading.Event()
+
+    def record(self, op, ms, ok):
+        with self.lock:
+            self.ops += 1
+            if not ok:
+                self.errors += 1
+            if op == 'next':
+                self.latencies.append(ms)
+
+    def sample(self):
+        with self.lock:
+            latencies, self.latencies = self.latencies, []
+            ops, errors = self.ops, self.errors
+        self.samples.append({
+            't': round(time.monotonic() - self.start, 2), 'ops': ops, 'errors': errors,
+            'threads': threading.active_count(), 'rss_mb': round(rss_mb() or 0, 1), 'fds': open_files(),
+            'next_p50_ms': round(percentile(latencies, 50), 2) if latencies else None,
+            'next_p99_ms': round(percentile(latencies, 99), 2) if latencies else None,
+        })
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+
+# === Setup ===
+def speed_up(app2, speed):
+    # Every delay the server waits on, divided by speed
+    import confirm
+    from fake_spotify import FakeSpotify
+    app2.MAX_PLAY_TIME /= speed
+    app2.scheduler.fade_seconds /= speed
+    confirm.FIRST_POLL /= speed
+    confirm.MAX_INTERVAL /= speed
+    fake = app2.sp
+    while not isinstance(fake, FakeSpotify):
+        fake = fake.sp
+    fake.buffer_delay /= speed
+    fake.seek_delay /= speed
+    fake.api_latency /= speed
+
+
+def start_server(workdir):
+    # app2 reads and writes its files in the working directory
+    os.chdir(workdir)
+    os.environ['WALKUP_FAKE_SPOTIFY'] = '1'
+    os.environ.setdefault('WALKUP_ANNOUNCE', '0')
+    from fake_spotify import make_catalog
+    import roster
+    songs = [f"{t['name']} – {t['artists'][0]['name']}" for t in make_catalog()]
+    with open('saved_assignments.json', 'w', encoding='utf-8') as f:
+        json.dump({name: {'batting_number': str(i + 1), 'song': songs[i]} for i, name in enumerate(roster.roster)},
+                  f, ensure_ascii=False)
+    import app2
+    return app2
+
+
+# === Driving ===
+def client_loop(app2, sampler, ops, seed):
+    rng = random.Random(seed)
+    client = app2.app.test_client()
+    names, weights = zip(*MIX)
+    for _ in range(ops):
+        op = rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            if op == 'next':
+                response = client.post('/api/next')
+            elif op == 'lineup':
+                response = client.get('/api/lineup')
+            elif op == 'index':
+                response = client.get('/')
+            elif op == 'stop':
+                response = client.post('/api/stop')
+            elif op == 'reload':
+                response = client.post('/api/reload')
+            elif op == 'program':
+                response = client.post(f"/api/program/{rng.choice(list(app2.programs.programs))}")
+            else:
+                players = list(app2.get_assignments())
+                order = rng.sample(range(1, len(players) + 1), len(players))
+                response = client.post('/api/save', json={'assignments': {
+                    p: {'batting_number': str(n), 'song': rng.choice(app2.songs)} for p, n in zip(players, order)}})
+            ok = response.status_code < 500
+        except Exception as e:
+            print(f"❌ {op} failed: {e}")
+            ok = False
+        sampler.record(op, (time.perf_counter() - start) * 1000, ok)
+
+
+# === Verdict ===
+def window(samples, key, lo, hi):
+    values = [s[key] for s in samples[int(len(samples) * lo):int(len(samples) * hi)] if s.get(key) is not None]
+    return round(statistics.median(values), 2) if values else None
+
+
+def verdict(samples):
+    out = {}
+    for key, (ratio, slack) in LIMITS.items():
+        early, late = window(samples, key, 0.25, 0.5), window(samples, key, 0.75, 1.0)
+        if early is None or late is None:
+            continue
+        limit = early * (1 + ratio) + slack
+        out[key] = {'early': early, 'late': late, 'limit': round(limit, 2), 'ok': late <= limit}
+    return out
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def say(text):
+    # The server's own output goes to LOG_FILE
+    print(text, file=sys.__stdout__, flush=True)
+
+
+def run(ops, clients, speed, workdir):
+    app2 = start_server(workdir)
+    speed_up(app2, speed)
+    sampler = Sampler()
+    sampler.sample()
+    threading.Thread(target=sampler.run, daemon=True).start()
+    say(f"🏟️ Soaking: {ops} requests from {clients} clients at {speed}x")
+    threads = [threading.Thread(target=client_loop, args=(app2, sampler, ops // clients, SEED + i))
+               for i in range(clients)]
+    for t in threads:
+        t.start()
+    while any(t.is_alive() for t in threads):
+        time.sleep(5)
+        last = sampler.samples[-1]
+        say(f"  {last['t']:7.0f}s {last['ops']:>7} ops  threads {last['threads']:>3}  rss {last['rss_mb']:6.1f} MB"
+            f"  fds {last['fds']}  next p50 {last['next_p50_ms']} ms")
+    sampler.stop_event.set()
+    sampler.sample()
+    app2.journal.close()
+    app2.history.close()
+    app2.lineup_history.close()
+    return sampler
+
+
+def soak(ops=OPS, clients=CLIENTS, speed=SPEED, report_file=REPORT_FILE):
+    cwd = os.getcwd()
+    report_file = os.path.abspath(report_file)
+    workdir = tempfile.mkdtemp(prefix="walkup-soak-")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    try:
+        with open(LOG_FILE, 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+            sampler = run(ops, clients, speed, workdir)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    checks = verdict(sampler.samples)
+    report = {
+        'commit': git_commit(), 'python': sys.version.split()[0], 'ops': sampler.ops, 'errors': sampler.errors,
+        'clients': clients, 'speed': speed, 'seconds': sampler.samples[-1]['t'],
+        'ok': all(c['ok'] for c in checks.values()) and not sampler.errors,
+        'checks': checks, 'samples': sampler.samples,
+    }
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    return report
+
+
+def print_checks(report):
+    for key, c in report['checks'].items():
+        print(f"  {'✅' if c['ok'] else '❌'} {key:<12} early {c['early']:>8}  late {c['late']:>8}  limit {c['limit']:>8}")
+    print(f"{'✅ No growth' if report['ok'] else '❌ Growth or errors'} after {report['ops']} requests "
+          f"({report['errors']} errors) in {report['seconds']:.0f}s")
+
+
+def compare(old_file, new_file):
+    with open(old_file, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_file, encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"{'':<12} {old.get('commit') or old_file:>12} {new.get('commit') or new_file:>12}")
+    for key in LIMITS:
+        before, after = old['checks'].get(key, {}).get('late'), new['checks'].get(key, {}).get('late')
+        print(f"{key:<12} {str(before):>12} {str(after):>12}")
+    print(f"{'ok':<12} {str(old['ok']):>12} {str(new['ok']):>12}")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args[:1] == ['--compare'] and len(args) == 3:
+        compare(args[1], args[2])
+        sys.exit(0)
+    opts = {'--ops': OPS, '--clients': CLIENTS, '--speed': SPEED, '--report': REPORT_FILE}
+    for i in range(0, len(args) - 1, 2):
+        if args[i] in opts:
+            opts[args[i]] = type(opts[args[i]])(args[i + 1])
+    report = soak(opts['--ops'], opts['--clients'], opts['--speed'], opts['--report'])
+    print_checks(report)
+    sys.exit(0 if report['ok'] else 1)
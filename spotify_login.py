@@ -1,30 +1,20 @@
-import os
-from dotenv import load_dotenv
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
+# spotify_login.py
+# Logs in to Spotify once (opens the browser if there is no saved token)
+# and fills the caches walkup_app.py starts from: the token, the playlist
+# catalog and the device to play on.
+from walkup_app import QuickPlay, make_client
 
-load_dotenv()
+app = QuickPlay(make_client())
 
-sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
-    client_id=os.getenv("SPOTIPY_CLIENT_ID"),
-    client_secret=os.getenv("SPOTIPY_CLIENT_SECRET"),
-    redirect_uri=os.getenv("SPOTIPY_REDIRECT_URI"),
-    scope="user-read-playback-state user-modify-playback-state"
-))
+# === Catalog ===
+app.sync_catalog(force=True)
 
-# === Search for a song ===
-results = sp.search(q="Eye of the Tiger", type="track", limit=1)
-track_uri = results['tracks']['items'][0]['uri']
-
-# === Transfer playback to active device (if needed) ===
-devices = sp.devices()
-if devices['devices']:
-    device_id = devices['devices'][0]['id']
-    sp.transfer_playback(device_id, force_play=True)
+# === Device ===
+device = app.refresh_device()
+if device:
+    print(f"🔈 Playing on {device['name']}" + ("" if device['is_active'] else " (not active yet)"))
 else:
     print("⚠️ No active Spotify devices found. Open Spotify on your phone or computer.")
-    exit()
 
-# === Start playback ===
-sp.start_playback(uris=[track_uri])
-print("Now playing: Eye of the Tiger")
+app.close()
+print("✅ Logged in. Quick play with: python walkup_app.py")
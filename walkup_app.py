@@ -1,45 +1,341 @@
+# walkup_app.py
+# Quick-play from the command line. The Spotify token (spotipy's cache),
+# the playlist catalog and the last used device are kept on disk, so a
+# cold run goes straight to one start_playback: no playlist walk, no
+# search, no devices() call and no transfer_playback unless the cached
+# device has gone away.
+#
+#   python walkup_app.py play <player> | next | stop | random   (one command)
+#   python walkup_app.py                                        (REPL, state stays warm)
+#   python walkup_app.py --timing random                        (print start-to-audio time)
+#
+# Run spotify_login.py once first to log in and fill the caches. When the
+# walk-up daemon is running (walkup_daemon.py) the commands go to it
+# instead, so the CLI moves the same batter pointer as the web and Tk apps.
+import time
+
+START = time.monotonic()
+
 import os
 import random
-from dotenv import load_dotenv
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
-
-# Load credentials
-load_dotenv()
-
-sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
-    client_id=os.getenv("SPOTIPY_CLIENT_ID"),
-    client_secret=os.getenv("SPOTIPY_CLIENT_SECRET"),
-    redirect_uri=os.getenv("SPOTIPY_REDIRECT_URI"),
-    scope="user-read-playback-state user-modify-playback-state playlist-read-private"
-))
-
-# Get playlist URI from .env
-playlist_uri = os.getenv("SPOTIPY_PLAYLIST_URI")
-
-# Extract playlist ID (strip off 'spotify:playlist:')
-playlist_id = playlist_uri.split(":")[-1]
-
-# Get all tracks in the playlist
-results = sp.playlist_tracks(playlist_id)
-tracks = results['items']
-
-# Optional: continue fetching if playlist has >100 songs
-while results['next']:
-    results = sp.next(results)
-    tracks.extend(results['items'])
-
-# Pick a random song
-track = random.choice(tracks)['track']
-track_name = track['name']
-track_uri = track['uri']
-artist = track['artists'][0]['name']
-
-# Play it
-devices = sp.devices()
-if devices['devices']:
-    sp.transfer_playback(devices['devices'][0]['id'], force_play=True)
-    sp.start_playback(uris=[track_uri])
-    print(f"🎵 Now playing: {track_name} by {artist}")
-else:
-    print("⚠️ No active devices found. Open Spotify on your phone or computer.")
+import sys
+import threading
+
+from clip_scheduler import ClipScheduler
+from hooks import start_offset
+from json_files import CATALOG_CACHE, SAVE_FILE, load_json, save_json
+from journal import GameJournal
+from local_audio import FailoverPlayer, LocalAudioBackend, SpotifyBackend
+from loudness import target_volume
+from preload import resolve_uri
+from walkup_daemon import connect
+
+DEVICE_CACHE = "device_cache.json"
+MAX_PLAY_TIME = 30  # seconds
+SCOPE = "user-read-playback-state user-modify-playback-state playlist-read-private"
+
+
+def make_client():
+    if os.getenv("WALKUP_FAKE_SPOTIFY"):
+        from fake_spotify import FakeSpotify
+        return FakeSpotify()
+    from dotenv import load_dotenv
+    import spotipy
+    from spotipy.oauth2 import SpotifyOAuth
+
+    load_dotenv()
+    # The token is read from spotipy's cache file, refreshed only when expired
+    return spotipy.Spotify(auth_manager=SpotifyOAuth(
+        client_id=os.getenv("SPOTIPY_CLIENT_ID"),
+        client_secret=os.getenv("SPOTIPY_CLIENT_SECRET"),
+        redirect_uri=os.getenv("SPOTIPY_REDIRECT_URI"),
+        scope=SCOPE
+    ))
+
+
+
+
+class QuickPlay:
+    def __init__(self, sp, playlist_id=None):
+        self.sp = sp
+        self.playlist_id = playlist_id or os.getenv("SPOTIPY_PLAYLIST_URI", "").split(":")[-1]
+        self.catalog = load_json(CATALOG_CACHE, {})
+        self.device = load_json(DEVICE_CACHE, None)
+        self.player = FailoverPlayer(SpotifyBackend(sp), LocalAudioBackend())
+        self.scheduler = ClipScheduler(self.player)
+        self._journal = None
+        self.lock = threading.Lock()
+
+    @property
+    def journal(self):
+        # Only `next` needs the batter pointer, so don't open it for the rest
+        if self._journal is None:
+            self._journal = GameJournal()
+        return self._journal
+
+    # === Catalog ===
+    def sync_catalog(self, force=False):
+        # Refetches the playlist only when its snapshot_id changed
+        if not self.playlist_id:
+            return False
+        snapshot = self.sp.playlist(self.playlist_id, fields='snapshot_id')['snapshot_id']
+        if not force and self.catalog.get('playlist') == self.playlist_id \
+                and self.catalog.get('snapshot_id') == snapshot:
+            return False
+        results = self.sp.playlist_tracks(self.playlist_id)
+        items = list(results['items'])
+        while results.get('next'):
+            results = self.sp.next(results)
+            items.extend(results['items'])
+        songs = {f"{t['track']['name']} – {t['track']['artists'][0]['name']}": t['track']['uri']
+                 for t in items if t.get('track')}
+        with self.lock:
+            self.catalog = {'playlist': self.playlist_id, 'snapshot_id': snapshot, 'songs': songs}
+            save_json(CATALOG_CACHE, self.catalog)
+        print(f"🔄 Catalog updated: {len(songs)} songs")
+        return True
+
+    def songs(self):
+        if not self.catalog.get('songs'):
+            self.sync_catalog(force=True)
+        return self.catalog.get('songs', {})
+
+    def uri_for(self, song):
+        return self.songs().get(song) or resolve_uri(self.sp, song)
+
+    # === Devices ===
+    def refresh_device(self):
+        devices = self.sp.devices()['devices']
+        device = next((d for d in devices if d['is_active']), devices[0] if devices else None)
+        self.device = {'id': device['id'], 'name': device['name'], 'is_active': device['is_active']} if device else None
+        save_json(DEVICE_CACHE, self.device)
+        return self.device
+
+    def list_devices(self):
+        return self.sp.devices()['devices']
+
+    def use_device(self, device):
+        self.device = {'id': device['id'], 'name': device['name'], 'is_active': device['is_active']}
+        save_json(DEVICE_CACHE, self.device)
+
+    # === Playback ===
+    def start(self, uri, label=None):
+        kwargs = {'label': label, 'position_ms': start_offset(uri), 'volume': target_volume(uri)}
+        device_id = self.device['id'] if self.device else None
+        try:
+            return self.scheduler.play(uri, MAX_PLAY_TIME, device_id=device_id, **kwargs)
+        except Exception as e:
+            if getattr(e, 'http_status', None) != 404:
+                raise
+        # The cached device is gone or asleep: look again, and only transfer
+        # when the one we land on isn't already active
+        device = self.refresh_device()
+        if not device:
+            raise RuntimeError("No Spotify devices found. Open Spotify on your phone or computer.")
+        if not device['is_active']:
+            self.sp.transfer_playback(device['id'], force_play=False)
+            device['is_active'] = True
+            save_json(DEVICE_CACHE, device)
+        return self.scheduler.play(uri, MAX_PLAY_TIME, device_id=device['id'], **kwargs)
+
+    def lineup(self):
+        songs = self.songs()
+        lineup = []
+        for name, info in load_json(SAVE_FILE, {}).items():
+            num = str(info.get('batting_number', '')).strip()
+            song = info.get('song', '').strip()
+            if num.isdigit() and song in songs:
+                lineup.append({'name': name, 'number': int(num), 'song': song})
+        return sorted(lineup, key=lambda x: x['number'])
+
+    def find_player(self, name):
+        assignments = load_json(SAVE_FILE, {})
+        wanted = name.strip().lower()
+        matches = [p for p in assignments if p.lower() == wanted] or \
+                  [p for p in assignments if p.lower().startswith(wanted)]
+        if len(matches) != 1:
+            return None, None
+        return matches[0], assignments[matches[0]].get('song', '')
+
+    def play_player(self, name):
+        player, song = self.find_player(name)
+        if not player:
+            print(f"❌ No single player matches {name!r}")
+            return None
+        if not song:
+            print(f"❌ {player} has no song assigned")
+            return None
+        uri = self.uri_for(song)
+        if not uri:
+            print(f"❌ Song not found: {song}")
+            return None
+        backend = self.start(uri, label=player)
+        print(f"🎵 {player}: {song}" + (" (local)" if backend == 'local' else ""))
+        return backend
+
+    def play_next(self):
+        lineup = self.lineup()
+        if not lineup:
+            print("❌ No valid lineup")
+            return None
+        index = self.journal.state['batter_index'] % len(lineup)
+        batter = lineup[index]
+        uri = self.uri_for(batter['song'])
+        if not uri:
+            print(f"❌ Song not found: {batter['song']}")
+            return None
+        backend = self.start(uri, label=batter['name'])
+        self.journal.record('clip_started', uri=uri, batter=batter['name'])
+        self.journal.record('batter_advanced', index=(index + 1) % len(lineup))
+        print(f"🎵 #{batter['number']} {batter['name']}: {batter['song']}"
+              + (" (local)" if backend == 'local' else ""))
+        return backend
+
+    def play_random(self):
+        songs = self.songs()
+        if not songs:
+            print("❌ The playlist is empty")
+            return None
+        song, uri = random.choice(list(songs.items()))
+        backend = self.start(uri, label=song)
+        print(f"🎵 Now playing: {song}" + (" (local)" if backend == 'local' else ""))
+        return backend
+
+    def stop(self):
+        self.scheduler.stop(device_id=self.device['id'] if self.device else None)
+        print("⏹️ Stopped.")
+
+    def close(self):
+        if self._journal:
+            self._journal.close()
+        self.player.fallback.close()
+
+
+def run(app, words):
+    # One command; returns the backend that started playing, if any
+    command, rest = words[0].lower(), " ".join(words[1:])
+    if command == 'play' and rest:
+        return app.play_player(rest)
+    if command == 'next':
+        return app.play_next()
+    if command == 'random':
+        return app.play_random()
+    if command == 'stop':
+        app.stop()
+    elif command == 'sync':
+        app.sync_catalog(force=True)
+    elif command == 'devices':
+        for i, d in enumerate(app.list_devices(), start=1):
+            print(f"  {i}. {d['name']}" + (" (active)" if d['is_active'] else ""))
+    elif command == 'use' and rest.isdigit():
+        devices = app.list_devices()
+        if 1 <= int(rest) <= len(devices):
+            app.use_device(devices[int(rest) - 1])
+            print(f"🔈 Using {app.device['name']}")
+    else:
+        print("Commands: play <player> | next | stop | random | sync | devices | use <n> | quit")
+    return None
+
+
+def run_remote(daemon, words):
+    # The same commands, run by the daemon; returns its answer
+    command, rest = words[0].lower(), " ".join(words[1:])
+    if command == 'play' and rest:
+        reply = daemon.call('play', name=rest)
+    elif command in ('next', 'random', 'stop', 'sync', 'devices'):
+        reply = daemon.call(command)
+    elif command == 'use' and rest.isdigit():
+        devices = daemon.call('devices').get('devices', [])
+        if not 1 <= int(rest) <= len(devices):
+            return None
+        reply = daemon.call('use_device', device_id=devices[int(rest) - 1]['id'])
+        reply['name'] = devices[int(rest) - 1]['name']
+    else:
+        print("Commands: play <player> | next | stop | random | sync | devices | use <n> | quit")
+        return None
+    if reply.get('error'):
+        print(f"❌ {reply['error']}")
+    elif command == 'play':
+        print(f"🎵 {reply['batter']}: {reply['song']}")
+    elif command == 'next':
+        print(f"🎵 {reply['batter']}")
+    elif command == 'random':
+        print(f"🎵 Now playing: {reply['song']}" + (" (local)" if reply['backend'] == 'local' else ""))
+    elif command == 'stop':
+        print("⏹️ Stopped.")
+    elif command == 'sync':
+        print(f"🔄 Catalog updated: {reply['songs']} songs")
+    elif command == 'devices':
+        for i, d in enumerate(reply['devices'], start=1):
+            print(f"  {i}. {d['name']}" + (" (active)" if d['is_active'] else ""))
+    elif command == 'use':
+        print(f"🔈 Using {reply['name']}")
+    return reply
+
+
+def report_timing(app, backend):
+    # With the fake client we know when audio actually started
+    audio_at = getattr(app.sp, 'audio_at', None) if backend == 'spotify' else None
+    ms = ((audio_at or time.monotonic()) - START) * 1000
+    print(f"⏱️ {ms:.0f} ms from start to {'audio' if audio_at or backend == 'local' else 'playback accepted'}")
+
+
+def repl(app, daemon=None):
+    if daemon is None:
+        # Catalog changes are picked up in the background, not on a keypress
+        threading.Thread(target=app.sync_catalog, daemon=True).start()
+    print("Walk-up quick play. Commands: play <player> | next | stop | random | sync | devices | use <n> | quit")
+    while True:
+        try:
+            line = input("walkup> ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            break
+        if not line:
+            continue
+        if line.lower() in ('quit', 'exit', 'q'):
+            break
+        try:
+            if daemon:
+                run_remote(daemon, line.split())
+            else:
+                run(app, line.split())
+        except Exception as e:
+            print(f"❌ {e}")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    timing = '--timing' in args
+    args = [a for a in args if a != '--timing']
+    daemon = connect()
+    if daemon:
+        try:
+            if not args:
+                repl(None, daemon)
+            else:
+                run_remote(daemon, args)
+                if timing:
+                    print(f"⏱️ {(time.monotonic() - START) * 1000:.0f} ms from start to the daemon's answer")
+        except Exception as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        finally:
+            daemon.close()
+        sys.exit(0)
+    app = QuickPlay(make_client())
+    try:
+        if not args:
+            repl(app)
+        else:
+            backend = run(app, args)
+            if backend and timing:
+                report_timing(app, backend)
+            if backend == 'local':
+                # The clip plays in this process, so stay up until it ends
+                time.sleep(MAX_PLAY_TIME)
+    except Exception as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    finally:
+        app.close()
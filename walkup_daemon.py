@@ -0,0 +1,210 @@
+# walkup_daemon.py
+# One long-lived process owns the Spotify client, the clip scheduler, the
+# caches and the game itself (batter pointer, journal, play history). The
+# web UI runs inside it; the Tk apps and the CLI send it commands over a
+# local socket instead of building their own client, so running them side
+# by side still means one batter pointer and one warm cache.
+#
+# The protocol is one JSON object per line in each direction, on a
+# connection the front end keeps open:
+#   -> {"cmd": "next", "args": {}}
+#   <- {"status": 200, "ok": true, "batter": "...", ...}
+# The commands are app2.COMMANDS. A Unix socket is used where there is one,
+# TCP on localhost otherwise.
+#
+#   python walkup_daemon.py            (daemon and web UI on :5000)
+#   python walkup_daemon.py --no-web   (daemon only)
+#   python walkup_daemon.py bench      (IPC round trip)
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+SOCKET_PATH = os.getenv("WALKUP_SOCKET", "walkup.sock")
+TCP_PORT = 5055         # where there are no Unix sockets
+CALL_TIMEOUT = 10.0     # seconds a front end waits for an answer
+
+
+class DaemonError(Exception):
+    pass
+
+
+def address():
+    if hasattr(socket, 'AF_UNIX'):
+        return socket.AF_UNIX, SOCKET_PATH
+    return socket.AF_INET, ('127.0.0.1', TCP_PORT)
+
+
+# === Server ===
+class DaemonServer:
+    def __init__(self, commands, family=None, addr=None):
+        self.commands = commands
+        default_family, default_addr = address()
+        self.family = family or default_family
+        self.addr = addr or default_addr
+        self.sock = None
+
+    def start(self):
+        if self.family == socket.AF_UNIX and os.path.exists(self.addr):
+            # Left behind by a daemon that died, unless one still answers on it
+            if connect(self.family, self.addr):
+                raise DaemonError(f"A walk-up daemon is already running on {self.addr}")
+            os.remove(self.addr)
+        self.sock = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family != socket.AF_UNIX:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(self.addr)
+        self.sock.listen()
+        threading.Thread(target=self._accept, name="daemon-accept", daemon=True).start()
+        print(f"🔌 Walk-up daemon listening on {self.addr}")
+        return self
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return  # closed
+            if self.family != socket.AF_UNIX:
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve, args=(conn,), name="daemon-client", daemon=True).start()
+
+    def _serve(self, conn):
+        # One thread per front end; its commands run in the order it sends them
+        with conn, conn.makefile('rb') as lines:
+            for line in lines:
+                try:
+                    conn.sendall(self.handle(line))
+                except OSError:
+                    return
+
+    def handle(self, line):
+        try:
+            message = json.loads(line)
+            fn = self.commands.get(message.get('cmd'))
+            if fn is None:
+                body, status = {'error': f"Unknown command {message.get('cmd')!r}"}, 404
+            else:
+                body, status = fn(**message.get('args', {}))
+        except Exception as e:
+            print(f"❌ Daemon command failed: {e}")
+            body, status = {'error': f"{type(e).__name__}: {e}"}, 500
+        return json.dumps({'status': status, **body}, default=str).encode('utf-8') + b"\n"
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            if self.family == socket.AF_UNIX and os.path.exists(self.addr):
+                os.remove(self.addr)
+
+
+# === Client ===
+class DaemonClient:
+    def __init__(self, family, addr, timeout=CALL_TIMEOUT):
+        self.family = family
+        self.addr = addr
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.sock = None
+        self.lines = None
+        self._connect()
+
+    def _connect(self):
+        self.sock = socket.socket(self.family, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        try:
+            self.sock.connect(self.addr)
+        except OSError:
+            self.sock.close()
+            self.sock = None
+            raise
+        if self.family != socket.AF_UNIX:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.lines = self.sock.makefile('rb')
+
+    def call(self, cmd, **args):
+        # Returns the daemon's answer; 'status' is an HTTP-style code
+        request = json.dumps({'cmd': cmd, 'args': args}).encode('utf-8') + b"\n"
+        with self.lock:
+            try:
+                if self.sock is None:
+                    # The daemon went away earlier; it may be back
+                    self._connect()
+                self.sock.sendall(request)
+                line = self.lines.readline()
+            except OSError as e:
+                self._drop()
+                raise DaemonError(f"Walk-up daemon unavailable: {e}") from None
+            if not line:
+                self._drop()
+                raise DaemonError("Walk-up daemon closed the connection")
+        return json.loads(line)
+
+    def _drop(self):
+        if self.sock:
+            self.lines.close()
+            self.sock.close()
+        self.sock = None
+
+    def close(self):
+        with self.lock:
+            self._drop()
+
+
+def connect(family=None, addr=None):
+    # The running daemon, or None when there isn't one
+    if family is None:
+        family, addr = address()
+    if family == socket.AF_UNIX and not os.path.exists(addr):
+        return None
+    try:
+        return DaemonClient(family, addr)
+    except OSError:
+        return None
+
+
+# === Benchmark ===
+def bench(calls=20000):
+    import tempfile
+    path = os.path.join(tempfile.mkdtemp(), "bench.sock")
+    family = socket.AF_UNIX if hasattr(socket, 'AF_UNIX') else socket.AF_INET
+    addr = path if family == socket.AF_UNIX else ('127.0.0.1', TCP_PORT + 1)
+    server = DaemonServer({'ping': lambda: ({'ok': True}, 200)}, family, addr).start()
+    targets = [('in-process ping', connect(family, addr), 'ping')]
+    running = connect()
+    if running:
+        targets.append(('running daemon', running, 'state'))
+    for name, client, cmd in targets:
+        for _ in range(200):
+            client.call(cmd)
+        times = []
+        for _ in range(calls):
+            start = time.perf_counter()
+            client.call(cmd)
+            times.append(time.perf_counter() - start)
+        times.sort()
+        print(f"  {name:<16} {cmd:<6} p50 {times[len(times) // 2] * 1e6:6.0f} µs   "
+              f"p99 {times[int(len(times) * 0.99)] * 1e6:6.0f} µs   max {times[-1] * 1e6:7.0f} µs")
+        client.close()
+    server.close()
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args[:1] == ['bench']:
+        print("Command round trips over the local socket")
+        bench()
+        sys.exit(0)
+    import app2
+    server = DaemonServer(app2.COMMANDS).start()
+    try:
+        if '--no-web' in args:
+            threading.Event().wait()
+        else:
+            app2.app.run(host='0.0.0.0', port=5000, threaded=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()